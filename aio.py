@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+#
+# Optional asyncio event loop, integrated with the Qt event loop, for non-blocking I/O.
+#
+# Normally the panels fetch with blocking requests on the GUI thread, or on a few threads. With
+# --asyncio, start() makes an asyncio loop that runs on the GUI thread, and the panels run their
+# I/O as coroutines instead: the weather forecast and the observations, the tide curve and the
+# moon image. A coroutine resumes on the GUI thread, so the results go straight into the widgets.
+# With --fetch-process too, the weather and tide coroutines wait for the worker of fetchproc.py,
+# which does the requests and the parsing, instead of parsing on the GUI thread.
+#
+# The loop is qasync's QEventLoop when qasync is installed. Without it, a QTimer runs one
+# iteration of a plain asyncio loop every few ms, polling the sockets without waiting. That timer
+# only runs while there are tasks: spawn() starts it, and it stops itself when they are all done,
+# so an idle clock does not spin.
+#
+# The HTTP client uses aiohttp when it is installed. Without it, the requests are done with
+# fetch.get() on a thread pool. Either way every request has a timeout, at most `limit` requests
+# run at a time (`per_host` per upstream host), and cancelling the coroutine cancels the request.
+# The aiohttp requests are timed, traced and recorded (--record) like those of fetch.get().
+# With the thread pool, a cancelled request is abandoned: the coroutine returns at once, and the
+# thread finishes the request within the timeout.
+#
+# On control-C, cancel_all() cancels all the tasks that are in flight, and when the app quits,
+# shutdown() lets them finish and closes the client.
+#
+import asyncio
+import time
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from qtpy.QtCore import QTimer
+
+import fetch
+import metrics
+import tracing
+
+try:
+    import qasync
+except ImportError:
+    qasync = None
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+loop = None      # The asyncio loop, when started.
+client = None    # The Client, when started.
+tasks = set()
+driver = None    # The QTimer that runs the loop, without qasync.
+DRIVER_INTERVAL = 5     # ms
+
+
+class Response:
+    """The parts of a requests.Response that the recorder of fetch.py saves, for an aiohttp response."""
+    __slots__ = ("url", "status_code", "headers", "content")
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+
+class Client:
+    """An asyncio HTTP client with a timeout per request, and limits on the concurrent requests."""
+
+    def __init__(self, limit=6, per_host=2, timeout=30., debug=0):
+        self.limit = asyncio.Semaphore(limit)
+        self.per_host = per_host
+        self.host_limits = {}
+        self.timeout = timeout
+        self.debug = debug
+        self.session = None
+        self.executor = None
+        if aiohttp is None:
+            self.executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix="aio")
+
+    async def get(self, url, params=None, headers=None):
+        """GET url, return the status and the body as bytes."""
+        host = urlsplit(url).netloc
+        host_limit = self.host_limits.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with self.limit, host_limit:
+            if self.executor is not None:
+                # fetch.get() does the metrics, the tracing and the recording.
+                resp = await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(
+                    self.executor, lambda: fetch.get(url, params=params, headers=headers, timeout=self.timeout)),
+                    self.timeout)
+                return resp.status_code, resp.content
+            with tracing.span("GET " + (urlsplit(url).hostname or ""), "http", {"url": url}):
+                start = time.perf_counter()
+                try:
+                    resp = await asyncio.wait_for(self.request(url, params, headers), self.timeout)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    metrics.observe_request(url, time.perf_counter() - start, error=True)
+                    raise
+                metrics.observe_request(url, time.perf_counter() - start, error=resp.status_code >= 400,
+                                        nbytes=len(resp.content))
+            if fetch.recorder is not None:
+                fetch.recorder.save(resp, time.perf_counter() - start)
+            return resp.status_code, resp.content
+
+    async def request(self, url, params, headers):
+        """GET url with aiohttp, return a Response."""
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        async with self.session.get(url, params=params, headers=headers) as resp:
+            return Response(str(resp.url), resp.status, resp.headers, await resp.read())
+
+    async def get_json(self, url, params=None, headers=None):
+        """GET url, return the parsed JSON. Raises an exception for an error status."""
+        import json
+        status, body = await self.get(url, params, headers)
+        if status >= 400:
+            raise IOError("HTTP {} for {}".format(status, url))
+        return json.loads(body)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_once():
+    """Run one iteration of the loop: the ready callbacks, and the sockets that are ready.
+    Stops the driver when no task is left."""
+    if loop is None or loop.is_running():     # Re-entered from a processEvents() in a coroutine.
+        return
+    loop.call_soon(loop.stop)
+    loop.run_forever()
+    if driver is not None and not tasks and not asyncio.all_tasks(loop):
+        driver.stop()
+
+
+def start(app, limit=6, per_host=2, timeout=30., debug=0):
+    """Make the asyncio loop and the client, integrated with the event loop of app."""
+    global loop, client, driver
+    if qasync is not None:
+        loop = qasync.QEventLoop(app)
+        asyncio.set_event_loop(loop)
+    else:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        driver = QTimer()
+        driver.setInterval(DRIVER_INTERVAL)
+        driver.timeout.connect(run_once)     # Started by spawn().
+    client = Client(limit, per_host, timeout, debug)
+    if debug:
+        print("asyncio loop: {}, HTTP client: {}".format("qasync" if qasync is not None else "QTimer driven",
+                                                         "aiohttp" if aiohttp is not None else "thread pool"))
+    return loop
+
+
+def exec_(app):
+    """Run the app, and the asyncio loop with it. Returns the exit code of the app."""
+    if qasync is not None and loop is not None:
+        with loop:
+            return loop.run_until_complete(qasync_quit(app))
+    return app.exec_()
+
+
+async def qasync_quit(app):
+    """Wait until the app quits (for qasync, which runs the Qt loop from the asyncio loop)."""
+    done = asyncio.Event()
+    app.aboutToQuit.connect(done.set)
+    await done.wait()
+    return 0
+
+
+def spawn(coro, name=None):
+    """Run the coroutine as a task, and keep it until it is done. Errors are printed."""
+    task = loop.create_task(coro, name=name)
+    tasks.add(task)
+    task.add_done_callback(task_done)
+    if driver is not None and not driver.isActive():
+        driver.start()
+    return task
+
+
+def task_done(task):
+    tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print("Task {} failed: {}".format(task.get_name(), task.exception()))
+
+
+def running(name):
+    """True if a task with name is in flight."""
+    return any(task.get_name() == name for task in tasks)
+
+
+def cancel_all():
+    """Cancel the tasks in flight. They finish on the next iterations of the loop."""
+    for task in list(tasks):
+        task.cancel()
+    if tasks and driver is not None and not driver.isActive():
+        driver.start()
+
+
+def shutdown():
+    """Cancel the tasks in flight, let them finish, and close the client."""
+    global loop, client, driver
+    if loop is None:
+        return
+    if driver is not None:
+        driver.stop()
+    cancel_all()
+    if not loop.is_running():
+        pending = list(tasks)
+        if client is not None:
+            pending.append(client.close())
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+    elif client is not None:
+        loop.create_task(client.close())
+    loop = client = driver = None
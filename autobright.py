@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+#
+# Automatic brightness, following the sun.
+#
+# Once a day, schedule() computes the elevation of the sun every minute of the local day for the
+# geo point, maps it to a brightness between the night and the day level (night below civil
+# twilight, day above DAY_ELEVATION, a smooth ramp in between), rounds that to steps of STEP, and
+# keeps only the times where the level changes. That is a few dozen events a day.
+#
+# AutoBrightness runs a single shot QTimer to the next event, instead of checking every second.
+# At each event it applies the scheduled level plus the manual offset of the user, who moves the
+# brightness slider to make it brighter or darker than the schedule. From bedtime until the
+# morning, the level is capped at the night level, whatever the offset. Changing the bedtime or
+# the geo point makes a new schedule; at the end of the day the next one is made.
+#
+from datetime import datetime, time, timedelta
+
+import numpy as np
+
+from qtpy.QtCore import QObject, QTimer, Slot
+
+import timesource
+
+NIGHT_ELEVATION = -6.   # Civil twilight, degrees.
+DAY_ELEVATION = 15.
+NIGHT_LEVEL = 20
+DAY_LEVEL = 200
+STEP = 8                # Brightness steps of the schedule.
+SAMPLE = 60             # Seconds between the elevations computed for the schedule.
+
+
+def solar_elevation(t, lat, lon):
+    """Elevation in degrees of the sun at UTC seconds t (scalar or array), seen from lat, lon in degrees
+    (east positive). The low precision formulas of the Astronomical Almanac, good to about 0.1 degree."""
+    days = np.asarray(t, dtype='f8')/86400. - 10957.5     # Days since J2000.0, 2000-01-01 12:00 UTC.
+    g = np.radians((357.529 + 0.98560028*days) % 360.)                  # Mean anomaly.
+    q = (280.459 + 0.98564736*days) % 360.                              # Mean longitude.
+    ecl = np.radians(q + 1.915*np.sin(g) + 0.020*np.sin(2*g))           # Ecliptic longitude.
+    eps = np.radians(23.439 - 0.00000036*days)                          # Obliquity of the ecliptic.
+    ra = np.arctan2(np.cos(eps)*np.sin(ecl), np.cos(ecl))
+    dec = np.arcsin(np.sin(eps)*np.sin(ecl))
+    gmst = (18.697374558 + 24.06570982441908*days) % 24.                # Hours.
+    hour_angle = np.radians(gmst*15. + lon) - ra
+    lat = np.radians(lat)
+    return np.degrees(np.arcsin(np.sin(lat)*np.sin(dec) + np.cos(lat)*np.cos(dec)*np.cos(hour_angle)))
+
+
+def level_for(elevation, night=NIGHT_LEVEL, day=DAY_LEVEL):
+    """The brightness for a solar elevation, with a smooth ramp through the twilight."""
+    frac = np.clip((np.asarray(elevation) - NIGHT_ELEVATION)/(DAY_ELEVATION - NIGHT_ELEVATION), 0., 1.)
+    return night + (day - night)*frac*frac*(3. - 2.*frac)
+
+
+def day_bounds(day):
+    """The UTC seconds of the start and the end of the local date day."""
+    start = datetime.combine(day, time()).astimezone()
+    end = datetime.combine(day + timedelta(days=1), time()).astimezone()
+    return start.timestamp(), end.timestamp()
+
+
+def schedule(day, lat, lon, night=NIGHT_LEVEL, day_level=DAY_LEVEL, step=STEP, sample=SAMPLE):
+    """The brightness schedule of the local date day: the times (UTC seconds) where the level changes,
+    and the levels from then on. The first time is the start of the day."""
+    start, end = day_bounds(day)
+    t = np.arange(start, end, sample)
+    levels = np.round(level_for(solar_elevation(t, lat, lon), night, day_level)/step)*step
+    levels = np.clip(levels, night, day_level).astype('i4')
+    changes = np.concatenate(([0], np.flatnonzero(np.diff(levels)) + 1))
+    return t[changes], levels[changes]
+
+
+class AutoBrightness(QObject):
+    """Apply the brightness schedule of the sun, blended with a manual offset and the bedtime."""
+
+    def __init__(self, apply, geo_point, night=NIGHT_LEVEL, day=DAY_LEVEL, debug=0):
+        """apply(level) sets the brightness, geo_point is (latitude, longitude)."""
+        super().__init__()
+        self.apply = apply
+        self.geo_point = geo_point
+        self.night = night
+        self.day_level = day
+        self.debug = debug
+        self.enabled = False
+        self.offset = 0
+        self.bedtime = None       # datetime.time
+        self.day = None           # The local date of the schedule.
+        self.day_end = 0.
+        self.times = np.zeros(0, dtype='f8')
+        self.levels = np.zeros(0, dtype='i4')
+        self.morning = 0.         # When the level starts to rise above night.
+        self.events = []
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.next_event)
+
+    def enable(self, on=True):
+        self.enabled = bool(on)
+        if self.enabled:
+            self.day = None
+            self.next_event()
+        else:
+            self.timer.stop()
+
+    def set_bedtime(self, bedtime):
+        """Set the bedtime, a QTime or a datetime.time."""
+        if hasattr(bedtime, "toPython"):
+            bedtime = bedtime.toPython()
+        self.bedtime = bedtime
+        self.day = None     # The bedtime is in the events, so make them again.
+        if self.enabled:
+            self.next_event()
+
+    def set_geo_point(self, geo_point):
+        self.geo_point = tuple(geo_point)
+        self.day = None
+        if self.enabled:
+            self.next_event()
+
+    def set_range(self, night, day):
+        self.night, self.day_level = int(night), int(day)
+        self.day = None
+        if self.enabled:
+            self.next_event()
+
+    def set_offset(self, offset):
+        self.offset = int(offset)
+        if self.enabled:
+            self.apply(self.level())
+
+    def offset_from(self, value):
+        """Set the offset so that the level now is value, for when the user moves the slider."""
+        self.offset = int(value) - self.base(timesource.time())
+
+    def make_schedule(self):
+        today = timesource.now().date()
+        self.times, self.levels = schedule(today, *self.geo_point, night=self.night, day_level=self.day_level)
+        self.day = today
+        self.day_end = day_bounds(today)[1]
+        rising = np.flatnonzero(self.levels > self.night)
+        self.morning = float(self.times[rising[0]]) if len(rising) else self.day_end
+        events = list(self.times) + [self.morning]
+        if self.bedtime is not None:
+            events.append(datetime.combine(today, self.bedtime).astimezone().timestamp())
+        self.events = sorted(set(events))
+        if self.debug:
+            print("Brightness schedule for {}: {} events, {} to {}".format(
+                today, len(self.events), int(self.levels.min()), int(self.levels.max())))
+
+    def base(self, t):
+        """The scheduled level at UTC seconds t, without the offset."""
+        if len(self.times) == 0:
+            return self.night
+        return int(self.levels[max(np.searchsorted(self.times, t, side="right") - 1, 0)])
+
+    def in_bedtime(self, t):
+        """True from bedtime until the morning."""
+        if self.bedtime is None or self.day is None:
+            return False
+        bedtime = datetime.combine(self.day, self.bedtime).astimezone().timestamp()
+        if bedtime >= self.morning:       # In the evening: from bedtime to midnight, and midnight to morning.
+            return t >= bedtime or t < self.morning
+        return bedtime <= t < self.morning
+
+    def level(self, t=None):
+        """The brightness to show at UTC seconds t, default now."""
+        if t is None:
+            t = timesource.time()
+        level = max(0, min(255, self.base(t) + self.offset))
+        if self.in_bedtime(t):
+            level = min(level, self.night)
+        return level
+
+    @Slot()
+    def next_event(self):
+        """Apply the level of now, and start the timer to the next event."""
+        if not self.enabled:
+            return
+        now = timesource.time()
+        if self.day != timesource.now().date() or now >= self.day_end:
+            self.make_schedule()
+        self.apply(self.level(now))
+        later = [t for t in self.events if t > now]
+        next_time = later[0] if later else self.day_end
+        self.timer.start(timesource.interval(int((next_time - now)*1000) + 1))
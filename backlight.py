@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+#
+# Control of the display power: the backlight brightness, and the DPMS.
+#
+# The brightness slider fires valueChanged dozens of times in one drag, and each used to open and
+# write the sysfs brightness file. Backlight keeps that file open, and writes at most every
+# min_interval ms: the first change is written at once, and the changes during the interval are
+# coalesced to the latest value, which is written when it ends.
+#
+# The DPMS used to be set with os.system("/usr/bin/xset ...") which starts a shell and xset each time.
+# Dpms talks to the X server directly with the DPMS extension of libXext, through ctypes, on one
+# connection that is kept open. When there is no X display or no libXext, it runs xset, without a shell.
+#
+# For testing on a machine without a backlight, make_fake() makes a directory with the brightness
+# and max_brightness files of a sysfs backlight, and --backlight DIR uses that instead.
+#
+import os
+import ctypes
+import ctypes.util
+import subprocess
+
+from qtpy.QtCore import QObject, QTimer, Slot
+
+SYSFS_BACKLIGHT = "/sys/class/backlight/rpi_backlight"
+MIN_INTERVAL = 100      # ms between two writes of the brightness.
+XSET = "/usr/bin/xset"
+
+DPMS_MODE_OFF = 3
+DEFAULT_BLANKING = 2
+DEFAULT_EXPOSURES = 2
+
+
+def make_fake(directory, brightness=150, max_brightness=255):
+    """Make a fake sysfs backlight in directory, and return its path."""
+    os.makedirs(directory, exist_ok=True)
+    for name, value in (("brightness", brightness), ("max_brightness", max_brightness)):
+        with open(os.path.join(directory, name), "w") as f:
+            f.write("{}\n".format(value))
+    return directory
+
+
+class Backlight(QObject):
+    """The backlight brightness, written to sysfs at a bounded rate."""
+
+    def __init__(self, path=SYSFS_BACKLIGHT, min_interval=MIN_INTERVAL, debug=0):
+        super().__init__()
+        self.path = path
+        self.debug = debug
+        self.fd = None
+        self.written = None     # The last value written.
+        self.pending = None     # The latest value asked for, not written yet.
+        self.n_writes = 0
+        # A real sysfs attribute is replaced as a whole by each write, a fake one is a plain file.
+        self.fake = not os.path.realpath(path).startswith("/sys/")
+        try:
+            self.fd = os.open(os.path.join(path, "brightness"), os.O_RDWR)
+        except OSError as e:
+            if os.path.exists(path):
+                print("Issue with opening brightness file \n", e)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(min_interval)
+        self.timer.timeout.connect(self.flush)
+
+    def available(self):
+        return self.fd is not None
+
+    def brightness(self, default=40):
+        """The current brightness, or default when there is no backlight."""
+        if self.fd is None:
+            return default
+        try:
+            return int(os.pread(self.fd, 32, 0))
+        except (OSError, ValueError) as e:
+            print("Could not read the brightness: ", e)
+            return default
+
+    def max_brightness(self, default=255):
+        try:
+            with open(os.path.join(self.path, "max_brightness")) as f:
+                return int(f.readline())
+        except (OSError, ValueError):
+            return default
+
+    @Slot(int)
+    def set_brightness(self, value):
+        """Set the brightness, now if nothing was written in the last interval, otherwise when it ends."""
+        self.pending = int(value)
+        if not self.timer.isActive():
+            self.flush()
+
+    @Slot()
+    def flush(self):
+        """Write the pending value, and start the interval in which the next ones are held."""
+        value, self.pending = self.pending, None
+        if value is None or value == self.written or self.fd is None:
+            return
+        data = "{}\n".format(value).encode()
+        try:
+            os.pwrite(self.fd, data, 0)
+            if self.fake:
+                os.ftruncate(self.fd, len(data))
+        except OSError as e:
+            print("Issue with writing the brightness \n", e)
+            return
+        self.written = value
+        self.n_writes += 1
+        if self.debug > 1:
+            print("Brightness set to {}".format(value))
+        self.timer.start()
+
+    def close(self):
+        self.timer.stop()
+        self.flush()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class Dpms:
+    """The DPMS and the screen saver of the X display, without a shell."""
+
+    def __init__(self, debug=0):
+        self.debug = debug
+        self.x11 = self.xext = self.display = None
+        if not os.getenv("DISPLAY"):
+            return
+        x11_name, xext_name = ctypes.util.find_library("X11"), ctypes.util.find_library("Xext")
+        if x11_name is None or xext_name is None:
+            return
+        try:
+            self.x11 = ctypes.CDLL(x11_name)
+            self.xext = ctypes.CDLL(xext_name)
+        except OSError:
+            return
+        self.x11.XOpenDisplay.restype = ctypes.c_void_p
+        self.x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        for func in (self.x11.XFlush, self.x11.XCloseDisplay, self.xext.DPMSCapable, self.xext.DPMSEnable):
+            func.argtypes = [ctypes.c_void_p]
+        self.x11.XSetScreenSaver.argtypes = [ctypes.c_void_p] + [ctypes.c_int]*4
+        self.xext.DPMSSetTimeouts.argtypes = [ctypes.c_void_p] + [ctypes.c_ushort]*3
+        self.xext.DPMSForceLevel.argtypes = [ctypes.c_void_p, ctypes.c_ushort]
+        display = self.x11.XOpenDisplay(None)
+        if display and self.xext.DPMSCapable(display):
+            self.display = display
+        elif display:
+            self.x11.XCloseDisplay(display)
+        if self.debug:
+            print("DPMS through {}".format("libXext" if self.display else "xset"))
+
+    def xset(self, *args):
+        """Run xset, without a shell, for when libXext cannot be used."""
+        if os.uname().sysname != "Linux" or not os.path.exists(XSET):
+            return
+        try:
+            subprocess.run([XSET] + [str(arg) for arg in args], check=False, timeout=5,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print("Could not run xset: ", e)
+
+    def setup(self, standby=28800, suspend=28800, off=36000):
+        """Enable the DPMS with these timeouts in seconds, and turn off the screen saver."""
+        if self.display is None:
+            self.xset("dpms", standby, suspend, off)
+            self.xset("s", "off")
+            return
+        self.xext.DPMSEnable(self.display)
+        self.xext.DPMSSetTimeouts(self.display, standby, suspend, off)
+        self.x11.XSetScreenSaver(self.display, 0, 0, DEFAULT_BLANKING, DEFAULT_EXPOSURES)
+        self.x11.XFlush(self.display)
+
+    def force_off(self):
+        """Turn the display off now, until the next input."""
+        if self.display is None:
+            self.xset("dpms", "force", "off")
+            return
+        self.xext.DPMSForceLevel(self.display, DPMS_MODE_OFF)
+        self.x11.XFlush(self.display)
+
+    def close(self):
+        if self.display is not None:
+            self.x11.XCloseDisplay(self.display)
+            self.display = None
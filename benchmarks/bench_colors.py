@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# Microbenchmark for coloring the temperature and pressure labels.
+#
+# Compares the old way (interpolate the hue in Python and call setStyleSheet on every update)
+# with colors.py (lookup table, and skip the style sheet when the color did not change).
+# The labels are styled with Clock.qss, like in the clock, so the re-polish cost is included.
+#
+# Run from the top directory with:
+#     QT_QPA_PLATFORM=offscreen python3 benchmarks/bench_colors.py
+#
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qtpy.QtWidgets import QApplication, QWidget, QLabel
+from qtpy.QtGui import QColor
+
+import colors
+
+
+def legacy_set_temp_color(obj, temp, inside=True, invalid=False):
+    """The set_temp_color from before colors.py, for comparison."""
+    temps = (-15., 16., 28., 40.)
+    hues = (270, 145, 60, 0)
+    if inside:
+        temps = (12., 20., 25., 32.)
+    if invalid:
+        obj.setStyleSheet("color: rgba(100,100,100,100)")
+    else:
+        if temp < temps[0]:
+            temp = temps[0] + 0.0001
+        if temp > temps[-1]:
+            temp = temps[-1] - 0.0001
+        i = 0
+        while temp > temps[i]:
+            i += 1
+        hue = int(((temp - temps[i-1])/(temps[i] - temps[i-1]))*(hues[i] - hues[i-1]) + hues[i-1])
+        color = QColor.fromHsv(hue, 255, 150, 255)
+        obj.setStyleSheet("color: rgba({},{},{},255)".format(color.red(), color.green(), color.blue()))
+
+
+def run(func, labels, values, repeat):
+    """Time func(label, value) over all labels and values, return microseconds per call."""
+    start = time.perf_counter()
+    for r in range(repeat):
+        for value in values:
+            for label in labels:
+                func(label, value, False, False)
+    return (time.perf_counter() - start)/(repeat*len(values)*len(labels))*1e6
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark the label coloring.")
+    parser.add_argument("--repeat", "-r", type=int, help="Number of repeats.", default=20)
+    parser.add_argument("--style", "-s", type=str, help="Style sheet to use.", default="Clock.qss")
+    args = parser.parse_args(sys.argv[1:])
+
+    app = QApplication(sys.argv)
+    with open(args.style) as f:
+        app.setStyleSheet(f.read())
+    top = QWidget()
+    labels = []
+    for i in range(6):
+        label = QLabel(top)
+        label.setObjectName("temp")
+        label.setText("20.5 C - 36%")
+        labels.append(label)
+    top.show()
+    app.processEvents()
+
+    # A minute by minute series: the value changes slowly, so most updates repeat the color.
+    steady = [20. + 0.01*(i//10) for i in range(100)]
+    changing = [-10. + 0.5*i for i in range(100)]
+
+    results = {
+        "legacy, steady values": run(legacy_set_temp_color, labels, steady, args.repeat),
+        "legacy, changing values": run(legacy_set_temp_color, labels, changing, args.repeat),
+        "colors.py, steady values": run(colors.set_temp_color, labels, steady, args.repeat),
+        "colors.py, changing values": run(colors.set_temp_color, labels, changing, args.repeat),
+    }
+    for name, us in results.items():
+        print("{:30s} {:8.2f} us per label update".format(name, us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+#
+# Headless benchmark suite for the clock widgets.
+#
+# Runs under the offscreen Qt platform, with all the requests going to the stand-in server of
+# fixtures.py. Pass a directory of recorded fixtures with --fixtures. The responses that are not
+# in the fixtures are synthesized by synthetic.py, so the suite also runs without any recordings.
+# HOME is pointed at a temporary directory, so the caches and the observation history of the
+# user are not touched, and every run starts from the same state.
+#
+# The results are written as JSON (--output). With --baseline, the medians are compared to an
+# earlier result file, and the exit status is 1 when something got slower than the tolerance.
+#
+# Run from the top directory with:
+#     python3 benchmarks/bench_suite.py --output bench.json
+#     python3 benchmarks/bench_suite.py --baseline bench.json
+#
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+TOP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, TOP)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# A fixed date, so the moon image number and the requests are the same on every run.
+MOON_DATE = datetime(2025, 6, 15, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def measure(func, repeat, warmup=1):
+    """Call func warmup + repeat times, return the timings in ms of the last repeat."""
+    for i in range(warmup):
+        func()
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start)*1000)
+    return times
+
+
+def summarize(times):
+    return {
+        "median_ms": statistics.median(times),
+        "min_ms": min(times),
+        "mean_ms": statistics.fmean(times),
+        "stdev_ms": statistics.stdev(times) if len(times) > 1 else 0.,
+        "n": len(times),
+    }
+
+
+def cold_start_child():
+    """Start the clock, and print the time of the first paint of the analog clock."""
+    from qtpy.QtWidgets import QApplication
+    from qtpy.QtCore import QObject, QEvent, QTimer
+    app = QApplication(sys.argv)
+    from clock_widget import Clock_widget
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and not hasattr(self, "time"):
+                self.time = time.time()
+                QTimer.singleShot(0, app.quit)
+            return False
+
+    clock = Clock_widget(False)
+    first_paint = FirstPaint()
+    clock.analog.installEventFilter(first_paint)
+    clock.show()
+    app.exec_()
+    print(json.dumps({"first_paint": first_paint.time}))
+
+
+def cold_start(repeat, env):
+    """Time from starting the process to the first paint of the analog clock, in ms."""
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--cold-start-child"], env=env, cwd=TOP,
+                             capture_output=True, text=True, timeout=120).stdout
+        line = [ln for ln in out.splitlines() if ln.startswith("{")][-1]
+        times.append((json.loads(line)["first_paint"] - start)*1000)
+    return times
+
+
+def run_suite(args, server):
+    from qtpy.QtWidgets import QApplication, QLabel
+    from qtpy.QtGui import QPixmap
+    app = QApplication(sys.argv)
+
+    import colors
+    import tides
+    import numpy as np
+    from models import Forecast
+    from synthetic import synthetic_forecast
+    from moon import QMoon
+    from clock_widget import Clock_widget, AnalogClock
+
+    scale = args.repeat_scale
+    results = {}
+
+    def bench(name, func, repeat, warmup=1):
+        if args.only and not any(sel in name for sel in args.only):
+            return
+        results[name] = summarize(measure(func, max(int(repeat*scale), 2), warmup))
+        print("{:32s} {:10.3f} ms median".format(name, results[name]["median_ms"]))
+
+    # Paint the analog clock at a few sizes.
+    for size in (120, 350, 700):
+        analog = AnalogClock(None)
+        analog.resize(size, size)
+        pix = QPixmap(size, size)
+        bench("analog_clock_paint_{}".format(size), lambda w=analog, p=pix: w.render(p), 50)
+
+    # The color helpers, steady (no style sheet change) and changing.
+    label = QLabel()
+    label.setObjectName("temp")
+    label.setStyleSheet("")
+    label.show()
+    counter = iter(range(10**9))
+    bench("colors_temp_steady", lambda: colors.set_temp_color(label, 20.5, False, False), 1000)
+    bench("colors_temp_changing", lambda: colors.set_temp_color(label, -10. + (next(counter) % 100)*0.5,
+                                                                False, False), 300)
+
+    # Fill the tide cache, so the update only measures the lookup and the display.
+    t = tides.Tides()
+    cache = t.get_cache("portland")
+    now = time.time()
+    n = 800
+    cache.data = np.zeros(n, dtype=tides.HILO_DTYPE)
+    cache.data['t'] = (now - 10*24*3600 + np.arange(n)*6.2*3600).astype(np.int64)
+    cache.data['v'] = np.where(np.arange(n) % 2 == 0, 2.9, 0.1)
+    cache.data['type'] = np.where(np.arange(n) % 2 == 0, b"H", b"L")
+    cache.covered = (int(now - 10*24*3600), int(now + 365*24*3600))
+    cache.save()
+
+    clock = Clock_widget(False)
+    clock.show()
+    app.processEvents()
+
+    bench("clock_update_tick", clock.update, 50)
+
+    def tides_update():
+        done = []
+        clock.hilo.fetcher.station_ready.connect(done.append)
+        clock.hilo.update()
+        while not done:
+            app.processEvents()
+        clock.hilo.fetcher.station_ready.disconnect(done.append)
+    bench("hilo_tide_update", tides_update, 20)
+
+    weather = clock.weather
+    weather.fc = Forecast(synthetic_forecast(16))
+    weather.fc_time = weather.fc.update_time.astimezone(weather.time_zone)
+    weather.fc_hourly = Forecast(synthetic_forecast(156, hours=1))
+    bench("weather_update_info", weather.update_weather_info, 10)
+
+    for size in (216, 1080, 2160):
+        moon = QMoon(size=size, date=MOON_DATE, web=True)
+        bench("moon_image_{}".format(size), moon.get_moon_image, 3 if size > 216 else 10)
+
+    if not args.only or any(sel in "cold_start_first_paint" for sel in args.only):
+        env = dict(os.environ)
+        env["QT_CLOCK_BASE_URL"] = server.base
+        results["cold_start_first_paint"] = summarize(cold_start(max(int(3*scale), 2), env))
+        print("{:32s} {:10.3f} ms median".format("cold_start_first_paint", results["cold_start_first_paint"]["median_ms"]))
+
+    clock.weather.history.close()
+    return results
+
+
+def compare(results, baseline, tolerance, min_diff):
+    """Print the comparison with the baseline, return the names that got slower."""
+    regressions = []
+    print("\n{:32s} {:>10s} {:>10s} {:>7s}".format("benchmark", "median", "baseline", "ratio"))
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print("{:32s} {:10.3f} {:>10s}".format(name, res["median_ms"], "-"))
+            continue
+        ratio = res["median_ms"]/base["median_ms"] if base["median_ms"] > 0 else float("inf")
+        slower = ratio > 1 + tolerance and res["median_ms"] - base["median_ms"] > min_diff
+        if slower:
+            regressions.append(name)
+        print("{:32s} {:10.3f} {:10.3f} {:7.2f}{}".format(name, res["median_ms"], base["median_ms"], ratio,
+                                                          "  REGRESSION" if slower else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser("Headless benchmarks for the clock widgets.")
+    parser.add_argument("--fixtures", "-f", type=str, default=None, help="Directory with recorded fixtures.")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", "-b", type=str, default=None, help="Compare to the results in this file.")
+    parser.add_argument("--tolerance", "-t", type=float, default=0.2, help="Allowed slowdown, as a fraction.")
+    parser.add_argument("--min-diff", type=float, default=0.05, help="Ignore slowdowns smaller than this, in ms.")
+    parser.add_argument("--repeat-scale", "-r", type=float, default=1., help="Scale the number of repeats.")
+    parser.add_argument("--only", nargs="*", default=None, help="Only run benchmarks with these in the name.")
+    parser.add_argument("--cold-start-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(sys.argv[1:])
+
+    os.chdir(TOP)   # The icons and the style sheet are found relative to the top directory.
+    if args.cold_start_child:
+        cold_start_child()
+        return
+
+    home = tempfile.mkdtemp(prefix="qt_clock_bench_")
+    os.environ["HOME"] = home
+
+    import fetch
+    import fixtures
+    from synthetic import SyntheticFixtures
+    recorded = fixtures.load_fixtures(args.fixtures) if args.fixtures else {}
+    server = fixtures.StandInServer(SyntheticFixtures(recorded), ("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    fetch.BASE_URL = server.base
+
+    results = run_suite(args, server)
+    server.shutdown()
+
+    report = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "host": platform.node(),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "qt_platform": os.environ.get("QT_QPA_PLATFORM"),
+            "fixtures": args.fixtures,
+            "n_fixtures": len(recorded),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance, args.min_diff)
+        if regressions:
+            print("\n{} regression(s): {}".format(len(regressions), ", ".join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
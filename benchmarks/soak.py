@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+#
+# Soak test: run the whole clock for a long simulated time, and watch the memory.
+#
+# The clock runs under the offscreen Qt platform against the stand-in server of fixtures.py with
+# the synthesized responses of synthetic.py, and the time of timesource.py runs --rate times
+# faster than real time. So the moon image is swapped every simulated hour, and the forecasts,
+# the observations and the tides are refreshed as they would be over --days days.
+#
+# Every --sample simulated hours, the resident memory, the number of Qt objects and widgets, and
+# the number and size of the live QPixmaps and QImages are written as a JSON line to --output.
+# At the end, the growth per simulated day over the second half of the run (after the caches have
+# filled) is printed, and the exit status is 1 when it is over the limits.
+#
+# The once a second clock tick cannot run faster than every ms, so above --rate 1000 it falls
+# behind the simulated time, see timesource.py. The default runs 30 days in about 20 minutes.
+#
+# Run from the top directory with:
+#     python3 benchmarks/soak.py --days 30 --output soak.jsonl
+#
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+TOP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, TOP)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def pixmap_stats():
+    """Number and bytes of the live QPixmap and QImage objects held from Python."""
+    from qtpy.QtGui import QPixmap, QImage
+    stats = {"pixmaps": 0, "pixmap_bytes": 0, "images": 0, "image_bytes": 0}
+    for obj in gc.get_objects():
+        if isinstance(obj, QPixmap):
+            stats["pixmaps"] += 1
+            stats["pixmap_bytes"] += obj.width()*obj.height()*obj.depth()//8
+        elif isinstance(obj, QImage):
+            stats["images"] += 1
+            stats["image_bytes"] += obj.sizeInBytes()
+    return stats
+
+
+def sample(app, clock, start_real):
+    """One sample of the memory use."""
+    import metrics
+    import timesource
+    from qtpy.QtCore import QObject
+    record = {
+        "sim_time": timesource.utcnow().isoformat(timespec="seconds"),
+        "sim_days": (timesource.time() - timesource.start_time)/86400,
+        "real_s": time.monotonic() - start_real,
+        "rss": metrics.rss(),
+        "qobjects": len(clock.findChildren(QObject)),
+        "widgets": len(app.allWidgets()),
+        "python_objects": len(gc.get_objects()),
+    }
+    record.update(pixmap_stats())
+    return record
+
+
+def growth(samples, key):
+    """Least squares slope of key per simulated day, over the second half of the samples."""
+    half = samples[len(samples)//2:]
+    if len(half) < 2:
+        return 0.
+    xs = [s["sim_days"] for s in half]
+    ys = [s[key] for s in half]
+    mx = sum(xs)/len(xs)
+    my = sum(ys)/len(ys)
+    sxx = sum((x - mx)**2 for x in xs)
+    return sum((x - mx)*(y - my) for x, y in zip(xs, ys))/sxx if sxx > 0 else 0.
+
+
+def run(args):
+    from qtpy.QtWidgets import QApplication
+    from qtpy.QtCore import QTimer
+    app = QApplication(sys.argv)
+
+    import timesource
+    from clock_widget import Clock_widget
+
+    start = datetime.fromisoformat(args.start) if args.start else datetime.now(timezone.utc)
+    timesource.simulate(start, args.rate)
+    end_time = timesource.time() + args.days*86400
+    start_real = time.monotonic()
+
+    clock = Clock_widget(False, web=True, debug=args.debug)
+    clock.show()
+
+    samples = []
+    output = open(args.output, "w") if args.output else None
+
+    def take_sample():
+        gc.collect()
+        record = sample(app, clock, start_real)
+        samples.append(record)
+        if output is not None:
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+        print("{} day {:5.1f}  rss {:7.1f} MB  qobjects {:5d}  widgets {:4d}  pixmaps {:3d} ({:6.1f} MB)"
+              "  images {:3d} ({:6.1f} MB)".format(
+                record["sim_time"], record["sim_days"], record["rss"]/2**20, record["qobjects"],
+                record["widgets"], record["pixmaps"], record["pixmap_bytes"]/2**20,
+                record["images"], record["image_bytes"]/2**20))
+        if timesource.time() >= end_time:
+            app.quit()
+
+    timer = QTimer()
+    timer.timeout.connect(take_sample)
+    timer.start(timesource.interval(int(args.sample*3600*1000)))
+    QTimer.singleShot(0, take_sample)
+    app.exec_()
+
+    clock.weather.history.close()
+    if output is not None:
+        output.close()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser("Soak test of the clock in accelerated time.")
+    parser.add_argument("--days", type=float, default=30., help="Simulated days to run.")
+    parser.add_argument("--rate", type=float, default=2000., help="Simulated seconds per real second.")
+    parser.add_argument("--start", type=str, default=None, help="Simulated start time (ISO), default now.")
+    parser.add_argument("--sample", type=float, default=6., help="Sample every this many simulated hours.")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the samples as JSON lines to this file.")
+    parser.add_argument("--fixtures", "-f", type=str, default=None, help="Directory with recorded fixtures.")
+    parser.add_argument("--rss-limit", type=float, default=1., help="Allowed RSS growth in MB per simulated day.")
+    parser.add_argument("--object-limit", type=float, default=1.,
+                        help="Allowed growth of Qt objects and pixmaps per simulated day.")
+    parser.add_argument("--debug", "-d", action="count", default=0, help="Debug level of the clock.")
+    args = parser.parse_args(sys.argv[1:])
+
+    os.chdir(TOP)   # The icons and the style sheet are found relative to the top directory.
+    home = tempfile.mkdtemp(prefix="qt_clock_soak_")
+    os.environ["HOME"] = home
+
+    import fetch
+    import fixtures
+    from synthetic import SyntheticFixtures
+    recorded = fixtures.load_fixtures(args.fixtures) if args.fixtures else {}
+    server = fixtures.StandInServer(SyntheticFixtures(recorded), ("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    fetch.BASE_URL = server.base
+
+    samples = run(args)
+    server.shutdown()
+
+    print("\nGrowth per simulated day over the second half, {} requests served:".format(server.requests))
+    leaks = []
+    for key, scale, unit, limit in (("rss", 2**20, "MB", args.rss_limit),
+                                    ("qobjects", 1, "", args.object_limit),
+                                    ("widgets", 1, "", args.object_limit),
+                                    ("pixmaps", 1, "", args.object_limit),
+                                    ("images", 1, "", args.object_limit)):
+        slope = growth(samples, key)/scale
+        leak = slope > limit
+        if leak:
+            leaks.append(key)
+        print("{:10s} {:+10.3f} {:2s}{}".format(key, slope, unit, "  LEAK" if leak else ""))
+    if leaks:
+        print("\nPossible leak(s): {}".format(", ".join(leaks)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
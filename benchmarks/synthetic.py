@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+#
+# Made up responses of the upstream services, for the benchmarks and the soak test.
+#
+# SyntheticFixtures is a fixture dict for the stand-in server of fixtures.py. A request that is
+# not in the recorded fixtures is answered with a synthesized response: the moon images and the
+# weather icons are made once and kept, the weather.gov JSON and the NOAA tides are made per
+# request around the current time of timesource.py, so they follow the simulated time of the
+# soak test and never go stale. The URLs in them go through fetch.upstream_url(), so the server
+# must run in the same process, with fetch.BASE_URL set to it.
+#
+import json
+import math
+import threading
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urlsplit, parse_qsl
+
+import fetch
+import timesource
+from fixtures import Fixture
+
+CONDITIONS = ("skc", "few", "bkn", "rain", "snow", "tsra")
+TIDE_PERIOD = 12.42*3600    # Seconds, the M2 tide.
+
+
+def synthetic_forecast(n_periods, hours=12, start=None):
+    """A forecast properties dict with n_periods periods, for models.Forecast."""
+    if start is None:
+        start = timesource.utcnow().replace(minute=0, second=0, microsecond=0)
+    periods = []
+    for i in range(n_periods):
+        t = start + timedelta(hours=i*hours)
+        condition = CONDITIONS[i % len(CONDITIONS)]
+        periods.append({
+            "number": i + 1, "name": "Period {}".format(i + 1),
+            "startTime": t.isoformat(), "endTime": (t + timedelta(hours=hours)).isoformat(),
+            "isDaytime": i % 2 == 0, "temperature": 10 + i % 15, "temperatureUnit": "C",
+            "probabilityOfPrecipitation": {"unitCode": "wmoUnit:percent", "value": (i*7) % 100},
+            "windSpeed": "5 to 10 mph", "windDirection": "NW",
+            "icon": fetch.upstream_url("https://api.weather.gov/icons/land/{}/{}?size=medium".format(
+                "day" if i % 2 == 0 else "night", condition)),
+            "shortForecast": condition, "detailedForecast": "A synthetic forecast, period {}.".format(i + 1)})
+    return {"updateTime": start.isoformat(), "periods": periods}
+
+
+def synthetic_grid(start, hours=7*24):
+    """A forecastGridData properties dict, hourly values for hours from start."""
+    props = {"updateTime": start.isoformat(),
+             "validTimes": "{}/PT{}H".format(start.isoformat(), hours)}
+    for layer, uom, base, amplitude in (("temperature", "wmoUnit:degC", 10., 8.),
+                                        ("dewpoint", "wmoUnit:degC", 4., 3.),
+                                        ("windSpeed", "wmoUnit:km_h-1", 12., 10.),
+                                        ("windDirection", "wmoUnit:degree_(angle)", 180., 90.),
+                                        ("windGust", "wmoUnit:km_h-1", 20., 10.),
+                                        ("skyCover", "wmoUnit:percent", 50., 50.),
+                                        ("probabilityOfPrecipitation", "wmoUnit:percent", 30., 30.)):
+        values = [{"validTime": "{}/PT1H".format((start + timedelta(hours=h)).isoformat()),
+                   "value": round(base + amplitude*math.sin(2*math.pi*h/24), 1)} for h in range(hours)]
+        props[layer] = {"uom": uom, "values": values}
+    return props
+
+
+def synthetic_observation(station_url, now):
+    """The properties of a latest observation at now."""
+    hour = now.hour + now.minute/60
+    return {
+        "station": station_url, "timestamp": now.replace(second=0, microsecond=0).isoformat(),
+        "textDescription": "Partly Cloudy",
+        "icon": fetch.upstream_url("https://api.weather.gov/icons/land/day/few?size=medium"),
+        "temperature": {"unitCode": "wmoUnit:degC", "value": round(10 + 8*math.sin(2*math.pi*(hour - 9)/24), 1)},
+        "dewpoint": {"unitCode": "wmoUnit:degC", "value": 4.},
+        "seaLevelPressure": {"unitCode": "wmoUnit:Pa", "value": 101325 + 500*math.sin(now.timestamp()/86400)},
+        "relativeHumidity": {"unitCode": "wmoUnit:percent", "value": 65.},
+        "windSpeed": {"unitCode": "wmoUnit:km_h-1", "value": 11.},
+        "windDirection": {"unitCode": "wmoUnit:degree_(angle)", "value": 300.},
+    }
+
+
+def tide_height(t):
+    return 1.5 + 1.4*math.cos(2*math.pi*t/TIDE_PERIOD)
+
+
+def synthetic_tides(query, now):
+    """The NOAA datagetter JSON for the query: hilo or 6 minute predictions, or water_level up to now."""
+    tz = timezone.utc if query.get("time_zone", "gmt") == "gmt" else datetime.now().astimezone().tzinfo
+    begin = datetime.strptime(query["begin_date"], "%Y%m%d %H:%M").replace(tzinfo=tz).timestamp()
+    end = datetime.strptime(query["end_date"], "%Y%m%d %H:%M").replace(tzinfo=tz).timestamp()
+
+    def fmt(t):
+        return datetime.fromtimestamp(t, tz).strftime("%Y-%m-%d %H:%M")
+
+    if query.get("interval") == "hilo":
+        events = []
+        k = math.ceil(begin/(TIDE_PERIOD/2))
+        while k*TIDE_PERIOD/2 <= end:
+            t = k*TIDE_PERIOD/2
+            events.append({"t": fmt(t), "v": "{:.3f}".format(tide_height(t)), "type": "H" if k % 2 == 0 else "L"})
+            k += 1
+        return {"predictions": events}
+    step = 360
+    t = math.ceil(begin/step)*step
+    values = []
+    if query.get("product") == "water_level":
+        end = min(end, now)
+    while t <= end:
+        values.append({"t": fmt(t), "v": "{:.3f}".format(tide_height(t))})
+        t += step
+    return {"data": values} if query.get("product") == "water_level" else {"predictions": values}
+
+
+class SyntheticFixtures(dict):
+    """The recorded fixtures, plus made up responses for the requests that are not."""
+
+    def __init__(self, fixtures):
+        super(SyntheticFixtures, self).__init__(fixtures)
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        fixture = super(SyntheticFixtures, self).get(key)
+        if fixture is not None:
+            return fixture
+        fixture = self.synthesize_json(key)
+        if fixture is not None:
+            return fixture
+        with self.lock:
+            fixture = super(SyntheticFixtures, self).get(key)
+            if fixture is None:
+                fixture = self.synthesize_image(key)
+                if fixture is not None:
+                    self[key] = fixture
+        return fixture if fixture is not None else default
+
+    @staticmethod
+    def synthesize_json(key):
+        """A weather.gov or NOAA response for key, made around timesource.utcnow(), or None."""
+        parts = urlsplit("https://" + key)
+        query = dict(parse_qsl(parts.query))
+        path = parts.path.rstrip("/")
+        now = timesource.utcnow()
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        if parts.netloc == "tidesandcurrents.noaa.gov" and path == "/api/datagetter":
+            js = synthetic_tides(query, now.timestamp())
+        elif parts.netloc != "api.weather.gov":
+            return None
+        elif path.startswith("/points/"):
+            grid = fetch.upstream_url("https://api.weather.gov/gridpoints/GYX/50,50")
+            js = {"properties": {"forecast": grid + "/forecast", "forecastHourly": grid + "/forecast/hourly",
+                                 "forecastGridData": grid,
+                                 "observationStations": grid + "/stations"}}
+        elif path.endswith("/forecast"):
+            js = {"properties": synthetic_forecast(14, start=hour)}
+        elif path.endswith("/forecast/hourly"):
+            js = {"properties": synthetic_forecast(156, hours=1, start=hour)}
+        elif path.endswith("/stations"):
+            js = {"features": [{"id": fetch.upstream_url("https://api.weather.gov/stations/KSYN")}]}
+        elif path.endswith("/observations/latest"):
+            js = {"properties": synthetic_observation("https://api.weather.gov/stations/KSYN", now)}
+        elif path.startswith("/gridpoints/"):
+            js = {"properties": synthetic_grid(hour)}
+        else:
+            return None
+        meta = {"key": key, "status": 200, "headers": {"Content-Type": "application/geo+json"}, "elapsed": 0.}
+        return Fixture(meta, json.dumps(js).encode())
+
+    @staticmethod
+    def synthesize_image(key):
+        """A moon image or a weather icon for key, or None."""
+        from qtpy.QtGui import QImage, QColor
+        from qtpy.QtCore import QBuffer, QByteArray, QIODevice
+
+        if key.startswith("svs.gsfc.nasa.gov/") and key.endswith((".jpg", ".tif")):
+            width, height = (216, 216)
+            for size in ((3840, 2160), (5760, 3240)):
+                if "{}x{}".format(*size) in key:
+                    width, height = size
+            fmt, mime = ("JPG", "image/jpeg") if key.endswith(".jpg") else ("TIFF", "image/tiff")
+        elif key.startswith("api.weather.gov/icons/"):
+            width, height, fmt, mime = 86, 86, "PNG", "image/png"
+        else:
+            return None
+        image = QImage(width, height, QImage.Format_RGB32)
+        image.fill(QColor(40, 40, 40))
+        data = QByteArray()
+        buf = QBuffer(data)
+        buf.open(QIODevice.WriteOnly)
+        image.save(buf, fmt)
+        buf.close()
+        meta = {"key": key, "status": 200, "headers": {"Content-Type": mime}, "elapsed": 0.}
+        return Fixture(meta, bytes(data))
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+#
+# History chart for the observations on the Weather tab.
+#
+# A year of one minute samples is ~500k points, while the chart is only a few hundred pixels
+# wide. The samples are therefore reduced to the min and max per pixel column, which keeps the
+# peaks that a plain subsampling would lose. The columns are on a fixed time grid, so when a
+# new sample comes in only the last column changes, and the reduced data can be extended
+# instead of recomputed. The painter path is cached per (range, width, quantity) and only
+# rebuilt when the columns changed.
+#
+# For the year range the columns are filled from the hourly rollups of the history store,
+# which already have the min and max, rather than from the raw samples.
+#
+import time
+import numpy as np
+
+from qtpy.QtWidgets import QWidget, QPushButton
+from qtpy.QtGui import QColor, QPainter, QPainterPath, QPen, QFont
+from qtpy.QtCore import Qt, Slot, QPointF, QRectF
+
+import metrics
+import tracing
+import timesource
+
+CHART_RANGES = {"day": 24*3600, "week": 7*24*3600, "year": 365*24*3600}
+CHART_QUANTITIES = {
+    # Column in the history, scale factor, unit, color.
+    "temp": ("temp", 1., "C", QColor(200, 100, 0)),
+    "humidity": ("humidity", 1., "%", QColor(0, 150, 200)),
+    "pressure": ("pressure", 0.01, "mbar", QColor(150, 0, 200)),
+}
+
+
+def minmax_columns(t, y, dt):
+    """Reduce the samples (t sorted) to the min and max per column of width dt on the absolute grid
+    t // dt. Returns the column indexes, min and max. NaN values are skipped."""
+    good = np.isfinite(y)
+    t = t[good]
+    y = y[good]
+    if len(t) == 0:
+        return np.zeros(0, dtype='i8'), np.zeros(0), np.zeros(0)
+    cols = np.floor(t/dt).astype('i8')
+    uniq, start = np.unique(cols, return_index=True)
+    return uniq, np.minimum.reduceat(y, start), np.maximum.reduceat(y, start)
+
+
+class MinMaxColumns:
+    """The min and max of a series per pixel column, for a chart of span seconds and width columns.
+    The columns can be extended with new samples."""
+
+    def __init__(self, span, width):
+        self.span = span
+        self.width = width
+        self.dt = span/width
+        self.first = None          # Absolute column index of ymin[0]
+        self.ymin = np.zeros(0)
+        self.ymax = np.zeros(0)
+        self.t_last = -np.inf      # Time of the last sample added.
+        self.version = 0           # Incremented when the columns change.
+
+    def add(self, t, ymin, ymax=None):
+        """Add samples, or pre-reduced buckets with their min and max, sorted by time.
+        Samples at or before the last one added are ignored."""
+        if ymax is None:
+            ymax = ymin
+        new = t > self.t_last
+        if not np.any(new):
+            return
+        t, ymin, ymax = t[new], ymin[new], ymax[new]
+        self.t_last = float(t[-1])
+        cols, cmin, _ = minmax_columns(t, ymin, self.dt)
+        cols_max, _, cmax = minmax_columns(t, ymax, self.dt)
+        if len(cols) == 0:
+            return
+        if self.first is None:
+            self.first = int(cols[0])
+        last = self.first + len(self.ymin) - 1
+        if cols[-1] > last:
+            pad = np.full(int(cols[-1] - last), np.nan)
+            self.ymin = np.concatenate((self.ymin, pad))
+            self.ymax = np.concatenate((self.ymax, pad))
+        idx = cols - self.first
+        self.ymin[idx] = np.fmin(self.ymin[idx], cmin)
+        idx = cols_max - self.first
+        self.ymax[idx] = np.fmax(self.ymax[idx], cmax)
+        self.trim()
+        self.version += 1
+
+    def trim(self):
+        """Drop the columns that have scrolled off the chart."""
+        extra = len(self.ymin) - self.width
+        if extra > 0:
+            self.ymin = self.ymin[extra:]
+            self.ymax = self.ymax[extra:]
+            self.first += extra
+
+    def view(self, now):
+        """The columns to draw for the chart ending at now: x offset (column of ymin[0]) and the arrays."""
+        if self.first is None:
+            return 0, self.ymin, self.ymax
+        now_col = int(now//self.dt)
+        return self.width - 1 - (now_col - self.first), self.ymin, self.ymax
+
+
+class QHistoryChart(QWidget):
+    """Chart of the temperature, humidity or pressure history over a day, week or year."""
+
+    def __init__(self, history, pos, size=(315, 140), parent=None, debug=0):
+        super(QHistoryChart, self).__init__(parent)
+        self.setObjectName("history_chart")
+        self.history = history
+        self.debug = debug
+        self.setGeometry(pos[0], pos[1], size[0], size[1])
+        self.range_name = "day"
+        self.quantity = "temp"
+        self.columns = {}    # (range, width, quantity) -> MinMaxColumns
+        self.paths = {}      # (range, width, quantity) -> (version, now column, QPainterPath, y range)
+        self.font = QFont()
+        self.font.setPointSize(8)
+
+        self.buttons = []
+        x = 0
+        for name in list(CHART_RANGES) + list(CHART_QUANTITIES):
+            button = QPushButton(name[0].upper(), self)
+            button.setObjectName("chartbutton")
+            button.setToolTip(name)
+            button.setGeometry(x, 0, 24, 18)
+            button.clicked.connect(lambda checked=False, n=name: self.select(n))
+            self.buttons.append(button)
+            x += 26
+
+    @Slot()
+    def select(self, name):
+        """Select a range or quantity to show."""
+        if name in CHART_RANGES:
+            self.range_name = name
+        else:
+            self.quantity = name
+        self.update()
+
+    def plot_width(self):
+        """Width in pixels of the plot area, leaving room for the labels on the right."""
+        return max(self.width() - 40, 10)
+
+    def get_columns(self):
+        """The reduced columns for the current selection, filled from the history on first use."""
+        key = (self.range_name, self.plot_width(), self.quantity)
+        if key not in self.columns:
+            start = time.perf_counter()
+            span = CHART_RANGES[self.range_name]
+            column = CHART_QUANTITIES[self.quantity][0]
+            cols = MinMaxColumns(span, self.plot_width())
+            now = timesource.time()
+            t0 = now - span
+            if span > 7*24*3600:
+                roll = self.history.rollup("hourly", t0, now)
+                if len(roll) > 0:
+                    cols.add(roll['t'], roll[column + '_min'].astype('f8'), roll[column + '_max'].astype('f8'))
+                    # The rollup buckets are at the start of the hour, so continue with raw samples.
+                    cols.t_last = float(roll['t'][-1]) + 3600 - 1e-3
+                    t0 = cols.t_last
+            data = self.history.range(t0, now)
+            cols.add(data['t'], data[column].astype('f8'))
+            self.columns[key] = cols
+            if self.debug:
+                print("Chart {}: filled {} columns in {:.1f} ms".format(key, len(cols.ymin),
+                                                                       (time.perf_counter() - start)*1000))
+        return key, self.columns[key]
+
+    @Slot()
+    def new_samples(self):
+        """Extend all the cached columns with the samples that came in since."""
+        now = timesource.time()
+        for (range_name, width, quantity), cols in self.columns.items():
+            data = self.history.range(cols.t_last + 1e-3, now)
+            if len(data) > 0:
+                cols.add(data['t'], data[CHART_QUANTITIES[quantity][0]].astype('f8'))
+        self.update()
+
+    def build_path(self, cols, now):
+        """Build the zig-zag path through the min and max of each column, and return it with the y range."""
+        x0, ymin, ymax = cols.view(now)
+        scale = CHART_QUANTITIES[self.quantity][1]
+        path = QPainterPath()
+        if len(ymin) == 0 or not np.any(np.isfinite(ymin)):
+            return path, (0., 1.)
+        lo = float(np.nanmin(ymin))*scale
+        hi = float(np.nanmax(ymax))*scale
+        if hi - lo < 1e-6:
+            hi = lo + 1.
+        top = 22.
+        height = self.height() - top - 2
+        y_lo = (ymin*scale - lo)/(hi - lo)
+        y_hi = (ymax*scale - lo)/(hi - lo)
+        move = True
+        for i, (a, b) in enumerate(zip(y_lo.tolist(), y_hi.tolist())):
+            x = x0 + i
+            if a != a or x < 0:   # NaN or scrolled off
+                move = True
+                continue
+            if move:
+                path.moveTo(QPointF(x, top + height*(1 - a)))
+                move = False
+            else:
+                path.lineTo(QPointF(x, top + height*(1 - a)))
+            path.lineTo(QPointF(x, top + height*(1 - b)))
+        return path, (lo, hi)
+
+    @tracing.traced("QHistoryChart.paintEvent", "paint")
+    @metrics.timed_paint("history_chart")
+    def paintEvent(self, event):
+        """Draw the cached path, rebuilding it when the data changed."""
+        key, cols = self.get_columns()
+        now = timesource.time()
+        now_col = int(now//cols.dt)
+        cached = self.paths.get(key)
+        if cached is None or cached[0] != cols.version or cached[1] != now_col:
+            path, y_range = self.build_path(cols, now)
+            cached = (cols.version, now_col, path, y_range)
+            self.paths[key] = cached
+        path, (lo, hi) = cached[2], cached[3]
+
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        color = CHART_QUANTITIES[self.quantity][3]
+        painter.setPen(QPen(color, 1))
+        painter.drawPath(path)
+        painter.setFont(self.font)
+        painter.setPen(QColor(0, 180, 190))
+        unit = CHART_QUANTITIES[self.quantity][2]
+        right = QRectF(self.plot_width() + 2, 20, 38, self.height() - 20)
+        painter.drawText(right, Qt.AlignTop | Qt.AlignLeft, "{:.0f}\n{}".format(hi, unit))
+        painter.drawText(right, Qt.AlignBottom | Qt.AlignLeft, "{:.0f}".format(lo))
@@ -10,20 +10,40 @@ import os
 from qtpy.QtWidgets import QMainWindow, QSizePolicy, QTabWidget, QWidget, QLabel, QPushButton, QTimeEdit, \
     QLCDNumber, QSlider, QCheckBox, QSpinBox
 from qtpy.QtGui import QColor, QFont, QPainter, QPolygon
-from qtpy.QtCore import Qt, Slot, QTimer, QDateTime, QTime, QRect, QCoreApplication, QPoint
+from qtpy.QtCore import Qt, QObject, Signal, Slot, QTimer, QDateTime, QTime, QRect, QCoreApplication, QPoint
 
 from weather import QWeather, QTempMiniPanel, QWeatherIcon
 from moon import QMoon
-from tides import QHiLoTide
+from tides import QHiLoTide, QTideCurve
+import colors
+import metrics
+import tracing
+import timesource
+import fetch
+import fetcherd
+import backlight
+import autobright
+
+
+class FetcherEvents(QObject):
+    """Bring the change notifications of a fetcherd.py daemon from the Subscriber thread to the GUI."""
+    changed = Signal(object)
 
 class Clock_widget(QMainWindow):
 
-    def __init__(self, frameless=False, web=False, debug=0):
+    def __init__(self, frameless=False, web=False, debug=0, fetcher=None, backlight_path=backlight.SYSFS_BACKLIGHT):
+        """With fetcher, the URL of a fetcherd.py daemon, everything is fetched through that daemon,
+        and the panels are updated as soon as it reports a change. backlight_path is the sysfs
+        backlight directory, or a fake one made with backlight.make_fake()."""
         super(Clock_widget, self).__init__()
 
         self.debug = debug
         self.frameless = frameless
         self.web = web
+        self.fetcher = fetcher
+        self.subscriber = None
+        if fetcher is not None:
+            fetch.BASE_URL = fetcher    # Before the panels are made, they take their URLs from it.
         self.analog = None
         self.bedtime = QTime(20, 15, 00)
         self.bedtime_grace_period = 10
@@ -31,15 +51,44 @@ class Clock_widget(QMainWindow):
         self.temp_update_interval = 10
         self.n_updates = 0
 
-        self.temp_data = ['i', 0, 0, 0, 'o', 0, 0, 0, 'c', 0, 0]
         self.LCD_brightness = 150
+        self.backlight = backlight.Backlight(backlight_path, debug=debug)
+        self.dpms = backlight.Dpms(debug=debug)
+        self.auto_brightness = autobright.AutoBrightness(self.apply_auto_brightness, QWeather.geo_point, debug=debug)
+        self.auto_brightness.set_bedtime(self.bedtime)
+        self.applying_auto = False
+        self.monitor = None   # Optional monitor.LoopMonitor, ticked from update().
 
         self.resize(800, 460)
         self.setupUi(self)
 
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update)
-        self.timer.start(1000)
+        self.timer.start(timesource.interval(1000))
+
+        if fetcher is not None:
+            self.fetcher_events = FetcherEvents(self)
+            self.fetcher_events.changed.connect(self.fetcher_changed)
+            self.subscriber = fetcherd.Subscriber(fetcher, self.fetcher_events.changed.emit, debug=debug)
+            self.subscriber.start()
+
+    @Slot(object)
+    def fetcher_changed(self, keys):
+        """The daemon got new data for keys, update the panels that show it. The weather is updated at
+        the next tick. The hi/lo tides are cached for a year, so only the water level is of interest."""
+        if self.debug:
+            print("Fetcher changed: ", keys)
+        water_level = False
+        for key in keys:
+            if key.startswith("api.weather.gov/"):
+                if "/observations/" in key:
+                    self.weather.n_updates = 1
+                elif "/forecast" in key:
+                    self.weather.w_update = 1
+            elif key.startswith("tidesandcurrents.noaa.gov/") and "product=water_level" in key:
+                water_level = True
+        if water_level:
+            self.tidecurve.refresh()
 
     def setupUi(self, parent):
         """Setup the interfaces for the clock."""
@@ -108,8 +157,10 @@ class Clock_widget(QMainWindow):
         # Weather info on the Clock page.
         self.minipanel = QTempMiniPanel((475, 105), self.weather, parent=self.clock)
         self.weather.temp_updated.connect(self.minipanel.update)
+        self.weather.sensors_updated.connect(self.minipanel.update)
 
         self.hilo = QHiLoTide((580, 5), parent=self.clock, debug=self.debug)
+        self.tidecurve = QTideCurve((672, 215), size=(120, 125), parent=self.clock, debug=self.debug)
 
 
         # Moon phase
@@ -192,6 +243,10 @@ class Clock_widget(QMainWindow):
         font10.setBold(True)
         font10.setWeight(QFont.Weight.Bold)
         self.Brightness_label.setFont(font10)
+        self.Brightness_auto = QCheckBox(self.settings)
+        self.Brightness_auto.setObjectName(u"Brightness_auto")
+        self.Brightness_auto.setText(u"Auto")
+        self.Brightness_auto.setGeometry(QRect(90, 125, 86, 20))
         self.temp_test = QLabel(self.settings)
         self.temp_test.setObjectName(u"temp_test")
         self.temp_test.setText(u"T20.5 C")
@@ -253,6 +308,7 @@ class Clock_widget(QMainWindow):
         self.grace_period.valueChanged.connect(self.set_grace_period)
         self.Brightness.valueChanged.connect(self.set_screen_brightness)
         self.Brightness.valueChanged.connect(self.Brightness_Value.display)
+        self.Brightness_auto.toggled.connect(self.set_auto_brightness)
 
     def setup_from_json(self, json):
         """Set settings from the json dictionary passed."""
@@ -276,12 +332,30 @@ class Clock_widget(QMainWindow):
             self.LCD_brightness = int(json["Brightness"])
             self.Brightness.setValue(self.LCD_brightness)
 
+        if "GeoPoint" in json:
+            self.auto_brightness.set_geo_point(json["GeoPoint"])
+
+        if "AutoBrightnessRange" in json:
+            self.auto_brightness.set_range(*json["AutoBrightnessRange"])
+
+        if "BrightnessOffset" in json:
+            self.auto_brightness.set_offset(json["BrightnessOffset"])
+
+        if "AutoBrightness" in json:
+            self.Brightness_auto.setChecked(bool(json["AutoBrightness"]))
+
+        if "TideStations" in json:
+            self.hilo.set_stations(json["TideStations"])
+
     @Slot()
+    @tracing.traced("Clock_widget.update", "tick")
     def update(self):
         """This is called every second to perform the clock functions."""
+        if self.monitor is not None:
+            self.monitor.tick()
         AnalogClock.update(self)
 
-        dtime = QDateTime.currentDateTime()
+        dtime = timesource.qdatetime()
         text = dtime.toString("ddd MMM dd hh:mm:ss")
         self.Digital.setText(text)
 
@@ -343,51 +417,15 @@ class Clock_widget(QMainWindow):
 
     def turn_off_lcd(self):
         """Turn the LCD off with the DPMS."""
-        if os.uname().sysname == "Linux":
-            os.system("/usr/bin/xset dpms force off")
+        self.dpms.force_off()
 
-    def set_pressure_color(selfs, obj, press, valid=True):
+    def set_pressure_color(self, obj, press, valid=True):
         """Set the color of obj according to the pressure. """
-        pressures = (900., 950., 1000., 1020., 1040.)
-        colors = (0, 60, 120, 240, 300)
-        if valid:
-            if press < pressures[0]:
-                press = pressures[0] + 0.0001
-            if press > pressures[-1]:
-                press = pressures[-1] - 0.0001
-
-            i=0
-            while press > pressures[i]:
-                i += 1
-            hue = int(((press - pressures[i-1])/(pressures[i] - pressures[i-1]))*(colors[i]-colors[i-1]) +
-                      colors[i-1])
-            color = QColor.fromHsv(hue, 255, 120, 255)
-            obj.setStyleSheet("color: rgba({},{},{},255)".format(color.red(), color.green(), color.blue()))
-
+        colors.set_pressure_color(obj, press, valid)
 
     def set_temp_color(self, obj, temp, inside=True, invalid=False):
         """Set the color of obj depending on the temperature displayed by obj."""
-        temps = (-15., 16., 28., 40.)
-        colors = (270, 145, 60, 0)
-
-        if inside:
-            temps = (12., 20., 25., 32.)
-
-        if invalid:
-            obj.setStyleSheet("color: rgba(100,100,100,100)")
-        else:
-            if temp < temps[0]:
-                temp = temps[0] + 0.0001
-            if temp > temps[-1]:
-                temp = temps[-1] - 0.0001
-
-            i = 0
-            while temp > temps[i]:
-                i += 1
-            hue = int(((temp - temps[i-1])/(temps[i] - temps[i-1]))*(colors[i] - colors[i-1]) + colors[i-1])
-            color = QColor.fromHsv(hue, 255, 150, 255)
-
-            obj.setStyleSheet("color: rgba({},{},{},255)".format(color.red(), color.green(), color.blue()))
+        colors.set_temp_color(obj, temp, inside, invalid)
 
     @Slot()
     def test_temp_update(self, val=None):
@@ -405,6 +443,7 @@ class Clock_widget(QMainWindow):
     def set_bedtime(self, ntime):
         """Set the bedtime to a new time"""
         self.bedtime = ntime
+        self.auto_brightness.set_bedtime(ntime)
 
     @Slot()
     def set_grace_period(self, grace):
@@ -413,16 +452,25 @@ class Clock_widget(QMainWindow):
 
     @Slot()
     def set_screen_brightness(self, value):
-        """Set the brightness of the screen on Raspberry Pi"""
+        """Set the brightness of the screen on Raspberry Pi. The writes are coalesced by the Backlight.
+        With the auto brightness on, moving the slider sets the offset from the schedule."""
         self.LCD_brightness = value
+        self.backlight.set_brightness(value)
+        if self.auto_brightness.enabled and not self.applying_auto:
+            self.auto_brightness.offset_from(value)
+
+    @Slot(bool)
+    def set_auto_brightness(self, on):
+        """Follow the brightness schedule of the sun, see autobright.py."""
+        self.auto_brightness.enable(on)
 
-        if os.uname().sysname == "Linux":
-            try:
-                f = open("/sys/class/backlight/rpi_backlight/brightness", "w")
-                f.write(str(value))
-                f.close()
-            except Exception as e:
-                print("Issue with opening brightness file \n",e)
+    def apply_auto_brightness(self, level):
+        """Set a level of the schedule, on the slider so that it shows."""
+        self.applying_auto = True
+        try:
+            self.Brightness.setValue(level)
+        finally:
+            self.applying_auto = False
 
 
 class AnalogClock(QWidget):
@@ -457,11 +505,13 @@ class AnalogClock(QWidget):
         # self.setAutoFillBackground(True)
 
 
+    @tracing.traced("AnalogClock.paintEvent", "paint")
+    @metrics.timed_paint("analog_clock")
     def paintEvent(self, event):
         """Update the clock by re-painting it."""
 
         side = min(self.width(), self.height())
-        time = QTime.currentTime()
+        time = timesource.qtime()
 
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing)
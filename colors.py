@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#
+# Colors for the temperature and pressure labels.
+#
+# The hue for a value is interpolated between a few stops. Instead of doing that, and a
+# QColor.fromHsv(), on every update, the colors are precomputed in lookup tables at 0.1 C / 0.1 mbar
+# resolution, each with its "color: rgba(...)" style sheet string ready to use.
+#
+# The labels get their font and default color from Clock.qss, which takes precedence over a
+# QPalette, so the color has to be set with a style sheet. Every setStyleSheet() makes Qt
+# re-parse and re-polish the widget, so apply_color() remembers the color last set on each
+# widget and does nothing when it did not change, which is almost always the case from one
+# minute to the next.
+#
+from qtpy.QtGui import QColor
+
+INVALID_TEMP_STYLE = "color: rgba(100,100,100,100)"
+INVALID_PRESSURE_STYLE = "color: rgba(100,100,100,255)"
+
+
+class ColorMap:
+    """Lookup table from a value to a style sheet color, by interpolating the hue between stops."""
+
+    def __init__(self, values, hues, brightness, resolution=0.1):
+        self.v0 = values[0]
+        self.v1 = values[-1]
+        self.resolution = resolution
+        n = int(round((self.v1 - self.v0)/resolution)) + 1
+        self.styles = []
+        for k in range(n):
+            v = min(max(self.v0 + k*resolution, self.v0 + 0.0001), self.v1 - 0.0001)
+            i = 0
+            while v > values[i]:
+                i += 1
+            hue = int(((v - values[i-1])/(values[i] - values[i-1]))*(hues[i] - hues[i-1]) + hues[i-1])
+            color = QColor.fromHsv(hue, 255, brightness, 255)
+            self.styles.append("color: rgba({},{},{},255)".format(color.red(), color.green(), color.blue()))
+
+    def style(self, value):
+        """The style sheet string for value. Values outside the range get the color of the end."""
+        k = int(round((value - self.v0)/self.resolution))
+        if k < 0:
+            k = 0
+        elif k >= len(self.styles):
+            k = len(self.styles) - 1
+        return self.styles[k]
+
+
+OUTSIDE_TEMP_COLORS = ColorMap((-15., 16., 28., 40.), (270, 145, 60, 0), 150)
+INSIDE_TEMP_COLORS = ColorMap((12., 20., 25., 32.), (270, 145, 60, 0), 150)
+PRESSURE_COLORS = ColorMap((900., 950., 1000., 1020., 1040.), (0, 60, 120, 240, 300), 120)
+
+
+def apply_color(obj, style):
+    """Set the style sheet of obj to style, unless that is what it already has."""
+    if getattr(obj, "_color_style", None) is style:
+        return False
+    obj.setStyleSheet(style)
+    obj._color_style = style
+    return True
+
+
+def set_temp_color(obj, temp, inside=True, invalid=False):
+    """Set the color of obj depending on the temperature displayed by obj."""
+    if invalid:
+        return apply_color(obj, INVALID_TEMP_STYLE)
+    if inside:
+        return apply_color(obj, INSIDE_TEMP_COLORS.style(temp))
+    return apply_color(obj, OUTSIDE_TEMP_COLORS.style(temp))
+
+
+def set_pressure_color(obj, press, valid=True):
+    """Set the color of obj according to the pressure in mbar."""
+    if not valid:
+        return apply_color(obj, INVALID_PRESSURE_STYLE)
+    return apply_color(obj, PRESSURE_COLORS.style(press))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+#
+# All the HTTP GET requests to the upstream services (weather.gov, NOAA, NASA) go through get(),
+# so they are timed and counted per upstream host in metrics.py, and traced with tracing.py.
+#
+# For testing and benchmarks, the upstreams can be replaced by the stand-in server of fixtures.py:
+# with a base URL set (--base-url, or the QT_CLOCK_BASE_URL environment variable), upstream_url()
+# turns "https://api.weather.gov/points/" into "<base>/api.weather.gov/points/". With a recorder
+# set (--record DIR, or QT_CLOCK_RECORD), every response is saved as a fixture for that server.
+#
+import os
+import io
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+import metrics
+import tracing
+
+BASE_URL = os.getenv("QT_CLOCK_BASE_URL")
+recorder = None    # fixtures.Recorder
+
+
+def upstream_url(url):
+    """The url, or the same on the server at BASE_URL when that is set."""
+    if not BASE_URL:
+        return url
+    parts = urlsplit(url)
+    return BASE_URL.rstrip("/") + "/" + parts.netloc + parts.path + ("?" + parts.query if parts.query else "")
+
+
+def start_recording(directory):
+    """Save all responses as fixtures in directory."""
+    global recorder
+    import fixtures
+    recorder = fixtures.Recorder(directory)
+
+
+def get(url, session=None, **kwargs):
+    """requests.get(url, **kwargs), or session.get() when a requests.Session is given.
+    For a stream=True request the time is up to the headers, and the size is the Content-Length."""
+    requester = session if session is not None else requests
+    if not metrics.ENABLED and not tracing.ENABLED and recorder is None:
+        return requester.get(url, **kwargs)
+    with tracing.span("GET " + (urlsplit(url).hostname or ""), "http", {"url": url}):
+        start = time.perf_counter()
+        try:
+            resp = requester.get(url, **kwargs)
+        except Exception:
+            metrics.observe_request(url, time.perf_counter() - start, error=True)
+            raise
+        if kwargs.get("stream"):
+            nbytes = int(resp.headers.get("Content-Length", 0))
+        else:
+            nbytes = len(resp.content)
+        metrics.observe_request(url, time.perf_counter() - start, error=resp.status_code >= 400, nbytes=nbytes)
+    if recorder is not None:
+        recorder.save(resp, time.perf_counter() - start)
+        if kwargs.get("stream"):
+            resp.raw = io.BytesIO(resp.content)   # The recorder read the stream, so replay it.
+    return resp
+
+
+if os.getenv("QT_CLOCK_RECORD"):
+    start_recording(os.getenv("QT_CLOCK_RECORD"))
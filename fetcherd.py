@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+#
+# Shared fetcher daemon, so that all the clocks on a LAN hit the upstream services only once.
+#
+# Each clock polls weather.gov every minute, NOAA every few hours and NASA every hour. With many
+# clocks in a building that is the same requests many times over. This daemon sits between the
+# clocks and the upstreams, as a caching proxy with the same URL scheme as the stand-in server of
+# fixtures.py: the upstream https://host/path?query is http://<daemon>/host/path?query. So a clock
+# in client mode (--fetcher URL) only has to set fetch.BASE_URL, and QWeather, Tides and QMoon
+# work unchanged.
+#
+# A response is fresh for a time that depends on the upstream, see FRESHNESS. While fresh, it is
+# served from the cache. The keys that clocks have asked for in the last --keep seconds are
+# refreshed by a background thread when they go stale, so the upstreams see one poll per key, and
+# the clocks get the new data without waiting. Concurrent requests for the same key share one
+# upstream request. When the upstream fails, the last good response is served.
+#
+# Every time a refresh brings a different body, the version of the daemon goes up by one. A clock
+# long-polls /events?since=VERSION, which returns as soon as something changed, with the keys that
+# changed, so it can update right away instead of at its next poll.
+#
+# For testing, --upstream points the daemon at a fixtures.py stand-in server instead of the real
+# services:
+#     python3 fixtures.py serve fixtures/ --port 8765
+#     python3 fetcherd.py --upstream http://127.0.0.1:8765 --port 8766
+#     python3 qt_clock.py --fetcher http://127.0.0.1:8766
+#
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import fetch
+import metrics
+from fixtures import fixture_key
+
+DEFAULT_PORT = 8766
+UPSTREAM_HOSTS = ("api.weather.gov", "tidesandcurrents.noaa.gov", "svs.gsfc.nasa.gov")
+FORWARDED_HEADERS = ("Content-Type", "Last-Modified", "Cache-Control")
+
+# Seconds a response stays fresh, by the first matching key pattern. None is for the responses that
+# never change, like the icons and the moon images: their URL changes instead.
+FRESHNESS = (
+    (re.compile(r"api\.weather\.gov/icons/"), None),
+    (re.compile(r"api\.weather\.gov/points/"), 24*3600),
+    (re.compile(r"api\.weather\.gov/gridpoints/[^?]*/stations"), 24*3600),
+    (re.compile(r"api\.weather\.gov/"), 60),
+    (re.compile(r"tidesandcurrents\.noaa\.gov/"), 3*3600),
+    (re.compile(r"svs\.gsfc\.nasa\.gov/"), None),
+)
+DEFAULT_FRESHNESS = 600
+RETRY = 30.     # Seconds between the refreshes of an entry while the upstream fails.
+
+
+def freshness(key):
+    """Seconds a response for key stays fresh, None for forever."""
+    for pattern, seconds in FRESHNESS:
+        if pattern.match(key):
+            return seconds
+    return DEFAULT_FRESHNESS
+
+
+class Entry:
+    """One cached response."""
+    __slots__ = ("key", "status", "headers", "body", "etag", "upstream_etag", "fresh_for",
+                 "fetched", "tried", "requested", "version")
+
+    def __init__(self, key):
+        self.key = key
+        self.status = 0
+        self.headers = {}
+        self.body = b""
+        self.etag = None           # Our ETag, the hash of the body.
+        self.upstream_etag = None  # The ETag of the upstream, for a conditional refresh.
+        self.fresh_for = freshness(key)
+        self.fetched = None        # time.monotonic() of the last good upstream response.
+        self.tried = None          # time.monotonic() of the last upstream request.
+        self.requested = time.monotonic()
+        self.version = 0
+
+    def fresh(self, now):
+        return self.fetched is not None and (self.fresh_for is None or now - self.fetched < self.fresh_for)
+
+
+class FetcherServer(ThreadingHTTPServer):
+    """A caching proxy for the upstream services, with change notifications."""
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", DEFAULT_PORT), upstream=None, keep=3600., max_bytes=256*1024*1024,
+                 timeout=30., debug=0):
+        """upstream is the base URL of a stand-in server, or None for the real services. keep is how
+        long in seconds a key is refreshed after the last time a clock asked for it."""
+        super(FetcherServer, self).__init__(address, FetcherHandler)
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.keep = keep
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.debug = debug
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.entries = OrderedDict()   # key -> Entry, least recently used first.
+        self.inflight = {}             # key -> threading.Event of the upstream request in progress.
+        self.bytes = 0
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.upstream_requests = 0
+        self.upstream_errors = 0
+        self.stop_event = threading.Event()
+        self.refresher = threading.Thread(target=self.refresh_loop, name="fetcherd-refresh", daemon=True)
+        self.refresher.start()
+
+    def upstream_url(self, key):
+        if self.upstream:
+            return self.upstream + "/" + key
+        return "https://" + key
+
+    def normalize(self, body):
+        """Point the URLs in a body from a stand-in server back at the upstreams."""
+        if self.upstream:
+            body = body.replace((self.upstream + "/").encode(), b"https://")
+        return body
+
+    @staticmethod
+    def localize(body, base):
+        """Point the upstream URLs in a body at this daemon, as seen from the client at base."""
+        for host in UPSTREAM_HOSTS:
+            body = body.replace(b"https://" + host.encode(), (base + "/" + host).encode())
+        return body
+
+    def get(self, key):
+        """The entry for key, from the cache when fresh, else from the upstream. None when neither has it."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.requested = time.monotonic()
+                self.entries.move_to_end(key)
+                if entry.fresh(entry.requested):
+                    self.hits += 1
+                    metrics.cache("fetcherd", True)
+                    return entry
+            self.misses += 1
+        metrics.cache("fetcherd", False)
+        self.fetch(key)
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry if entry is not None and entry.fetched is not None else None
+
+    def fetch(self, key):
+        """Get key from the upstream into the cache. Concurrent calls for a key share one request."""
+        with self.lock:
+            pending = self.inflight.get(key)
+            if pending is None:
+                self.inflight[key] = threading.Event()
+                self.upstream_requests += 1
+                entry = self.entries.get(key)
+                upstream_etag = None
+                if entry is not None:
+                    upstream_etag = entry.upstream_etag
+                    entry.tried = time.monotonic()
+        if pending is not None:
+            pending.wait(self.timeout)
+            return
+        try:
+            headers = {"If-None-Match": upstream_etag} if upstream_etag else {}
+            resp = fetch.get(self.upstream_url(key), session=self.session, headers=headers, timeout=self.timeout)
+            if resp.status_code >= 500:
+                raise requests.HTTPError("{} {}".format(resp.status_code, resp.reason))
+            self.store(key, resp)
+        except Exception as e:
+            with self.lock:
+                self.upstream_errors += 1
+            print("Could not get {}: {}".format(key, e))
+        finally:
+            with self.lock:
+                self.inflight.pop(key).set()
+
+    def store(self, key, resp):
+        """Put an upstream response in the cache, and notify the clocks when the body changed."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = Entry(key)
+            if resp.status_code == 304 and entry.fetched is not None:
+                entry.fetched = entry.tried = now
+                return
+            body = self.normalize(resp.content)
+            etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+            entry.status = resp.status_code
+            entry.headers = {h: resp.headers[h] for h in FORWARDED_HEADERS if h in resp.headers}
+            entry.upstream_etag = resp.headers.get("ETag")
+            entry.fetched = entry.tried = now
+            if etag != entry.etag:
+                self.bytes += len(body) - len(entry.body)
+                entry.body = body
+                entry.etag = etag
+                self.version += 1
+                entry.version = self.version
+                self.changed.notify_all()
+                if self.debug:
+                    print("Version {}: {}".format(self.version, key))
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                _, old = self.entries.popitem(last=False)
+                self.bytes -= len(old.body)
+
+    def refresh_loop(self):
+        """Refresh the stale entries that the clocks still ask for."""
+        while not self.stop_event.wait(1.):
+            now = time.monotonic()
+            with self.lock:
+                stale = [e.key for e in self.entries.values()
+                         if not e.fresh(now) and now - e.requested < self.keep and now - e.tried >= RETRY
+                         and e.key not in self.inflight]
+            for key in stale:
+                self.fetch(key)
+
+    def events(self, since, timeout):
+        """Wait up to timeout seconds for a version after since. Returns the version and the changed keys."""
+        with self.changed:
+            if since is not None:
+                self.changed.wait_for(lambda: self.version > since, timeout)
+            changed = [e.key for e in self.entries.values() if since is not None and e.version > since]
+            return self.version, changed
+
+    def status(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.bytes, "version": self.version, "hits": self.hits,
+                    "misses": self.misses, "upstream_requests": self.upstream_requests,
+                    "upstream_errors": self.upstream_errors, "upstream": self.upstream or "https://"}
+
+    def shutdown(self):
+        self.stop_event.set()
+        with self.changed:
+            self.changed.notify_all()
+        super(FetcherServer, self).shutdown()
+
+
+class FetcherHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        if parts.path == "/events":
+            query = dict(parse_qsl(parts.query))
+            since = int(query["since"]) if "since" in query else None
+            version, changed = server.events(since, min(float(query.get("timeout", 30)), 300.))
+            self.send_json({"version": version, "changed": changed})
+            return
+        if parts.path == "/status":
+            self.send_json(server.status())
+            return
+
+        key = fixture_key("http:/" + self.path)
+        entry = server.get(key)
+        if entry is None:
+            self.send_error(502, "Could not get " + key)
+        elif self.headers.get("If-None-Match") == entry.etag:
+            self.send_response(304)
+            self.send_header("ETag", entry.etag)
+            self.end_headers()
+        else:
+            body = entry.body
+            if "json" in entry.headers.get("Content-Type", "") or "text" in entry.headers.get("Content-Type", ""):
+                body = server.localize(body, "http://" + self.headers.get("Host", "{}:{}".format(*server.server_address[:2])))
+            headers = dict(entry.headers)
+            headers["ETag"] = entry.etag
+            self.send_body(entry.status, headers, body)
+
+    def send_json(self, js):
+        self.send_body(200, {"Content-Type": "application/json"}, json.dumps(js).encode())
+
+    def send_body(self, status, headers, body):
+        self.send_response(status)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Subscriber:
+    """Long-poll the /events of a daemon on a thread, and call callback(keys) with the changed keys.
+    The callback runs on that thread, so for Qt it should emit a signal."""
+
+    def __init__(self, base, callback, timeout=30., retry=10., debug=0):
+        self.base = base.rstrip("/")
+        self.callback = callback
+        self.timeout = timeout
+        self.retry = retry
+        self.debug = debug
+        self.session = requests.Session()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="fetcherd-events", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        version = None
+        while not self.stop_event.is_set():
+            params = {"timeout": self.timeout}
+            if version is not None:
+                params["since"] = version
+            try:
+                js = self.session.get(self.base + "/events", params=params, timeout=self.timeout + 10).json()
+            except Exception as e:
+                if self.debug:
+                    print("Could not get the events from {}: {}".format(self.base, e))
+                self.stop_event.wait(self.retry)
+                continue
+            if version is not None and js["version"] < version:
+                version = None    # The daemon was restarted, start over.
+                continue
+            version = js["version"]
+            if js["changed"] and not self.stop_event.is_set():
+                self.callback(js["changed"])
+
+
+def main():
+    parser = argparse.ArgumentParser("Shared fetcher daemon for the clocks on a LAN.")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Address to listen on.")
+    parser.add_argument("--port", "-p", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument("--upstream", "-u", type=str, default=None, metavar="URL",
+                        help="Get everything from the fixtures.py stand-in server at URL instead of the upstreams.")
+    parser.add_argument("--keep", "-k", type=float, default=3600.,
+                        help="Keep refreshing a response this many seconds after a clock last asked for it.")
+    parser.add_argument("--max-mb", type=float, default=256., help="Size of the cache in MB.")
+    parser.add_argument("--metrics", type=int, nargs="?", const=metrics.DEFAULT_PORT, default=None, metavar="PORT",
+                        help="Serve the upstream metrics in the Prometheus format on PORT.")
+    parser.add_argument("--debug", "-d", action="count", default=0, help="Print the changes.")
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.metrics is not None:
+        metrics.serve(args.host, args.metrics)
+    server = FetcherServer((args.host, args.port), upstream=args.upstream, keep=args.keep,
+                           max_bytes=int(args.max_mb*1024*1024), debug=args.debug)
+    print("Fetching for the clocks on http://{}:{}".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.stop_event.set()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
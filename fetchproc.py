@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+#
+# Fetching and decoding in a child process, so that it does not compete with the GUI for the GIL.
+#
+# With --fetch-process, start() spawns a worker process, and sets the module level worker. The
+# code that fetches checks it, like fetch.recorder: QWeather gets its forecasts and observations,
+# griddata its GridData, Tides its hi/lo events and series, and QMoon its images from the worker
+# instead of doing the request and the parsing itself. In the worker process, worker is None, so
+# the same functions do the actual work there.
+#
+# The results come back over a multiprocessing pipe, pickled: the parsed models.Forecast and
+# models.Observation records (with __slots__), and numpy arrays for the grid and the tides. That is
+# much smaller than the JSON. The moon image is decoded, cropped and scaled in the worker, and the
+# pixels are written to a multiprocessing.shared_memory block. The GUI makes a QImage over that
+# block without going through the pipe, copies it once into its own memory for the QPixmap, and
+# frees the block.
+#
+# Each request gets a concurrent.futures.Future. call() waits for the result, so it can replace a
+# direct call; submit() does not wait. The worker runs a few requests at a time, so a large moon
+# image does not hold up the observations.
+#
+import os
+import threading
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import Future, ThreadPoolExecutor
+
+worker = None   # The FetchProcess, when started.
+
+
+class WorkerError(Exception):
+    """A request failed in the worker process."""
+
+
+class SharedImage:
+    """A decoded image in a shared memory block, made by the worker."""
+
+    def __init__(self, name, width, height, bytes_per_line):
+        self.shm = shared_memory.SharedMemory(name)
+        self.width = width
+        self.height = height
+        self.bytes_per_line = bytes_per_line
+
+    def image(self):
+        """A QImage over the shared memory, valid until release()."""
+        from qtpy.QtGui import QImage
+        return QImage(self.shm.buf, self.width, self.height, self.bytes_per_line, QImage.Format_RGB32)
+
+    def pixmap(self):
+        """A QPixmap of the image, after which the shared memory is released. The pixmap may share
+        the pixels of the QImage, so the image is detached from the shared memory first."""
+        from qtpy.QtGui import QPixmap
+        image = self.image().copy()
+        pix = QPixmap.fromImage(image)
+        del image
+        self.release()
+        return pix
+
+    def release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class FetchProcess:
+    """The GUI side of the worker process."""
+
+    def __init__(self, workers=3, debug=0):
+        import fetch
+        context = multiprocessing.get_context("spawn")    # A fork of a process with Qt in it is not safe.
+        self.conn, child_conn = context.Pipe()
+        record_dir = fetch.recorder.directory if fetch.recorder is not None else None
+        self.process = context.Process(target=serve, args=(child_conn, fetch.BASE_URL, record_dir, workers, debug),
+                                       name="qt_clock-fetch", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.debug = debug
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.receiver = threading.Thread(target=self.receive, name="fetchproc", daemon=True)
+        self.receiver.start()
+
+    def submit(self, kind, *args):
+        """Start the request kind (see HANDLERS) in the worker, return a Future with the result."""
+        future = Future()
+        with self.lock:
+            request_id = next(self.ids)
+            self.futures[request_id] = future
+            try:
+                self.conn.send((request_id, kind, args))
+            except (OSError, ValueError) as e:
+                del self.futures[request_id]
+                future.set_exception(WorkerError("The fetch process is gone: {}".format(e)))
+        return future
+
+    def call(self, kind, *args, timeout=120.):
+        """Do the request kind in the worker, and wait for the result."""
+        return self.submit(kind, *args).result(timeout)
+
+    def receive(self):
+        """Thread that hands the results to the futures."""
+        while True:
+            try:
+                request_id, ok, result = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self.lock:
+                future = self.futures.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(WorkerError(result))
+        with self.lock:
+            futures, self.futures = self.futures, {}
+        for future in futures.values():
+            future.set_exception(WorkerError("The fetch process stopped."))
+
+    def moon_image(self, url, extension, size):
+        """Start getting the moon image, the Future gives a SharedImage."""
+        future = Future()
+
+        def done(f):
+            try:
+                future.set_result(SharedImage(*f.result()))
+            except Exception as e:
+                future.set_exception(e)
+        self.submit("moon", url, extension, size).add_done_callback(done)
+        return future
+
+    def stop(self):
+        """Stop the worker process."""
+        try:
+            with self.lock:
+                self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+def start(workers=3, debug=0):
+    """Start the worker process, and send the fetching there from now on."""
+    global worker
+    worker = FetchProcess(workers, debug)
+    return worker
+
+
+def stop():
+    global worker
+    if worker is not None:
+        worker.stop()
+        worker = None
+
+
+# The worker side. Each handler gets the arguments of submit(), and returns something that pickles.
+
+def get_forecast(url, params, headers):
+    import fetch
+    from models import Forecast
+    js = fetch.get(url, params=params, headers=headers, timeout=30).json()
+    if 'properties' not in js:
+        raise WorkerError("Error getting the forecast: {}".format(js.get('status')))
+    return Forecast(js['properties'])
+
+
+def get_observation(url, headers):
+    import fetch
+    from models import Observation
+    return Observation(fetch.get(url, headers=headers, timeout=30).json()['properties'])
+
+
+def get_grid(url, headers, max_hours):
+    from griddata import get_grid_data
+    return get_grid_data(url, headers=headers, max_hours=max_hours)
+
+
+tides = None
+
+
+def get_tides():
+    global tides
+    if tides is None:
+        from tides import Tides
+        tides = Tides()
+    return tides
+
+
+def get_hilo(begin_date, end_date, station):
+    return get_tides().get_hilo(begin_date, end_date, station)
+
+
+def get_tide_series(begin, end, station, product):
+    return get_tides().get_series(begin, end, station, product)
+
+
+def get_moon_image(url, extension, size):
+    """Get, decode, crop to a square and scale the moon image, and put the pixels in shared memory."""
+    import fetch
+    from qtpy.QtGui import QImage
+    from moon import decode_image
+    image = decode_image(fetch.get(url, timeout=60).content, extension, size)
+    if image is None:
+        raise WorkerError("Could not decode the moon image " + url)
+    image = image.convertToFormat(QImage.Format_RGB32)
+    shm = shared_memory.SharedMemory(create=True, size=image.sizeInBytes())
+    shm.buf[:image.sizeInBytes()] = image.constBits()
+    shared = (shm.name, image.width(), image.height(), image.bytesPerLine())
+    shm.close()   # The GUI unlinks it.
+    return shared
+
+
+HANDLERS = {
+    "forecast": get_forecast,
+    "observation": get_observation,
+    "grid": get_grid,
+    "hilo": get_hilo,
+    "tide_series": get_tide_series,
+    "moon": get_moon_image,
+}
+
+
+def serve(conn, base_url, record_dir, workers, debug):
+    """The main of the worker process: run the requests from conn, and send back the results."""
+    import fetch
+    fetch.BASE_URL = base_url
+    if record_dir is not None:
+        fetch.start_recording(record_dir)
+    send_lock = threading.Lock()
+
+    def run(request_id, kind, args):
+        try:
+            result = (request_id, True, HANDLERS[kind](*args))
+        except Exception as e:
+            if debug:
+                print("Fetch process, {} failed: {}".format(kind, e))
+            result = (request_id, False, "{}: {}".format(type(e).__name__, e))
+        with send_lock:
+            conn.send(result)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetchproc") as pool:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                break
+            if request is None:
+                break
+            pool.submit(run, *request)
+    if debug:
+        print("Fetch process {} stopped.".format(os.getpid()))
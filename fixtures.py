@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+#
+# Recorded HTTP fixtures, and a local stand-in server that replays them.
+#
+# Recording: run the clock with --record DIR (or QT_CLOCK_RECORD=DIR for the other scripts). Every
+# 2xx response that goes through fetch.get() is saved in DIR as <name>.json, with the url, status,
+# headers and the time it took, and <name>.body with the body as received. The other responses,
+# like a passing 503 or a 304, would overwrite a good fixture, so only their url, status and time
+# are appended to DIR/failures.jsonl.
+#
+# Replaying: start the server on the fixture directory,
+#     python3 fixtures.py serve DIR --port 8765 --latency 0.5 --error-rate 0.1
+# and run the clock with --base-url http://127.0.0.1:8765 (or QT_CLOCK_BASE_URL). The upstream
+# https://host/path?query is served as http://127.0.0.1:8765/host/path?query. The upstream
+# URLs inside the bodies, like the forecast URLs in the points JSON, are rewritten to point at the
+# server as well. The server can inject latency, errors, 304 Not Modified responses, and a
+# stale updateTime, to exercise the retry paths of the clock. With --seed the injected failures
+# are the same from run to run.
+#
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAVED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control", "Expires")
+UPDATE_TIME_RE = re.compile(rb'("updateTime"\s*:\s*")[^"]*(")')
+
+
+def fixture_key(url):
+    """The key of an upstream url: host, path and the query sorted, without the scheme."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return parts.netloc + parts.path + ("?" + query if query else "")
+
+
+def fixture_name(key):
+    """A file name for the key, readable and unique."""
+    readable = re.sub(r"[^\w.-]+", "_", key)[:80]
+    return readable + "_" + hashlib.sha1(key.encode()).hexdigest()[:10]
+
+
+class Recorder:
+    """Save responses into a fixture directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+
+    def save(self, resp, elapsed):
+        """Save a requests.Response, that took elapsed seconds. Only a 2xx response becomes a
+        fixture, the others are logged in failures.jsonl."""
+        key = fixture_key(resp.url)
+        meta = {
+            "url": resp.url,
+            "key": key,
+            "status": resp.status_code,
+            "headers": {h: resp.headers[h] for h in SAVED_HEADERS if h in resp.headers},
+            "elapsed": elapsed,
+            "recorded": datetime.now(timezone.utc).isoformat(),
+        }
+        if not 200 <= resp.status_code < 300:
+            with self.lock:
+                with open(os.path.join(self.directory, "failures.jsonl"), "a") as f:
+                    f.write(json.dumps(meta) + "\n")
+            return
+        name = os.path.join(self.directory, fixture_name(key))
+        with self.lock:
+            with open(name + ".body", "wb") as f:
+                f.write(resp.content)
+            with open(name + ".json", "w") as f:
+                json.dump(meta, f, indent=1)
+
+
+class Fixture:
+    """One recorded response."""
+    __slots__ = ("key", "status", "headers", "elapsed", "body")
+
+    def __init__(self, meta, body):
+        self.key = meta["key"]
+        self.status = meta["status"]
+        self.headers = meta["headers"]
+        self.elapsed = meta["elapsed"]
+        self.body = body
+
+
+def load_fixtures(directory):
+    """All the fixtures in directory, as a dict key -> Fixture."""
+    fixtures = {}
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(".json"):
+            continue
+        base = os.path.join(directory, file_name[:-5])
+        with open(base + ".json") as f:
+            meta = json.load(f)
+        with open(base + ".body", "rb") as f:
+            fixtures[meta["key"]] = Fixture(meta, f.read())
+    return fixtures
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Serve the fixtures, with injected latency and failures."""
+    daemon_threads = True
+
+    def __init__(self, fixtures, address=("127.0.0.1", 8765), latency=0., jitter=0., error_rate=0.,
+                 not_modified_rate=0., stale_hours=0., seed=None, debug=0):
+        """latency is in seconds, or None to use the recorded time of each response."""
+        super(StandInServer, self).__init__(address, StandInHandler)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.not_modified_rate = not_modified_rate
+        self.stale_hours = stale_hours
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.debug = debug
+        self.base = "http://{}:{}".format(*self.server_address[:2])
+        self.hosts = sorted(set(key.split("/", 1)[0] for key in fixtures), key=len, reverse=True)
+        self.requests = 0
+
+    def draw(self):
+        """A random number, drawn in a thread safe way so a seed gives a reproducible sequence."""
+        with self.random_lock:
+            self.requests += 1
+            return self.random.random(), self.random.random(), self.random.random()
+
+    def rewrite(self, body):
+        """Point the upstream URLs in the body at this server, and make the updateTime stale."""
+        for host in self.hosts:
+            body = body.replace(b"https://" + host.encode(), (self.base + "/" + host).encode())
+        if self.stale_hours:
+            stale = (datetime.now(timezone.utc) - timedelta(hours=self.stale_hours)).isoformat(timespec="seconds")
+            body = UPDATE_TIME_RE.sub(rb"\g<1>" + stale.encode() + rb"\g<2>", body)
+        return body
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        key = fixture_key("http:/" + self.path)
+        fixture = server.fixtures.get(key)
+        fail, not_modified, jitter = server.draw()
+        delay = fixture.elapsed if (server.latency is None and fixture is not None) else (server.latency or 0.)
+        if server.jitter:
+            delay += server.jitter*jitter
+        if delay > 0:
+            time.sleep(delay)
+        if server.debug:
+            print("{} {}".format("hit " if fixture is not None else "miss", key))
+
+        if fixture is None:
+            self.send_error(404, "No fixture for " + key)
+        elif fail < server.error_rate:
+            self.send_error(503, "Injected error")
+        elif (not_modified < server.not_modified_rate or
+              ("ETag" in fixture.headers and self.headers.get("If-None-Match") == fixture.headers["ETag"])):
+            self.send_response(304)
+            self.end_headers()
+        else:
+            body = server.rewrite(fixture.body)
+            self.send_response(fixture.status)
+            for header, value in fixture.headers.items():
+                self.send_header(header, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser("Record/replay HTTP fixtures for the clock.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="Serve the fixtures in a directory.")
+    serve.add_argument("directory", type=str, help="Fixture directory.")
+    serve.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on.")
+    serve.add_argument("--port", "-p", type=int, default=8765, help="Port to listen on.")
+    serve.add_argument("--latency", "-l", type=str, default="0",
+                       help="Latency in seconds, or 'recorded' for the recorded time of each response.")
+    serve.add_argument("--jitter", "-j", type=float, default=0., help="Random extra latency up to this, in seconds.")
+    serve.add_argument("--error-rate", "-e", type=float, default=0., help="Fraction of requests answered with a 503.")
+    serve.add_argument("--not-modified-rate", "-n", type=float, default=0.,
+                       help="Fraction of requests answered with a 304.")
+    serve.add_argument("--stale-hours", "-s", type=float, default=0.,
+                       help="Set the updateTime in the bodies this many hours in the past.")
+    serve.add_argument("--seed", type=int, default=None, help="Seed for the injected failures.")
+    serve.add_argument("--debug", "-d", action="count", default=0, help="Print each request.")
+    show = sub.add_parser("list", help="List the fixtures in a directory.")
+    show.add_argument("directory", type=str, help="Fixture directory.")
+    args = parser.parse_args(sys.argv[1:])
+
+    fixtures = load_fixtures(args.directory)
+    if args.command == "list":
+        for key, fixture in fixtures.items():
+            print("{:3d} {:7d} bytes {:6.0f} ms  {}".format(fixture.status, len(fixture.body), fixture.elapsed*1000, key))
+        return
+
+    latency = None if args.latency == "recorded" else float(args.latency)
+    server = StandInServer(fixtures, (args.host, args.port), latency=latency, jitter=args.jitter,
+                           error_rate=args.error_rate, not_modified_rate=args.not_modified_rate,
+                           stale_hours=args.stale_hours, seed=args.seed, debug=args.debug)
+    print("Serving {} fixtures on {}".format(len(fixtures), server.base))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
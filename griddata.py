@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+#
+# Ingestion of the weather.gov forecastGridData.
+#
+# The grid data JSON is large: dozens of layers, each a list of
+# {"validTime": "2025-10-19T06:00:00+00:00/PT3H", "value": 12.2} entries. Instead of turning
+# all of it into nested dicts with .json(), the response is streamed through ijson, only the
+# layers we want are looked at, and each interval is written straight into an hourly
+# numpy array for that layer. Without ijson we fall back to json.load on the stream, which
+# gives the same result with a higher peak memory.
+#
+# The arrays are bounded to max_hours from the start of the grid, and the response is read through
+# a LimitedReader that stops at GRID_MAX_BYTES, in every mode (here, in the fetch process, and for
+# aio.py), so the memory used does not depend on what the server sends. The parse time and the
+# size go to the metrics.
+#
+# The dew point and the sky cover are shown in the hourly strip, see hourly.py.
+#
+import re
+import json
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+
+import fetch
+import fetchproc
+import metrics
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+GRID_LAYERS = ("temperature", "dewpoint", "windSpeed", "windDirection", "windGust", "skyCover",
+               "probabilityOfPrecipitation")
+
+GRID_PEAK_MEMORY_LIMIT = 4*1024*1024   # Bytes, warn when a parse goes over this.
+GRID_MAX_BYTES = 8*1024*1024           # Bytes, a larger response is not parsed. A normal one is ~1 MB.
+READ_CHUNK = 64*1024
+
+DURATION_RE = re.compile(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?)?")
+
+
+def parse_valid_time(valid_time):
+    """Parse an ISO-8601 interval like "2025-10-19T06:00:00+00:00/PT3H" to (start in UTC seconds, hours)."""
+    start, duration = valid_time.split("/")
+    match = DURATION_RE.fullmatch(duration)
+    if match is None:
+        raise ValueError("Cannot parse duration: " + duration)
+    days, hours, minutes = (int(x) if x else 0 for x in match.groups())
+    return datetime.fromisoformat(start).timestamp(), days*24 + hours + (1 if minutes else 0)
+
+
+class GridTooLarge(ValueError):
+    """The grid data response is over GRID_MAX_BYTES."""
+
+
+class LimitedReader:
+    """A file like wrapper of stream that raises GridTooLarge once more than max_bytes were read."""
+
+    def __init__(self, stream, max_bytes=GRID_MAX_BYTES):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:     # Read it all, but in chunks, so the limit holds.
+            chunks = []
+            while True:
+                chunk = self.read(READ_CHUNK)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        data = self.stream.read(size)
+        self.nbytes += len(data)
+        if self.nbytes > self.max_bytes:
+            raise GridTooLarge("The grid data is over {} bytes.".format(self.max_bytes))
+        return data
+
+
+class GridData:
+    """Hourly arrays for the layers of the forecast grid data. Hour i of every array is
+    start + i*3600 seconds (UTC). Hours without data are NaN."""
+
+    def __init__(self, max_hours=8*24, layers=GRID_LAYERS):
+        self.max_hours = max_hours
+        self.start = None
+        self.layers = {name: np.full(max_hours, np.nan, dtype='f4') for name in layers}
+        self.units = {}
+        self.update_time = None
+        self.parse_time = 0.       # Seconds
+        self.nbytes = 0            # Size of the response.
+        self.peak_memory = 0       # Bytes, when measured.
+
+    def times(self):
+        """The UTC times of the hours as an array."""
+        return self.start + 3600.*np.arange(self.max_hours)
+
+    def at(self, layer, t):
+        """The values of layer at the UTC times t (an array), NaN outside the grid."""
+        t = np.asarray(t, dtype='f8')
+        if self.start is None or layer not in self.layers:
+            return np.full(t.shape, np.nan, dtype='f4')
+        i = np.floor((t - self.start)/3600.).astype('i8')
+        inside = (i >= 0) & (i < self.max_hours)
+        values = np.full(t.shape, np.nan, dtype='f4')
+        values[inside] = self.layers[layer][i[inside]]
+        return values
+
+    def set_interval(self, layer, valid_time, value):
+        """Fill the hours of the interval valid_time with value."""
+        t, hours = parse_valid_time(valid_time)
+        if self.start is None:
+            self.start = t - t % 3600
+        i0 = int((t - self.start)//3600)
+        i1 = min(i0 + hours, self.max_hours)
+        if i1 > max(i0, 0) and value is not None:
+            self.layers[layer][max(i0, 0):i1] = value
+
+    def consume(self, events):
+        """Fill the arrays from (prefix, event, value) parse events, as made by ijson.parse.
+        Everything not in one of our layers is skipped with a single dict lookup."""
+        wanted = {"properties.validTimes": (None, "validTimes"), "properties.updateTime": (None, "updateTime")}
+        for layer in self.layers:
+            prefix = "properties." + layer
+            wanted[prefix + ".uom"] = (layer, "uom")
+            wanted[prefix + ".values.item.validTime"] = (layer, "validTime")
+            wanted[prefix + ".values.item.value"] = (layer, "value")
+        valid_time = None
+        for prefix, event, value in events:
+            what = wanted.get(prefix)
+            if what is None or event == "map_key":
+                continue
+            layer, kind = what
+            if kind == "value":
+                if valid_time is not None:
+                    self.set_interval(layer, valid_time, None if value is None else float(value))
+                    valid_time = None
+            elif kind == "validTime":
+                valid_time = value
+            elif kind == "uom":
+                self.units[layer] = value.split(":")[-1]
+            elif kind == "validTimes":
+                self.start, hours = parse_valid_time(value)
+                self.start -= self.start % 3600
+            elif kind == "updateTime":
+                self.update_time = datetime.fromisoformat(value)
+
+
+def dict_events(js):
+    """Generate ijson style (prefix, event, value) events for the parts of the grid data dict we use."""
+    props = js.get("properties", {})
+    for key in ("validTimes", "updateTime"):
+        if key in props:
+            yield "properties." + key, "string", props[key]
+    for layer in GRID_LAYERS:
+        if layer not in props:
+            continue
+        prefix = "properties." + layer
+        yield prefix + ".uom", "string", props[layer].get("uom", "")
+        for item in props[layer].get("values", []):
+            yield prefix + ".values.item.validTime", "string", item["validTime"]
+            yield prefix + ".values.item.value", "number", item["value"]
+
+
+def parse_grid_data(stream, max_hours=8*24, measure=False, max_bytes=GRID_MAX_BYTES):
+    """Parse the grid data JSON from the file like stream into a GridData object. Raises
+    GridTooLarge for more than max_bytes. With measure=True, the peak Python memory during the
+    parse is recorded (this slows it down)."""
+    grid = GridData(max_hours)
+    stream = LimitedReader(stream, max_bytes)
+    if measure:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        if ijson is not None:
+            grid.consume(ijson.parse(stream, use_float=True))
+        else:
+            grid.consume(dict_events(json.load(stream)))
+    finally:
+        grid.parse_time = time.perf_counter() - start
+        grid.nbytes = stream.nbytes
+        if measure:
+            grid.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    metrics.observe(metrics.renders, "grid_data", grid.parse_time)
+    return grid
+
+
+def get_grid_data(url, headers=None, max_hours=8*24, measure=False, debug=0):
+    """Stream the forecastGridData from url and parse it into a GridData object."""
+    if fetchproc.worker is not None:
+        return fetchproc.worker.call("grid", url, headers, max_hours)
+    with fetch.get(url, params={"units": "si"}, headers=headers, stream=True, timeout=30) as req:
+        req.raise_for_status()
+        req.raw.decode_content = True
+        grid = parse_grid_data(req.raw, max_hours=max_hours, measure=measure)
+    if measure and grid.peak_memory > GRID_PEAK_MEMORY_LIMIT:
+        print("Warning: grid data parse used {:.0f} kB peak memory.".format(grid.peak_memory/1024))
+    if debug:
+        print("Grid data of {:.0f} kB parsed in {:.1f} ms, peak memory {:.0f} kB, ijson={}".format(
+            grid.nbytes/1024, grid.parse_time*1000, grid.peak_memory/1024, ijson is not None))
+    return grid
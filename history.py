@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+#
+# Observation history store.
+#
+# The observations (outside temperature, pressure, humidity, ...) are kept in one file per
+# month. Each file is a fixed size numpy memmap with one row per sample, big enough for a sample
+# every minute for 31 days. Unused rows have t = +inf, so the time column is always sorted and
+# the number of rows in use, as well as any time range, is found with a binary search.
+#
+# Next to each month file are two small files with the hourly and daily min/max/mean rollups.
+# The row of an hour (day) is simply the hour (day) of the month, so no search is needed.
+#
+# To save the SD card, samples are collected in memory and written in batches, by default
+# every 15 minutes of timesource time (so also in a simulated soak run), and when the program exits.
+#
+import os
+import timesource
+from datetime import datetime, timezone
+import numpy as np
+
+HISTORY_COLUMNS = ('temp', 'pressure', 'humidity')
+ROWS_PER_MONTH = 31*24*60   # One sample per minute.
+
+
+def history_dtype(columns=HISTORY_COLUMNS):
+    """The numpy dtype of one row in the month file."""
+    return np.dtype([('t', 'f8')] + [(c, 'f4') for c in columns])
+
+
+def rollup_dtype(columns=HISTORY_COLUMNS):
+    """The numpy dtype of one row in the hourly or daily rollup file."""
+    fields = [('t', 'f8'), ('n', 'i4')]
+    for c in columns:
+        fields += [(c + '_min', 'f4'), (c + '_max', 'f4'), (c + '_mean', 'f4')]
+    return np.dtype(fields)
+
+
+def month_start(t):
+    """Start of the (UTC) month containing t as a datetime."""
+    dt = datetime.fromtimestamp(t, tz=timezone.utc)
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(start):
+    """Start of the month after the month starting at datetime start."""
+    if start.month == 12:
+        return datetime(start.year + 1, 1, 1, tzinfo=timezone.utc)
+    return datetime(start.year, start.month + 1, 1, tzinfo=timezone.utc)
+
+
+class MonthFile:
+    """The memory mapped data and rollups for one month."""
+
+    ROLLUPS = {"hourly": (3600, 31*24), "daily": (24*3600, 31)}
+
+    def __init__(self, data_dir, start, columns=HISTORY_COLUMNS):
+        self.start = start
+        self.t_start = start.timestamp()
+        self.columns = columns
+        name = os.path.join(data_dir, start.strftime("obs_%Y-%m"))
+        self.data = self.open(name + ".dat", history_dtype(columns), ROWS_PER_MONTH)
+        self.rollups = {}
+        for kind, (width, rows) in self.ROLLUPS.items():
+            self.rollups[kind] = self.open(name + "_" + kind + ".dat", rollup_dtype(columns), rows)
+        self.n = int(np.searchsorted(self.data['t'], np.inf, side='left'))
+
+    def open(self, file_name, dtype, rows):
+        """Open, or create and initialize, the memmap file_name."""
+        if os.path.exists(file_name):
+            return np.memmap(file_name, dtype=dtype, mode='r+', shape=(rows,))
+        mm = np.memmap(file_name, dtype=dtype, mode='w+', shape=(rows,))
+        mm['t'] = np.inf
+        for name in dtype.names[1:]:
+            mm[name] = 0 if name == 'n' else np.nan
+        mm.flush()
+        return mm
+
+    def append(self, rows):
+        """Append the rows (a structured array in time order). Returns the number written."""
+        n_new = min(len(rows), len(self.data) - self.n)
+        if n_new <= 0:
+            return 0
+        self.data[self.n:self.n + n_new] = rows[:n_new]
+        self.update_rollups(rows['t'][0], rows['t'][n_new - 1])
+        self.n += n_new
+        return n_new
+
+    def update_rollups(self, t0, t1):
+        """Recompute the hourly and daily buckets touched by samples between t0 and t1."""
+        for kind, (width, n_rows) in self.ROLLUPS.items():
+            roll = self.rollups[kind]
+            for i in range(int((t0 - self.t_start)//width), int((t1 - self.t_start)//width) + 1):
+                b0 = self.t_start + i*width
+                i0 = np.searchsorted(self.data['t'], b0, side='left')
+                i1 = np.searchsorted(self.data['t'], b0 + width, side='left')
+                bucket = self.data[i0:i1]
+                roll['t'][i] = b0
+                roll['n'][i] = len(bucket)
+                for c in self.columns:
+                    values = bucket[c]
+                    values = values[np.isfinite(values)]
+                    if len(values) > 0:
+                        roll[c + '_min'][i] = values.min()
+                        roll[c + '_max'][i] = values.max()
+                        roll[c + '_mean'][i] = values.mean()
+
+    def range(self, t0, t1):
+        """Return a copy of the rows with t0 <= t < t1."""
+        times = self.data['t'][:self.n]
+        i0 = np.searchsorted(times, t0, side='left')
+        i1 = np.searchsorted(times, t1, side='left')
+        return np.array(self.data[i0:i1])
+
+    def rollup_range(self, kind, t0, t1):
+        """Return a copy of the rollup buckets starting between t0 and t1 that have data."""
+        width, n_rows = self.ROLLUPS[kind]
+        i0 = max(int((t0 - self.t_start)//width), 0)
+        i1 = min(int(np.ceil((t1 - self.t_start)/width)), n_rows)
+        if i1 <= i0:
+            return np.zeros(0, dtype=rollup_dtype(self.columns))
+        roll = np.array(self.rollups[kind][i0:i1])
+        return roll[roll['n'] > 0]
+
+    def flush(self):
+        """Write the dirty pages of all the memmaps to disk."""
+        for mm in [self.data] + list(self.rollups.values()):
+            mm.flush()
+
+
+class ObservationHistory:
+    """Append only history of observations, kept in memory mapped files with one file per month."""
+
+    def __init__(self, data_dir=None, columns=HISTORY_COLUMNS, flush_interval=15*60, debug=0):
+        if data_dir is None:
+            data_dir = os.path.join(os.getenv("HOME", "."), ".local", "share", "Qt_clock", "history")
+        self.data_dir = data_dir
+        self.columns = columns
+        self.dtype = history_dtype(columns)
+        self.flush_interval = flush_interval
+        self.debug = debug
+        self.buffer = []         # Samples not yet written to disk.
+        self.last_flush = timesource.time()
+        self.last_t = -np.inf
+        self.months = {}         # Open MonthFile objects, by start time.
+        try:
+            os.makedirs(self.data_dir, exist_ok=True)
+            latest = self.month(month_start(timesource.time()))
+            if latest.n > 0:
+                self.last_t = float(latest.data['t'][latest.n - 1])
+        except OSError as e:
+            print("Could not open the observation history in {}: {}".format(self.data_dir, e))
+
+    def month(self, start):
+        """Return the MonthFile starting at datetime start."""
+        if start not in self.months:
+            self.months[start] = MonthFile(self.data_dir, start, self.columns)
+        return self.months[start]
+
+    def append(self, t, **values):
+        """Add a sample at time t (UTC seconds). Samples not newer than the last one are ignored.
+        Missing or invalid values are stored as NaN."""
+        if t <= self.last_t:
+            return False
+        row = [t]
+        for c in self.columns:
+            try:
+                row.append(float(values.get(c)))
+            except (TypeError, ValueError):
+                row.append(np.nan)
+        self.buffer.append(tuple(row))
+        self.last_t = t
+        if timesource.time() - self.last_flush > self.flush_interval:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Write the buffered samples to the month files."""
+        self.last_flush = timesource.time()
+        if len(self.buffer) == 0:
+            return
+        rows = np.array(self.buffer, dtype=self.dtype)
+        self.buffer = []
+        try:
+            start = month_start(rows['t'][0])
+            while len(rows) > 0:
+                end = next_month(start).timestamp()
+                n = np.searchsorted(rows['t'], end, side='left')
+                if n > 0:
+                    mf = self.month(start)
+                    written = mf.append(rows[:n])
+                    mf.flush()
+                    if written < n:
+                        print("Observation history for {} is full.".format(start.strftime("%Y-%m")))
+                rows = rows[n:]
+                start = next_month(start)
+        except OSError as e:
+            print("Could not write the observation history: ", e)
+        if self.debug:
+            print("Flushed the observation history.")
+
+    def months_between(self, t0, t1):
+        """The MonthFile objects overlapping t0 to t1 that exist on disk."""
+        start = month_start(max(t0, 0))
+        result = []
+        while start.timestamp() < t1:
+            if start in self.months or os.path.exists(os.path.join(self.data_dir, start.strftime("obs_%Y-%m.dat"))):
+                result.append(self.month(start))
+            start = next_month(start)
+        return result
+
+    def range(self, t0, t1):
+        """Return the samples with t0 <= t < t1 as a structured array, including unflushed ones."""
+        parts = [mf.range(t0, t1) for mf in self.months_between(t0, t1)]
+        if len(self.buffer) > 0:
+            buf = np.array(self.buffer, dtype=self.dtype)
+            parts.append(buf[(buf['t'] >= t0) & (buf['t'] < t1)])
+        if len(parts) == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.concatenate(parts)
+
+    def rollup(self, kind, t0, t1):
+        """Return the "hourly" or "daily" min/max/mean buckets between t0 and t1. Unflushed samples
+        are not included."""
+        parts = [mf.rollup_range(kind, t0, t1) for mf in self.months_between(t0, t1)]
+        if len(parts) == 0:
+            return np.zeros(0, dtype=rollup_dtype(self.columns))
+        return np.concatenate(parts)
+
+    def close(self):
+        """Flush and close all month files."""
+        self.flush()
+        self.months = {}
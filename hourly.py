@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+#
+# Hourly forecast strip for the Weather tab.
+#
+# The forecastHourly has ~156 periods, too many to give each its own widget like the
+# QWeatherInfoIcon buttons for the 14 day/night periods. The strip is a single widget that
+# paints the items directly: the data is kept in flat lists, and a paintEvent only draws the
+# handful of items that are visible at the current scroll offset, so painting and scrolling
+# cost the same no matter how many periods there are. The icons are rendered once per icon
+# file into a pixmap and then reused. When there is a griddata.GridData, each item also gets the
+# dew point, and a bar under the time for the sky cover.
+#
+# Scrolling is kinetic: the next/prev buttons give the strip a push of about one page, and it
+# can be swiped. Either way it coasts to a stop under friction, driven by a 60 Hz timer that
+# only runs while the strip is moving.
+#
+import time
+
+import numpy as np
+from qtpy.QtWidgets import QWidget
+from qtpy.QtGui import QColor, QPainter, QPixmap, QFont
+from qtpy.QtCore import Qt, Slot, QTimer, QRectF
+try:
+    from qtpy.QtSvg import QSvgRenderer
+except ImportError:
+    from qtpy.QtSvgWidgets import QSvgRenderer
+
+import metrics
+import tracing
+
+
+class QHourlyStrip(QWidget):
+    """Horizontally scrolling strip with one item per hourly forecast period."""
+
+    item_width = 64
+    icon_size = 48
+    friction = 2.5        # Velocity decay per second, as a fraction.
+    min_velocity = 20.    # Pixels per second below which the strip stops.
+
+    def __init__(self, pos, size=(768, 120), parent=None, debug=0):
+        super(QHourlyStrip, self).__init__(parent)
+        self.setObjectName("hourly")
+        self.debug = debug
+        self.setGeometry(pos[0], pos[1], size[0], size[1])
+        self.times = []
+        self.temps = []
+        self.pops = []
+        self.icons = []
+        self.dew_points = []
+        self.sky_cover = []
+        self.icon_cache = {}   # icon file -> QPixmap
+        self.offset = 0.       # Scroll position in pixels.
+        self.velocity = 0.     # Pixels per second.
+        self.last_tick = None
+        self.drag_x = None
+        self.drag_samples = []  # (time, x) of the last mouse moves, for the swipe velocity.
+        self.font = QFont()
+        self.font.setPointSize(9)
+        self.temp_color = QColor(0, 180, 190)
+        self.pop_color = QColor(0, 120, 200)
+        self.dew_color = QColor(0, 140, 140)
+        self.sky_color = QColor(120, 120, 120)
+        self.timer = QTimer(self)
+        self.timer.setInterval(16)
+        self.timer.timeout.connect(self.tick)
+
+    def set_periods(self, periods, icon_files, grid=None):
+        """Set the strip from the hourly models.ForecastPeriod list and the icon file for each period.
+        The dew point and sky cover come from the griddata.GridData grid, when there is one."""
+        self.times = [period.start.strftime("%a %Hh") for period in periods]
+        self.temps = [period.temperature for period in periods]
+        self.pops = [period.pop for period in periods]
+        self.icons = list(icon_files)
+        if grid is not None and len(periods) > 0:
+            starts = np.array([period.start.timestamp() for period in periods])
+            self.dew_points = grid.at("dewpoint", starts).tolist()
+            self.sky_cover = grid.at("skyCover", starts).tolist()
+        else:
+            self.dew_points = self.sky_cover = [np.nan]*len(periods)
+        self.offset = min(self.offset, self.max_offset())
+        self.update()
+
+    def max_offset(self):
+        """Largest scroll offset, where the last item is at the right edge."""
+        return max(len(self.times)*self.item_width - self.width(), 0)
+
+    def icon_pixmap(self, icon_file):
+        """The rendered icon, from the cache."""
+        metrics.cache("hourly_icons", icon_file in self.icon_cache)
+        if icon_file not in self.icon_cache:
+            start = time.perf_counter()
+            pix = QPixmap(self.icon_size, self.icon_size)
+            pix.fill(Qt.transparent)
+            painter = QPainter(pix)
+            QSvgRenderer(icon_file).render(painter)
+            painter.end()
+            self.icon_cache[icon_file] = pix
+            metrics.observe(metrics.renders, "hourly_icon", time.perf_counter() - start)
+        return self.icon_cache[icon_file]
+
+    @tracing.traced("QHourlyStrip.paintEvent", "paint")
+    @metrics.timed_paint("hourly_strip")
+    def paintEvent(self, event):
+        """Paint only the items that are visible."""
+        if len(self.times) == 0:
+            return
+        painter = QPainter(self)
+        painter.setFont(self.font)
+        first = max(int(self.offset//self.item_width), 0)
+        last = min(int((self.offset + self.width())//self.item_width) + 1, len(self.times))
+        for i in range(first, last):
+            x = i*self.item_width - self.offset
+            painter.setPen(self.temp_color)
+            painter.drawText(QRectF(x, 0, self.item_width, 16), Qt.AlignCenter, self.times[i])
+            if np.isfinite(self.sky_cover[i]):
+                painter.fillRect(QRectF(x + 4, 16, (self.item_width - 8)*self.sky_cover[i]/100., 2), self.sky_color)
+            painter.drawPixmap(int(x + (self.item_width - self.icon_size)/2), 18, self.icon_pixmap(self.icons[i]))
+            painter.drawText(QRectF(x, 70, self.item_width, 18), Qt.AlignCenter, "{:4.1f} C".format(self.temps[i]))
+            if self.pops[i]:
+                painter.setPen(self.pop_color)
+                painter.drawText(QRectF(x, 90, self.item_width, 18), Qt.AlignCenter, "{:.0f}%".format(self.pops[i]))
+            if np.isfinite(self.dew_points[i]):
+                painter.setPen(self.dew_color)
+                painter.drawText(QRectF(x, 104, self.item_width, 16), Qt.AlignCenter,
+                                 "dp {:.0f} C".format(self.dew_points[i]))
+
+    def scroll_to(self, offset):
+        """Set the scroll offset, clamped to the data, and repaint if it changed."""
+        offset = min(max(offset, 0.), float(self.max_offset()))
+        if offset != self.offset:
+            self.offset = offset
+            self.update()
+            return True
+        return False
+
+    def fling(self, velocity):
+        """Start coasting with velocity in pixels per second."""
+        self.velocity = velocity
+        self.last_tick = time.monotonic()
+        if not self.timer.isActive():
+            self.timer.start()
+
+    @Slot()
+    def scroll_page(self, direction):
+        """Push the strip about one page to the right (direction=1) or left (direction=-1)."""
+        # Distance coasted with exponential decay is v/friction.
+        self.fling(direction*self.width()*self.friction)
+
+    @Slot()
+    def tick(self):
+        """Advance the kinetic scroll."""
+        now = time.monotonic()
+        dt = now - self.last_tick
+        self.last_tick = now
+        moved = self.scroll_to(self.offset + self.velocity*dt)
+        self.velocity *= max(1. - self.friction*dt, 0.)
+        if not moved or abs(self.velocity) < self.min_velocity:
+            self.velocity = 0.
+            self.timer.stop()
+
+    def mousePressEvent(self, event):
+        """Start a swipe, which also stops any coasting."""
+        self.timer.stop()
+        self.drag_x = event.pos().x()
+        self.drag_samples = [(time.monotonic(), self.drag_x)]
+
+    def mouseMoveEvent(self, event):
+        if self.drag_x is None:
+            return
+        x = event.pos().x()
+        self.scroll_to(self.offset - (x - self.drag_x))
+        self.drag_x = x
+        self.drag_samples = self.drag_samples[-4:] + [(time.monotonic(), x)]
+
+    def mouseReleaseEvent(self, event):
+        """End the swipe, and coast with the speed of the last few moves."""
+        if self.drag_x is None:
+            return
+        self.drag_x = None
+        (t0, x0), (t1, x1) = self.drag_samples[0], self.drag_samples[-1]
+        if t1 - t0 > 0:
+            self.fling(-(x1 - x0)/(t1 - t0))
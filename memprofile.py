@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+#
+# Memory profiling mode, to find what makes the resident memory creep over weeks.
+#
+# tracemalloc records where every Python allocation was made. Every interval a snapshot is taken
+# and compared to the previous one, and the growth is split into categories by the first frame of
+# the allocation traceback that is in one of our modules: the moon images, the tides, and the
+# observations (the weather, the observation history and the trends). Everything else is "other".
+# The Qt side is counted as well: the live QObjects by class below the clock, and the number and
+# size of the QPixmaps and QImages held from Python.
+#
+# Each report is a JSON line in a rotating log, ~/.cache/Qt_clock/memprofile.log by default, with
+# the totals, the change since the previous report and the change since the start.
+#
+# tracemalloc makes the allocations about twice as slow, and a report takes seconds, during which
+# the clock stands still, so this is for finding a leak, not for normal use. Start it as early as possible, so the
+# allocations made while the clock is set up are traced too.
+#
+import os
+import gc
+import json
+import time
+import tracemalloc
+import logging
+import logging.handlers
+from collections import Counter
+
+from qtpy.QtCore import QObject, QTimer
+from qtpy.QtGui import QPixmap, QPixmapCache, QImage
+
+import metrics
+import timesource
+
+# The modules of each category. An allocation goes to the category of the innermost frame in one of them.
+CATEGORIES = {
+    "moon": ("moon.py",),
+    "tides": ("tides.py",),
+    "observations": ("weather.py", "models.py", "history.py", "trends.py", "griddata.py", "hourly.py"),
+}
+TOP = os.path.dirname(os.path.abspath(__file__))
+MODULE_CATEGORY = {os.path.join(TOP, module): category for category, modules in CATEGORIES.items()
+                   for module in modules}
+
+TRACE_FRAMES = 6
+
+
+def start_tracing(frames=TRACE_FRAMES):
+    """Start tracemalloc, keeping frames frames of each allocation traceback."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def category(traceback):
+    """The category of an allocation traceback, and the frame that decided it (None for "other")."""
+    for frame in reversed(traceback):     # Most recent call first.
+        cat = MODULE_CATEGORY.get(frame.filename)
+        if cat is not None:
+            return cat, frame
+    return "other", None
+
+
+def qobject_counts(root):
+    """The number of QObjects below root, by class name."""
+    counts = Counter(obj.metaObject().className() for obj in root.findChildren(QObject))
+    counts[root.metaObject().className()] += 1
+    return counts
+
+
+def pixmap_counts():
+    """Number and bytes of the QPixmaps and QImages held from Python."""
+    counts = {"QPixmap": 0, "QPixmap_bytes": 0, "QImage": 0, "QImage_bytes": 0}
+    for obj in gc.get_objects():
+        if isinstance(obj, QPixmap):
+            counts["QPixmap"] += 1
+            counts["QPixmap_bytes"] += obj.width()*obj.height()*obj.depth()//8
+        elif isinstance(obj, QImage):
+            counts["QImage"] += 1
+            counts["QImage_bytes"] += obj.sizeInBytes()
+    return counts
+
+
+def diff(new, old):
+    """The changed values of dict new compared to old."""
+    return {key: new.get(key, 0) - old.get(key, 0) for key in set(new) | set(old)
+            if new.get(key, 0) != old.get(key, 0)}
+
+
+class MemoryProfiler:
+    """Take tracemalloc snapshots and Qt object counts every interval, and log the differences."""
+
+    def __init__(self, root, interval=600., log_file=None, max_bytes=1024*1024, backups=3, top=10, debug=0):
+        """root is the widget below which the QObjects are counted, interval is in seconds."""
+        self.root = root
+        self.interval = interval
+        self.top = top
+        self.debug = debug
+        if log_file is None:
+            log_file = os.path.join(os.getenv("HOME", "."), ".cache", "Qt_clock", "memprofile.log")
+        self.log_file = log_file
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        self.log = logging.getLogger("Qt_clock.memprofile")
+        self.log.propagate = False
+        self.log.setLevel(logging.INFO)
+        self.handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backups)
+        self.log.addHandler(self.handler)
+        self.first = None       # (totals, qobjects) at the start.
+        self.previous = None    # (snapshot, totals, qobjects) of the last report.
+        self.n_reports = 0
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.report)
+
+    def start(self):
+        """Take the first snapshot and start the timer."""
+        start_tracing()
+        self.previous = self.take()
+        self.previous[1].update(self.categories(self.previous[0], None)[0])
+        self.first = self.previous[1:]
+        self.timer.start(timesource.interval(int(self.interval*1000)))
+
+    def stop(self):
+        """Write a last report and stop."""
+        self.timer.stop()
+        if self.previous is not None:
+            self.report()
+        self.log.removeHandler(self.handler)
+        self.handler.close()
+
+    def take(self):
+        """A snapshot and the totals of the Qt objects and the memory."""
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot()
+        totals = {"rss": metrics.rss(), "traced": tracemalloc.get_traced_memory()[0]}
+        totals.update(pixmap_counts())
+        return snapshot, totals, qobject_counts(self.root)
+
+    def categories(self, snapshot, old_snapshot):
+        """The bytes per category, and the top growing allocation sites since old_snapshot.
+        Grouping by traceback is the slow part, so it is done once for both."""
+        if old_snapshot is None:
+            stats = snapshot.statistics("traceback")
+        else:
+            stats = snapshot.compare_to(old_snapshot, "traceback")
+        sizes = dict.fromkeys(list(CATEGORIES) + ["other"], 0)
+        for stat in stats:
+            sizes[category(stat.traceback)[0]] += stat.size
+        top = []
+        for stat in sorted(stats, key=lambda s: getattr(s, "size_diff", 0), reverse=True)[:self.top]:
+            if getattr(stat, "size_diff", 0) <= 0:
+                break
+            cat, frame = category(stat.traceback)
+            frame = frame or stat.traceback[-1]
+            top.append({"site": "{}:{}".format(frame.filename, frame.lineno), "category": cat,
+                        "bytes": stat.size_diff, "blocks": stat.count_diff})
+        return {"bytes_" + cat: size for cat, size in sizes.items()}, top
+
+    def report(self):
+        """Compare a new snapshot to the previous one and the first one, and log it."""
+        start = time.perf_counter()
+        snapshot, totals, qobjects = self.take()
+        sizes, top = self.categories(snapshot, self.previous[0])
+        totals.update(sizes)
+        record = {
+            "time": timesource.utcnow().isoformat(timespec="seconds"),
+            "report": self.n_reports,
+            "totals": totals,
+            "delta": diff(totals, self.previous[1]),
+            "delta_since_start": diff(totals, self.first[0]),
+            "top": top,
+            "qobjects": sum(qobjects.values()),
+            "qobjects_delta": diff(qobjects, self.previous[2]),
+            "qobjects_delta_since_start": diff(qobjects, self.first[1]),
+            # Qt does not tell how much of the QPixmapCache is used, only the limit (in kB).
+            "pixmap_cache_limit_kb": QPixmapCache.cacheLimit(),
+            "seconds": time.perf_counter() - start,
+        }
+        self.log.info(json.dumps(record))
+        self.handler.flush()
+        self.previous = (snapshot, totals, qobjects)
+        self.n_reports += 1
+        if self.debug:
+            print("Memory: rss {:+.1f} MB, traced {:+.1f} MB, {} QObjects ({:+d}), {}".format(
+                record["delta"].get("rss", 0)/2**20, record["delta"].get("traced", 0)/2**20, record["qobjects"],
+                sum(record["qobjects_delta"].values()),
+                ", ".join("{} {:+.0f} kB".format(cat, record["delta"].get("bytes_" + cat, 0)/1024)
+                          for cat in list(CATEGORIES) + ["other"])))
+        return record
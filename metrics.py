@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+#
+# Metrics in the Prometheus text format, served on a local HTTP endpoint.
+#
+# The counters and histograms are plain Python objects that are updated in place: the upstream
+# requests (through fetch.get()), the paintEvent durations (the @timed_paint decorator), the time
+# to render the moon and the icons, the cache hits and misses, the event loop lag from the
+# monitor.LoopMonitor, and the resident memory. Nothing is recorded unless enable() was called,
+# so without --metrics the only cost is a check of a module flag.
+#
+# The endpoint listens on the loopback interface by default. For scraping many clocks from one
+# host, bind to the LAN address with --metrics HOST:PORT, or forward the port.
+#
+import os
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from monitor import LAG_BUCKETS
+
+ENABLED = False
+DEFAULT_PORT = 9105
+
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30.)
+PAINT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5)
+
+lock = threading.Lock()
+upstreams = {}      # host -> Upstream
+paints = {}         # widget -> Histogram
+renders = {}        # what -> Histogram
+caches = {}         # name -> [hits, misses]
+monitor = None      # monitor.LoopMonitor for the event loop lag.
+server = None
+
+
+class Histogram:
+    """A histogram with fixed buckets, like a Prometheus histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        """The lines for the text format, with labels a string like 'widget="clock"'."""
+        out = []
+        total = 0
+        for edge, count in zip(self.buckets, self.counts):
+            total += count
+            out.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, edge, total))
+        out.append('{}_bucket{{{},le="+Inf"}} {}'.format(name, labels, self.count))
+        out.append('{}_sum{{{}}} {:.6f}'.format(name, labels, self.sum))
+        out.append('{}_count{{{}}} {}'.format(name, labels, self.count))
+        return out
+
+
+class Upstream:
+    """Request statistics for one upstream host."""
+
+    def __init__(self):
+        self.latency = Histogram(REQUEST_BUCKETS)
+        self.errors = 0
+        self.bytes = 0
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def observe_request(url, seconds, error=False, nbytes=0):
+    """Record a request to url, which took seconds."""
+    if not ENABLED:
+        return
+    host = urlsplit(url).hostname or "unknown"
+    with lock:
+        upstream = upstreams.get(host)
+        if upstream is None:
+            upstream = upstreams[host] = Upstream()
+        upstream.latency.observe(seconds)
+        upstream.errors += error
+        upstream.bytes += nbytes
+
+
+def observe(table, name, seconds, buckets=PAINT_BUCKETS):
+    """Record a duration in paints or renders."""
+    if not ENABLED:
+        return
+    with lock:
+        hist = table.get(name)
+        if hist is None:
+            hist = table[name] = Histogram(buckets)
+        hist.observe(seconds)
+
+
+def cache(name, hit):
+    """Count a hit (hit=True) or miss of the cache name."""
+    if not ENABLED:
+        return
+    with lock:
+        counts = caches.setdefault(name, [0, 0])
+        counts[0 if hit else 1] += 1
+
+
+def timed_paint(name):
+    """Decorator for a paintEvent, to record how long it takes as widget name."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, event):
+            if not ENABLED:
+                return func(self, event)
+            start = time.perf_counter()
+            try:
+                return func(self, event)
+            finally:
+                observe(paints, name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def rss():
+    """Resident memory in bytes, or the peak if the current is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        import sys
+        scale = 1 if sys.platform == "darwin" else 1024    # Bytes on the Mac, kB on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*scale
+
+
+def header(name, kind, text):
+    return ["# HELP {} {}".format(name, text), "# TYPE {} {}".format(name, kind)]
+
+
+def render():
+    """All the metrics in the Prometheus text format."""
+    out = []
+    with lock:
+        out += header("qt_clock_http_requests_total", "counter", "Requests per upstream host.")
+        out += ['qt_clock_http_requests_total{{upstream="{}"}} {}'.format(h, u.latency.count)
+                for h, u in upstreams.items()]
+        out += header("qt_clock_http_errors_total", "counter", "Failed requests per upstream host.")
+        out += ['qt_clock_http_errors_total{{upstream="{}"}} {}'.format(h, u.errors) for h, u in upstreams.items()]
+        out += header("qt_clock_http_bytes_total", "counter", "Bytes received per upstream host.")
+        out += ['qt_clock_http_bytes_total{{upstream="{}"}} {}'.format(h, u.bytes) for h, u in upstreams.items()]
+        out += header("qt_clock_http_request_seconds", "histogram", "Request latency per upstream host.")
+        for h, u in upstreams.items():
+            out += u.latency.lines("qt_clock_http_request_seconds", 'upstream="{}"'.format(h))
+        out += header("qt_clock_paint_seconds", "histogram", "Duration of the paintEvent per widget.")
+        for name, hist in paints.items():
+            out += hist.lines("qt_clock_paint_seconds", 'widget="{}"'.format(name))
+        out += header("qt_clock_render_seconds", "histogram", "Time to decode and scale the images, and to parse the grid data.")
+        for name, hist in renders.items():
+            out += hist.lines("qt_clock_render_seconds", 'image="{}"'.format(name))
+        out += header("qt_clock_cache_hits_total", "counter", "Cache hits.")
+        out += ['qt_clock_cache_hits_total{{cache="{}"}} {}'.format(n, c[0]) for n, c in caches.items()]
+        out += header("qt_clock_cache_misses_total", "counter", "Cache misses.")
+        out += ['qt_clock_cache_misses_total{{cache="{}"}} {}'.format(n, c[1]) for n, c in caches.items()]
+    if monitor is not None:
+        lag = Histogram(LAG_BUCKETS)
+        lag.counts, lag.sum, lag.count = list(monitor.counts), monitor.sum, monitor.n
+        out += header("qt_clock_loop_lag_seconds", "histogram", "Lateness of the one second clock tick.")
+        out += lag.lines("qt_clock_loop_lag_seconds", 'timer="clock"')
+        out += header("qt_clock_gui_stalls_total", "counter", "Times the GUI thread was blocked.")
+        out += ["qt_clock_gui_stalls_total {}".format(monitor.n_stalls)]
+    out += header("qt_clock_resident_memory_bytes", "gauge", "Resident memory of the process.")
+    out += ["qt_clock_resident_memory_bytes {}".format(rss())]
+    return "\n".join(out) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(address="127.0.0.1", port=DEFAULT_PORT):
+    """Enable the metrics and serve them on a daemon thread."""
+    global server
+    enable()
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def shutdown():
+    global server
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server = None
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# Compact records for the weather.gov forecasts and observations.
+#
+# The responses are converted once, right after they come in, into small __slots__ objects
+# with the units normalized to SI (temperature C, pressure Pa, wind m/s, humidity %), and the
+# raw JSON is dropped. The widgets then only read attributes, instead of walking nested dicts
+# and converting units on every update.
+#
+import re
+from datetime import datetime
+
+WIND_RE = re.compile(r"([\d.]+)(?:\s*to\s*([\d.]+))?\s*(mph|km/h|kt|m/s)?")
+WIND_FACTORS = {"mph": 0.44704, "km/h": 1/3.6, "kt": 0.514444, "m/s": 1., None: 1/3.6}
+UNIT_FACTORS = {
+    # weather.gov unitCode -> (scale, offset) to SI
+    "wmoUnit:degC": (1., 0.),
+    "wmoUnit:degF": (5./9., -32.*5./9.),
+    "wmoUnit:Pa": (1., 0.),
+    "wmoUnit:km_h-1": (1/3.6, 0.),
+    "wmoUnit:m_s-1": (1., 0.),
+    "wmoUnit:percent": (1., 0.),
+    "wmoUnit:degree_(angle)": (1., 0.),
+    "wmoUnit:m": (1., 0.),
+}
+
+
+def to_celsius(temp, unit):
+    """Convert a forecast temperature with temperatureUnit "C" or "F" to C."""
+    if temp is None:
+        return None
+    if unit == "F":
+        return (temp - 32)*5./9.
+    return float(temp)
+
+
+def wind_speed(text):
+    """Convert a forecast wind speed like "5 to 10 mph" to m/s, taking the high end of a range."""
+    match = WIND_RE.search(text or "")
+    if match is None:
+        return None
+    speed = float(match.group(2) or match.group(1))
+    return speed*WIND_FACTORS[match.group(3)]
+
+
+def quantity(js, key):
+    """Convert an observation quantity {"unitCode": ..., "value": ...} to SI, or None."""
+    q = js.get(key)
+    if not isinstance(q, dict) or q.get('value') is None:
+        return None
+    scale, offset = UNIT_FACTORS.get(q.get('unitCode'), (1., 0.))
+    return float(q['value'])*scale + offset
+
+
+class ForecastPeriod:
+    """One period of a forecast (day/night or hourly)."""
+    __slots__ = ("number", "name", "start", "end", "is_daytime", "temperature", "pop", "wind_speed",
+                 "wind_direction", "icon", "short_forecast", "detailed_forecast")
+
+    def __init__(self, js):
+        self.number = js.get('number', 0)
+        self.name = js.get('name', "")
+        self.start = datetime.fromisoformat(js['startTime'])
+        self.end = datetime.fromisoformat(js['endTime']) if 'endTime' in js else self.start
+        self.is_daytime = js.get('isDaytime', True)
+        self.temperature = to_celsius(js.get('temperature'), js.get('temperatureUnit', "C"))
+        pop = js.get('probabilityOfPrecipitation')
+        self.pop = pop.get('value') if isinstance(pop, dict) else None
+        self.wind_speed = wind_speed(js.get('windSpeed'))
+        self.wind_direction = js.get('windDirection', "")
+        self.icon = js.get('icon', "")
+        self.short_forecast = js.get('shortForecast', "")
+        self.detailed_forecast = js.get('detailedForecast', "")
+
+
+class Forecast:
+    """A forecast: the update time and the list of periods."""
+    __slots__ = ("update_time", "periods")
+
+    def __init__(self, js):
+        """Initialize from the "properties" of the forecast JSON."""
+        self.update_time = datetime.fromisoformat(js['updateTime'])
+        self.periods = [ForecastPeriod(p) for p in js['periods']]
+
+
+class Observation:
+    """The latest observation from a weather station."""
+    __slots__ = ("timestamp", "temperature", "dewpoint", "pressure", "humidity", "wind_speed",
+                 "wind_direction", "description", "icon")
+
+    def __init__(self, js):
+        """Initialize from the "properties" of the observation JSON."""
+        self.timestamp = datetime.fromisoformat(js['timestamp'])
+        self.temperature = quantity(js, 'temperature')
+        self.dewpoint = quantity(js, 'dewpoint')
+        self.pressure = quantity(js, 'seaLevelPressure')
+        self.humidity = quantity(js, 'relativeHumidity')
+        self.wind_speed = quantity(js, 'windSpeed')
+        self.wind_direction = quantity(js, 'windDirection')
+        self.description = js.get('textDescription', "")
+        self.icon = js.get('icon') or ""
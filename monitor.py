@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+#
+# Event loop latency monitor and GUI stall detector.
+#
+# The Clock_widget.timer fires once a second, and calls tick(). How late a tick comes compared to
+# one second after the previous one is the time the event loop was busy with something else, so
+# it is a direct measure of how sluggish the clock is. The lags are kept in a histogram with
+# fixed buckets, which is cheap, never grows, and gives the p50/p99.
+#
+# When the GUI thread is blocked, it does not run any Python code, so it cannot report that
+# itself. A watchdog thread checks the time of the last tick, and when it is more than the
+# threshold overdue it dumps the Python stacks of all threads with faulthandler to the log file.
+# The stack of the main thread then shows what blocked it, e.g. a requests.get() or an image
+# decode. There is one dump per stall.
+#
+import os
+import time
+import threading
+import faulthandler
+from bisect import bisect_left
+
+# Upper edges of the histogram buckets in seconds, the last bucket is everything above.
+LAG_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1., 2., 5., 10., 30., 60.)
+
+
+class LoopMonitor:
+    """Measure the lateness of the one second ticks, and dump the stacks on a stall."""
+
+    def __init__(self, threshold=2., interval=1., log_file=None, debug=0):
+        """threshold is the time in seconds a tick can be overdue before the stacks are dumped."""
+        self.debug = debug
+        self.threshold = threshold
+        self.interval = interval
+        if log_file is None:
+            log_file = os.path.join(os.getenv("HOME", "."), ".cache", "Qt_clock", "stalls.log")
+        self.log_file = log_file
+        self.log = None
+        self.counts = [0]*(len(LAG_BUCKETS) + 1)
+        self.n = 0
+        self.sum = 0.
+        self.max = 0.
+        self.n_stalls = 0
+        self.last_tick = None
+        self.dumped = False
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Open the log and start the watchdog thread."""
+        os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+        self.log = open(self.log_file, "a")
+        self.last_tick = time.monotonic()
+        self.thread = threading.Thread(target=self.watchdog, name="LoopMonitor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the watchdog and close the log."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def tick(self):
+        """Called from the GUI thread at the start of each timer tick."""
+        now = time.monotonic()
+        if self.last_tick is not None:
+            lag = max(now - self.last_tick - self.interval, 0.)
+            self.counts[bisect_left(LAG_BUCKETS, lag)] += 1
+            self.n += 1
+            self.sum += lag
+            if lag > self.max:
+                self.max = lag
+            if self.debug > 1 and lag > 0.1:
+                print("Event loop lag {:.0f} ms".format(lag*1000))
+        self.last_tick = now
+        self.dumped = False
+
+    def percentile(self, p):
+        """The upper edge of the bucket that holds the p-th percentile of the lags."""
+        if self.n == 0:
+            return 0.
+        target = p/100.*self.n
+        total = 0
+        for i, count in enumerate(self.counts):
+            total += count
+            if total >= target:
+                return min(LAG_BUCKETS[i], self.max) if i < len(LAG_BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        """A line with the lag statistics."""
+        return "Event loop lag: {} ticks, p50 <= {:.0f} ms, p99 <= {:.0f} ms, max {:.0f} ms, {} stalls".format(
+            self.n, self.percentile(50)*1000, self.percentile(99)*1000, self.max*1000, self.n_stalls)
+
+    def watchdog(self):
+        """Thread that dumps the stacks of all threads when the GUI thread stops ticking."""
+        while not self.stop_event.wait(self.threshold/4):
+            overdue = time.monotonic() - self.last_tick - self.interval
+            if overdue > self.threshold and not self.dumped:
+                self.dumped = True
+                self.n_stalls += 1
+                self.log.write("=== {} GUI thread blocked for {:.1f} s\n".format(
+                    time.strftime("%Y-%m-%d %H:%M:%S"), overdue + self.interval))
+                self.log.flush()
+                faulthandler.dump_traceback(file=self.log, all_threads=True)
+                self.log.flush()
+                if self.debug:
+                    print("GUI thread blocked for {:.1f} s, stacks written to {}".format(
+                        overdue + self.interval, self.log_file))
@@ -46,18 +46,39 @@ import dateutil.parser as datparser
 
 from qtpy.QtWidgets import QApplication, QWidget, QLabel
 from qtpy.QtGui import QPixmap, QImage
-from qtpy.QtCore import Qt, QFile, Slot, QTimer, QRect
-import requests
+from qtpy.QtCore import Qt, QFile, Signal, Slot, QTimer, QRect
 import os
+import time
+import asyncio
+
+import fetch
+import metrics
+import tracing
+import timesource
+import fetchproc
+import aio
+
+
+def decode_image(data, extension, size):
+    """Decode an image from the web, crop the middle square, and scale it to size x size.
+    Returns a QImage, or None if it could not be decoded. Safe to run off the GUI thread."""
+    image = QImage()
+    if not image.loadFromData(data, extension):
+        return None
+    offset = (image.width() - image.height())//2
+    image = image.copy(QRect(offset, 0, image.height(), image.height()))
+    return image.scaled(size, size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
 
 
 class QMoon(QWidget):
     """Small widget displays today's moon."""
 
+    image_ready = Signal(object, float)   # The Future of the fetch process, and the start time.
+
     def __init__(self, pos=(0, 0), parent=None, date=None, size=216, web=False, save=False, debug=0):
         super(QMoon, self).__init__(parent)
         self.total_images = 8760
-        self.moon_domain = "https://svs.gsfc.nasa.gov" # "https://svs.gsfc.nasa.gov"
+        self.moon_domain = fetch.upstream_url("https://svs.gsfc.nasa.gov")  # Or the stand-in of fixtures.py
         self.moon_path_2021 = "/vis/a000000/a004800/a004874/"
         self.moon_path_2022 = "/vis/a000000/a004900/a004955/"
         self.moon_path_2023 = "/vis/a000000/a005000/a005048/"
@@ -73,11 +94,12 @@ class QMoon(QWidget):
         self.date = date
         self.moon = QLabel(self)
         self.moon.setGeometry(pos[0], pos[1], self.size, self.size)
+        self.image_ready.connect(self.show_image)
         self.update()
 
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update)
-        self.timer.start(3600*1000)
+        self.timer.start(timesource.interval(3600*1000))
         self.image = None
         self.pixmap = None
         self.moon_image_number = 1
@@ -86,7 +108,44 @@ class QMoon(QWidget):
     def update(self):
         if self.debug > 0:
             print("Updating the Moon Phase pixmap.")
+        start = time.perf_counter()
+        web = (fetchproc.worker is not None or aio.loop is not None) and self.from_web()
+        if web and fetchproc.worker is not None:
+            # Fetched, decoded and scaled in the fetch process, shown by show_image when it is done.
+            url, extension = self.moon_url()
+            future = fetchproc.worker.moon_image(url, extension, self.size)
+            future.add_done_callback(lambda f, t=start: self.image_ready.emit(f, t))
+            return
+        if web:
+            name = "moon-{}".format(id(self))
+            if not aio.running(name):
+                aio.spawn(self.update_async(start), name)
+            return
         self.pixmap = self.get_moon_image()
+        metrics.observe(metrics.renders, "moon", time.perf_counter() - start)
+        self.moon.setPixmap(self.pixmap)
+
+    async def update_async(self, start):
+        """Get the image from the web as a coroutine, for aio.py. The decode and scale run on a thread."""
+        url, extension = self.moon_url()
+        status, data = await aio.client.get(url)
+        image = await asyncio.to_thread(decode_image, data, extension, self.size) if status < 400 else None
+        if image is None:
+            print("Could not get the moon image: HTTP {} for {}".format(status, url))
+            return
+        self.pixmap = QPixmap.fromImage(image)
+        metrics.observe(metrics.renders, "moon", time.perf_counter() - start)
+        self.moon.setPixmap(self.pixmap)
+
+    @Slot(object, float)
+    def show_image(self, future, start):
+        """Show the moon image from the fetch process."""
+        try:
+            self.pixmap = future.result().pixmap()
+        except Exception as e:
+            print("Could not get the moon image:", e)
+            return
+        metrics.observe(metrics.renders, "moon", time.perf_counter() - start)
         self.moon.setPixmap(self.pixmap)
 
     def get_moon_image_number(self):
@@ -95,7 +154,7 @@ class QMoon(QWidget):
         #
         if self.date is None:
 #            now = datetime.utcnow()
-            now = datetime.now(timezone.utc)
+            now = timesource.utcnow()
         else:
             now = self.date
         if self.debug:
@@ -106,38 +165,51 @@ class QMoon(QWidget):
             print(f"Moon_image_number: {self.moon_image_number}")
         return self.moon_image_number <= self.total_images
 
-    def get_moon_image(self):
-
+    def from_web(self):
+        """Update the image number, and return True if the image has to come from the web."""
         if not self.get_moon_image_number():
             print("Could not get the moon. Are we in a new year?")
 
         moon_file = f"moon/moon.{self.moon_image_number:04d}.jpg"
         if not os.path.exists(moon_file):
             self.get_from_web = True
+        metrics.cache("moon", not (self.size > 500 or self.get_from_web))
+        return self.size > 500 or self.get_from_web
+
+    def moon_url(self):
+        """The url and the file extension of the current image on the web, in the resolution for the size."""
+        extension = "tif"
+        if self.size > 2160:
+            url = self.moon_domain+self.moon_path+"/frames/5760x3240_16x9_30p/" \
+                  f"plain/moon.{self.moon_image_number:04d}.tif"
+        elif self.size > 216:
+            url = self.moon_domain+self.moon_path+"/frames/3840x2160_16x9_30p/" \
+              f"plain/moon.{self.moon_image_number:04d}.tif"
+        else:
+            url = self.moon_domain + self.moon_path + "/frames/216x216_1x1_30p/" \
+                                                  f"moon.{self.moon_image_number:04d}.jpg"
+            extension = "jpg"
+        return url, extension
+
+    @tracing.traced("QMoon.get_moon_image")
+    def get_moon_image(self):
+
+        web = self.from_web()
+        moon_file = f"moon/moon.{self.moon_image_number:04d}.jpg"
 
         if self.debug:
             print(f"We are using moon image number: {self.moon_image_number}")
-        if self.size > 500 or self.get_from_web:
-
-            extension = "tif"
-            if self.size > 2160:
-                url = self.moon_domain+self.moon_path+"/frames/5760x3240_16x9_30p/" \
-                      f"plain/moon.{self.moon_image_number:04d}.tif"
-            elif self.size > 216:
-                url = self.moon_domain+self.moon_path+"/frames/3840x2160_16x9_30p/" \
-                  f"plain/moon.{self.moon_image_number:04d}.tif"
-            else:
-                url = self.moon_domain + self.moon_path + "/frames/216x216_1x1_30p/" \
-                                                      f"moon.{self.moon_image_number:04d}.jpg"
-                extension = "jpg"
+        if web:
+            url, extension = self.moon_url()
 
             if self.debug:
                 print(f"Getting image from url: {url}")
-            req = requests.get(url)
+            req = fetch.get(url)
             if self.debug:
                 print(f"Request status code: {req.status_code}")
             self.image = QImage()
-            self.image.loadFromData(req.content, extension)
+            with tracing.span("QMoon decode", "image"):
+                self.image.loadFromData(req.content, extension)
             size = self.image.size()
             if self.debug:
                 print("Image size: ", size)
@@ -146,14 +218,17 @@ class QMoon(QWidget):
 
             offset = (size.width() - size.height())/2
             rect = QRect(offset, 0, size.height(), size.height())
-            self.image = self.image.copy(rect)
-            pix = QPixmap.fromImage(self.image)
-            pix = pix.scaled(self.size, self.size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            with tracing.span("QMoon scale", "image"):
+                self.image = self.image.copy(rect)
+                pix = QPixmap.fromImage(self.image)
+                pix = pix.scaled(self.size, self.size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
             return pix
         else:
 
-            pix = QPixmap(moon_file)
-            pix = pix.scaled(self.size, self.size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            with tracing.span("QMoon decode", "image"):
+                pix = QPixmap(moon_file)
+            with tracing.span("QMoon scale", "image"):
+                pix = pix.scaled(self.size, self.size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
             return pix
 
 
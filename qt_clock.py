@@ -10,8 +10,19 @@ from qtpy.QtCore import QFile, QJsonDocument
 
 from clock_widget import Clock_widget
 import qt_clock_rc
+import stylesheet
+from monitor import LoopMonitor
+import metrics
+import tracing
+import fetch
+import memprofile
+import fetchproc
+import aio
+import sensors
+import backlight
 
 import signal
+import time
 
 # Call this function in your main after creating the QApplication
 def setup_interrupt_handling():
@@ -27,6 +38,8 @@ def setup_interrupt_handling():
 def _interrupt_handler(signum, frame):
     """Handle KeyboardInterrupt: quit application."""
     print("You interrupted me with a control-C. ")
+    tracing.flush()
+    aio.cancel_all()
     QApplication.quit()
 
 # def safe_timer(timeout, func, *args, **kwargs):
@@ -46,16 +59,38 @@ if __name__ == '__main__':
     import os
     import argparse
 
-    if os.uname().sysname == "Linux":
-        os.system("/usr/bin/xset dpms 28800 28800 36000")
-        os.system("/usr/bin/xset s off")  # Also turn off screen saver.
-
     setup_interrupt_handling()
 
     app = QApplication(sys.argv)
 
     parser = argparse.ArgumentParser("Qt based Clock program for Raspberry Pi")
     parser.add_argument("--debug", "-d", action="count", help="Increase debug level.", default=0)
+    parser.add_argument("--monitor", "-m", type=float, nargs="?", const=2., default=None, metavar="SECONDS",
+                        help="Monitor the event loop lag, and dump the stacks to ~/.cache/Qt_clock/stalls.log when "
+                             "the GUI is blocked for more than SECONDS (default 2).")
+    parser.add_argument("--metrics", type=str, nargs="?", const=str(metrics.DEFAULT_PORT), default=None,
+                        metavar="[HOST:]PORT", help="Serve metrics in the Prometheus format on HOST:PORT "
+                        "(default 127.0.0.1:{}).".format(metrics.DEFAULT_PORT))
+    parser.add_argument("--trace", type=str, default=None, metavar="FILE",
+                        help="Record a Chrome trace (for Perfetto) of the last {} spans, written to FILE on "
+                             "control-C.".format(tracing.RING_SIZE))
+    parser.add_argument("--memprofile", type=float, nargs="?", const=10., default=None, metavar="MINUTES",
+                        help="Trace the memory use, and log the growth every MINUTES (default 10) to "
+                             "~/.cache/Qt_clock/memprofile.log.")
+    parser.add_argument("--base-url", type=str, default=None, metavar="URL",
+                        help="Get everything from the fixtures.py stand-in server at URL instead of the upstreams.")
+    parser.add_argument("--fetcher", type=str, default=None, metavar="URL",
+                        help="Get everything through the fetcherd.py daemon at URL, shared with the other clocks.")
+    parser.add_argument("--fetch-process", action="store_true",
+                        help="Fetch and decode everything in a separate process, to keep the GUI responsive.")
+    parser.add_argument("--asyncio", action="store_true",
+                        help="Do the weather, tide and moon requests as coroutines on an asyncio loop.")
+    parser.add_argument("--sensors", type=str, default=None, metavar="ADDRESS",
+                        help="Receive the inside and closet readings on UDP host:port, or on a Unix socket path.")
+    parser.add_argument("--backlight", type=str, default=backlight.SYSFS_BACKLIGHT, metavar="DIR",
+                        help="The sysfs backlight directory. A directory that does not exist is made as a fake one.")
+    parser.add_argument("--record", type=str, default=None, metavar="DIR",
+                        help="Record all the responses as fixtures in DIR, for fixtures.py.")
     parser.add_argument("--style", "-s", type=str, help="Use specified style sheet.", default=None)
     parser.add_argument("--frameless", "-fl", action="store_true", help="Make a frameless window.")
     parser.add_argument("--web", action="store_true", help="Make get moon from web.")
@@ -65,27 +100,80 @@ if __name__ == '__main__':
     if args.debug:
         print("Debug flag is set to:", args.debug)
 
-    clock = Clock_widget(args.frameless, web=args.web, debug=args.debug)
-
-    file = None
-    if args.style is None:
-#        file = QFile(":/Clock.qss")
-        file = QFile("Clock.qss")
-    else:
-        file = QFile(args.style)
-
-    file.open(QFile.ReadOnly)
-    style_sheet = file.readAll()
-    # print(style_sheet.data().decode("utf-8"))
-    app.setStyleSheet(style_sheet.data().decode("utf-8"))
-
-    if os.uname().sysname == "Linux":
-        f = open("/sys/class/backlight/rpi_backlight/brightness")
-        num = int(f.readline())
-        f.close()
-    else:
-        num = 40
+    if args.base_url is not None:
+        fetch.BASE_URL = args.base_url
+    if args.record is not None:
+        fetch.start_recording(args.record)
+
+    if args.trace is not None:
+        tracing.enable(args.trace)
+
+    if args.memprofile is not None:
+        memprofile.start_tracing()    # Before the clock, so its allocations are traced too.
+
+    if args.metrics is not None:
+        # Started before the clock, so the first requests are counted too.
+        host, _, port = args.metrics.rpartition(":")
+        metrics.serve(host or "127.0.0.1", int(port))
+        app.aboutToQuit.connect(metrics.shutdown)
+        if args.debug:
+            print("Serving metrics on http://{}:{}/metrics".format(host or "127.0.0.1", port))
+
+    if args.fetch_process:
+        # Started after --base-url and --record, so the process gets those too.
+        if args.fetcher is not None:
+            fetch.BASE_URL = args.fetcher
+        fetchproc.start(debug=args.debug)
+        app.aboutToQuit.connect(fetchproc.stop)
+
+    if args.asyncio:
+        aio.start(app, debug=args.debug)
+        app.aboutToQuit.connect(aio.shutdown)
+
+    if args.sensors is not None:
+        sensors.start(args.sensors, debug=args.debug)
+        app.aboutToQuit.connect(sensors.stop)
+
+    if not os.path.exists(args.backlight) and args.backlight != backlight.SYSFS_BACKLIGHT:
+        backlight.make_fake(args.backlight)
+
+    clock = Clock_widget(args.frameless, web=args.web, debug=args.debug, fetcher=args.fetcher,
+                         backlight_path=args.backlight)
+    clock.dpms.setup(28800, 28800, 36000)   # Also turns off the screen saver.
+    app.aboutToQuit.connect(clock.backlight.close)
+    app.aboutToQuit.connect(clock.dpms.close)
+
+    if args.monitor is not None:
+        monitor = LoopMonitor(threshold=args.monitor, debug=args.debug)
+        monitor.start()
+        clock.monitor = monitor
+
+        def report_monitor():
+            print(monitor.summary())
+            monitor.stop()
+        app.aboutToQuit.connect(report_monitor)
+
+    if args.memprofile is not None:
+        profiler = memprofile.MemoryProfiler(clock, interval=args.memprofile*60, debug=args.debug)
+        profiler.start()
+        app.aboutToQuit.connect(profiler.stop)
+
+    if args.metrics is not None:
+        if clock.monitor is None:
+            clock.monitor = LoopMonitor(debug=args.debug)   # Only the lag, without the watchdog.
+        metrics.monitor = clock.monitor
+
+    # The base style sheet is merged with the overrides for this platform, and pruned to the
+    # widgets that were created, see stylesheet.py.
+    style_file = args.style if args.style is not None else "Clock.qss"
+    style_sheet = stylesheet.compile_style_sheet(style_file, stylesheet.platform_overrides(style_file),
+                                                 stylesheet.used_names(app.allWidgets()), debug=args.debug)
+    start = time.perf_counter()
+    app.setStyleSheet(style_sheet)
+    if args.debug:
+        print("Style sheet set in {:.1f} ms".format((time.perf_counter() - start)*1000))
 
+    num = clock.backlight.brightness(default=40)
     clock.LCD_brightness = num
     clock.Brightness.setSliderPosition(num)
 
@@ -98,5 +186,9 @@ if __name__ == '__main__':
         json = QJsonDocument.fromJson(data).object()
         clock.setup_from_json(json)
 
+    start = time.perf_counter()
     clock.show()
-    sys.exit(app.exec_())
+    if args.debug:
+        app.processEvents()
+        print("Shown and polished in {:.1f} ms".format((time.perf_counter() - start)*1000))
+    sys.exit(aio.exec_(app))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+#
+# Readings of local sensors, received over a UDP or a Unix datagram socket.
+#
+# The inside and closet temperatures used to come from bbb1 over zmq. Now a sensor sends each
+# reading as a text datagram, one or more lines of:
+#
+#     <sensor> <quantity>=<value> [<quantity>=<value> ...]
+#
+# for example "inside temp=21.37 humidity=38.2". The clock shows the temp and humidity of the
+# "inside" and "closet" sensors, see TEMP_DATA_KEYS. The sensors may send tens of readings a second.
+#
+# With --sensors, start() makes the listener, and sets the module level listener, like
+# fetchproc.worker. A thread receives the datagrams and puts the values in a ring buffer per sensor
+# and quantity. Once a second QWeather calls take(), which gives the mean of the readings that came
+# in since, so the widgets get at most one update a second however fast the sensors send.
+#
+# Each ring buffer has a single writer (the thread) and a single reader (the GUI), so there is no
+# lock: the writer stores the value before it advances the count, and the reader only reads below
+# the count it saw. A reader that falls more than RING_SIZE readings behind loses the oldest ones.
+#
+# Try it with:
+#     echo "inside temp=21.4 humidity=40" | nc -u -w0 127.0.0.1 8767
+#
+import os
+import socket
+import threading
+
+import numpy as np
+
+import timesource
+
+DEFAULT_PORT = 8767
+RING_SIZE = 256
+STALE = 120.        # Seconds without a reading, after which a sensor is shown as missing.
+MAX_DATAGRAM = 4096
+
+# (sensor, quantity) -> key in QWeather.temp_data.
+TEMP_DATA_KEYS = {
+    ("inside", "temp"): "inside_temp",
+    ("inside", "humidity"): "inside_humidity",
+    ("closet", "temp"): "closet_temp",
+    ("closet", "humidity"): "closet_humidity",
+}
+
+listener = None     # The SensorListener, when started.
+
+
+class Ring:
+    """A fixed size ring buffer of readings, with one writer thread and one reader thread."""
+
+    __slots__ = ("values", "count", "read", "last_time")
+
+    def __init__(self, size=RING_SIZE):
+        self.values = np.zeros(size, dtype='f8')
+        self.count = 0          # Readings written, ever. Only the writer changes it.
+        self.read = 0           # Readings taken. Only the reader changes it.
+        self.last_time = 0.     # Time of the last reading.
+
+    def put(self, value, t):
+        self.values[self.count % len(self.values)] = value
+        self.last_time = t
+        self.count += 1
+
+    def take(self):
+        """The mean of the readings since the last take(), or None when there are none."""
+        count = self.count
+        first = max(self.read, count - len(self.values))
+        self.read = count
+        if first >= count:
+            return None
+        return float(self.values[np.arange(first, count) % len(self.values)].mean())
+
+
+def parse(datagram):
+    """The readings in a datagram as a list of (sensor, quantity, value). Raises ValueError when malformed."""
+    readings = []
+    for line in datagram.decode("ascii").splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        if len(fields) < 2:
+            raise ValueError("No readings for sensor {}".format(fields[0]))
+        for field in fields[1:]:
+            quantity, equals, value = field.partition("=")
+            if not equals:
+                raise ValueError("Not a quantity=value: {}".format(field))
+            readings.append((fields[0], quantity, float(value)))
+    return readings
+
+
+class SensorListener:
+    """Receive the sensor datagrams on a thread, into a Ring per (sensor, quantity)."""
+
+    def __init__(self, address, stale=STALE, debug=0):
+        """address is "host:port" (or ":port") for UDP, or the path of a Unix datagram socket."""
+        self.address = address
+        self.stale = stale
+        self.debug = debug
+        self.rings = {}          # (sensor, quantity) -> Ring. Only the thread adds to it.
+        self.received = 0
+        self.rejected = 0
+        self.unix_path = None
+        if "/" in address:
+            self.unix_path = address
+            if os.path.exists(address):
+                os.unlink(address)
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.socket.bind(address)
+        else:
+            host, _, port = address.rpartition(":")
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.bind((host or "127.0.0.1", int(port or DEFAULT_PORT)))
+        self.socket.settimeout(1.)      # So that stop() is noticed.
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sensors", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join(2)
+        self.socket.close()
+        if self.unix_path is not None and os.path.exists(self.unix_path):
+            os.unlink(self.unix_path)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                datagram = self.socket.recv(MAX_DATAGRAM)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            now = timesource.time()
+            try:
+                readings = parse(datagram)
+            except (ValueError, UnicodeDecodeError) as e:
+                self.rejected += 1
+                if self.debug:
+                    print("Bad sensor datagram {!r}: {}".format(datagram[:80], e))
+                continue
+            for sensor, quantity, value in readings:
+                ring = self.rings.get((sensor, quantity))
+                if ring is None:
+                    ring = self.rings[(sensor, quantity)] = Ring()
+                ring.put(value, now)
+            self.received += 1
+
+    def take(self):
+        """The mean of the new readings of each (sensor, quantity) since the last take(), and the
+        list of the (sensor, quantity) that had no readings for stale seconds. Call from one thread only."""
+        now = timesource.time()
+        new = {}
+        stale = []
+        for key, ring in list(self.rings.items()):
+            value = ring.take()
+            if value is not None:
+                new[key] = value
+            elif now - ring.last_time > self.stale:
+                stale.append(key)
+        return new, stale
+
+
+def start(address, stale=STALE, debug=0):
+    """Start listening for the sensors on address, see SensorListener."""
+    global listener
+    listener = SensorListener(address, stale, debug)
+    listener.start()
+    if debug:
+        print("Listening for sensors on {}".format(address))
+    return listener
+
+
+def stop():
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+#
+# Style sheet "compiler".
+#
+# Clock.qss is the shared base style sheet, and Clock_mac.qss only holds the rules that are
+# different on the Mac, including "unset" for what the Mac does not get from the base. The compiler merges the base with the overrides for the platform,
+# strips the comments, and drops the rules for widget classes and #object names that are not
+# used by the widgets that were actually created. Qt matches every rule against every widget when it polishes
+# a widget, so a smaller sheet makes the startup and each setStyleSheet() restyle cheaper.
+#
+# The result is cached in ~/.cache/Qt_clock, keyed on the contents of the inputs and the
+# object names, so normally it is only compiled once.
+#
+import os
+import re
+import sys
+import time
+import hashlib
+
+COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+RULE_RE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+ID_RE = re.compile(r"#([A-Za-z_][\w-]*)")
+TYPE_RE = re.compile(r"^([A-Za-z_]\w*)")
+# Widgets that Qt creates on the fly, like the context menu of a text edit, and so are not
+# there yet when the style sheet is compiled.
+RUNTIME_CLASSES = ("QMenu", "QToolTip")
+UNSET = "unset"     # Value in an override file that removes a property, see merge().
+
+
+def parse(text):
+    """Parse a style sheet into a list of (selector, {property: value}), without the comments.
+    A rule with a selector list is split into one rule per selector."""
+    rules = []
+    for match in RULE_RE.finditer(COMMENT_RE.sub("", text)):
+        declarations = {}
+        for decl in match.group(2).split(";"):
+            if ":" in decl:
+                prop, value = decl.split(":", 1)
+                declarations[prop.strip()] = value.strip()
+        for selector in match.group(1).split(","):
+            selector = " ".join(selector.split())
+            if selector:
+                rules.append((selector, dict(declarations)))
+    return rules
+
+
+def merge(base, overrides):
+    """Merge the override rules into the base rules. Properties of a selector in overrides
+    replace those of the same selector in base, new selectors are added at the end.
+    An override "property: unset" removes the property from the base, and "all: unset"
+    removes the whole rule, so an override file can also take away what the base adds."""
+    merged = {}
+    for selector, declarations in base + overrides:
+        if declarations.get("all") == UNSET:
+            merged.pop(selector, None)
+            continue
+        rule = merged.setdefault(selector, {})
+        for prop, value in declarations.items():
+            if value == UNSET:
+                rule.pop(prop, None)
+            else:
+                rule[prop] = value
+    return list(merged.items())
+
+
+def selector_used(selector, used):
+    """True if every type name and #name in the selector is in the set used."""
+    for compound in selector.split():
+        match = TYPE_RE.match(compound)
+        if match and match.group(1) not in used:
+            return False
+        if any("#" + name not in used for name in ID_RE.findall(compound)):
+            return False
+    return True
+
+
+def prune(rules, used):
+    """Drop the rules for widget classes and object names that are not in the set used."""
+    return [(sel, decl) for sel, decl in rules if selector_used(sel, used)]
+
+
+def render(rules):
+    """Write the rules as a compact style sheet."""
+    return "\n".join("{}{{{}}}".format(sel, ";".join("{}:{}".format(p, v) for p, v in decl.items()))
+                     for sel, decl in rules if len(decl) > 0)
+
+
+def platform_overrides(base_file):
+    """The override style sheets for this platform, next to the base_file."""
+    if sys.platform == "darwin":
+        name = os.path.join(os.path.dirname(base_file), "Clock_mac.qss")
+        if os.path.exists(name):
+            return [name]
+    return []
+
+
+def used_names(widgets):
+    """The set of class names, including the base classes, and #object names of the widgets."""
+    used = set(RUNTIME_CLASSES)
+    for w in widgets:
+        if w.objectName():
+            used.add("#" + w.objectName())
+        meta = w.metaObject()
+        while meta is not None:
+            used.add(meta.className())
+            meta = meta.superClass()
+    return used
+
+
+def compile_style_sheet(base_file, override_files=(), used=None, cache_dir=None, debug=0):
+    """Return the compiled style sheet, pruned to the names in used, see used_names().
+    When used is None nothing is pruned."""
+    start = time.perf_counter()
+    texts = []
+    for file_name in [base_file] + list(override_files):
+        with open(file_name, encoding="utf-8") as f:
+            texts.append(f.read())
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.getenv("HOME", "."), ".cache", "Qt_clock")
+    key = hashlib.sha1("\0".join(texts + sorted(used if used is not None else ["*"])).encode()).hexdigest()
+    cache_file = os.path.join(cache_dir, "style_{}.qss".format(key[:16]))
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            result = f.read()
+        if debug:
+            print("Style sheet from cache {} ({:.1f} ms)".format(cache_file, (time.perf_counter() - start)*1000))
+        return result
+    except OSError:
+        pass
+
+    rules = merge(parse(texts[0]), [rule for text in texts[1:] for rule in parse(text)])
+    n_rules = len(rules)
+    if used is not None:
+        rules = prune(rules, used)
+    result = render(rules)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, "w", encoding="utf-8") as f:
+            f.write(result)
+    except OSError as e:
+        print("Could not cache the style sheet: ", e)
+    if debug:
+        print("Compiled style sheet: {} of {} rules, {} -> {} bytes in {:.1f} ms".format(
+            len(rules), n_rules, sum(len(t) for t in texts), len(result), (time.perf_counter() - start)*1000))
+    return result
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 #
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from dateutil import tz
 import requests
 import json
+import os
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 # Note on the Weather.gov JSON.
 #
@@ -11,15 +16,29 @@ import json
 #
 # Example conversion to datetime: datetime.fromisoformat(wjson['properties']['updateTime'])
 #
-from qtpy.QtWidgets import QApplication, QFrame, QTextEdit
-from qtpy.QtCore import Qt, QFile, Slot, QTimer
+from qtpy.QtWidgets import QApplication, QFrame, QTextEdit, QWidget
+from qtpy.QtGui import QColor, QPainter, QPainterPath, QPen, QPixmap
+from qtpy.QtCore import Qt, QObject, QFile, Signal, Slot, QTimer, QPointF
 import signal
 import qt_clock_rc
+import fetch
+import metrics
+import tracing
+import timesource
+import fetchproc
+import aio
+
+# Hi/Lo tide events are stored as a sorted structured array, one row per event.
+# The time is in UTC seconds since the epoch, the height in meters above MLLW.
+HILO_DTYPE = np.dtype([('t', 'i8'), ('v', 'f4'), ('type', 'S1')])
+# Same, for the merged events of several stations, with the index of the station.
+MERGED_HILO_DTYPE = np.dtype([('t', 'i8'), ('v', 'f4'), ('type', 'S1'), ('station', 'u1')])
+
 
 class Tides:
     """Base class for getting the tides from NOAA. Used for other classes here."""
-    def __init__(self):
-        self.base_url = "https://tidesandcurrents.noaa.gov/api/datagetter"
+    def __init__(self, debug=0):
+        self.base_url = fetch.upstream_url("https://tidesandcurrents.noaa.gov/api/datagetter")
         self.timezone = "lst_ldt"  # Local time.
         self.station_dict={
             "portland": 8418150,
@@ -31,15 +50,32 @@ class Tides:
             'User-Agent': '(QtWeatherApp, holtrop@physics.unh.edu)',
             'From': 'holtrop@physics.unh.edu'
         }
+        self.debug = debug
+        self.timeout = 30    # Seconds, so one slow NOAA response cannot hang a fetch forever.
+        self.session = requests.Session()   # Shared, so connections to NOAA are reused.
+        self.session.headers.update(self.request_headers)
+        self.cache_dir = os.path.join(os.getenv("HOME", "."), ".cache", "Qt_clock")
+        self.caches = {}   # One TideCache per station.
 
-    def get_json_data(self, begin_date, end_date, station="portland", product="hilo"):
+    def get_json_data(self, begin_date, end_date, station="portland", product="hilo", time_zone=None):
         """Get the requested data from NOAA as a JSON dictionary"""
+        payload = self.make_payload(begin_date, end_date, station, product, time_zone)
+        if not payload:
+            return payload
+        js = fetch.get(self.base_url, session=self.session, params=payload, timeout=self.timeout).json()
+        return self.unwrap(js)
+
+    def make_payload(self, begin_date, end_date, station="portland", product="hilo", time_zone=None):
+        """The query parameters of a NOAA request. {} for an unknown station, None for an unknown product."""
         if type(station) == str and station in self.station_dict:
             station = self.station_dict[station]
-        else:
+        elif type(station) != int:
             print("Unknown station: {}".format(station))
             return {}
 
+        if time_zone is None:
+            time_zone = self.timezone
+
         payload = {}
         if product == "hilo":
             payload['station'] = station
@@ -47,73 +83,504 @@ class Tides:
             payload['end_date'] = end_date
             payload['product'] = "predictions"
             payload['datum'] = "MLLW"
-            payload['time_zone'] = self.timezone
+            payload['time_zone'] = time_zone
             payload['units'] = "metric"
             payload['interval'] = "hilo"
             payload['format'] = "json"
+        elif product == "predictions" or product == "water_level":
+            payload['station'] = station
+            payload['begin_date'] = begin_date
+            payload['end_date'] = end_date
+            payload['product'] = product
+            payload['datum'] = "MLLW"
+            payload['time_zone'] = time_zone
+            payload['units'] = "metric"
+            if product == "predictions":
+                payload['interval'] = "6"   # 6 minute intervals.
+            payload['format'] = "json"
         else:
-            print("NOT YET IMPLEMENTED.")
+            print("Unknown tide product: ", product)
+            return None
+        return payload
 
-        js = requests.get(self.base_url, params=payload, headers=self.request_headers).json()
+    @staticmethod
+    def unwrap(js):
+        """The list of data points in a NOAA response, or None for an error."""
         if 'predictions' in js:
             return js['predictions']
+        elif 'data' in js:     # The water_level observations.
+            return js['data']
         else:
             print("Error obtaining tide data: \n", js)
             return None
 
+    def get_hilo(self, begin_date, end_date, station="portland"):
+        """Get the hi/lo predictions between the GMT date strings as a sorted HILO_DTYPE array, or None."""
+        if fetchproc.worker is not None:
+            return fetchproc.worker.call("hilo", begin_date, end_date, station)
+        js = self.get_json_data(begin_date, end_date, station, "hilo", time_zone="gmt")
+        if not js:
+            return None
+        return TideCache.from_json(js)
+
+    def get_series(self, begin, end, station="portland", product="predictions"):
+        """Get the 6 minute predictions or water_level observations between datetimes begin and end.
+        Returns two numpy arrays: time in UTC seconds (int64) and height in meters (float32).
+        Missing observations are NaN."""
+        if fetchproc.worker is not None:
+            return fetchproc.worker.call("tide_series", begin, end, station, product)
+        begin = begin.astimezone(timezone.utc)
+        end = end.astimezone(timezone.utc)
+        js = self.get_json_data(begin.strftime("%Y%m%d %H:%M"), end.strftime("%Y%m%d %H:%M"),
+                                station, product, time_zone="gmt")
+        return self.series_arrays(js)
+
+    async def get_series_async(self, begin, end, station="portland", product="predictions"):
+        """get_series() as a coroutine, for aio.py. With the fetch process, it waits for the worker."""
+        if fetchproc.worker is not None:
+            return await asyncio.wrap_future(fetchproc.worker.submit("tide_series", begin, end, station, product))
+        begin = begin.astimezone(timezone.utc)
+        end = end.astimezone(timezone.utc)
+        payload = self.make_payload(begin.strftime("%Y%m%d %H:%M"), end.strftime("%Y%m%d %H:%M"),
+                                    station, product, time_zone="gmt")
+        js = self.unwrap(await aio.client.get_json(self.base_url, payload)) if payload else None
+        return self.series_arrays(js)
+
+    @staticmethod
+    def series_arrays(js):
+        """The time and height arrays of get_series() from the NOAA data points."""
+        if not js:
+            return np.zeros(0, dtype='i8'), np.zeros(0, dtype='f4')
+        t = np.fromiter((datetime.strptime(tt['t'], "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc).timestamp()
+                         for tt in js), dtype='i8', count=len(js))
+        v = np.fromiter((float(tt['v']) if tt['v'] != "" else np.nan for tt in js), dtype='f4', count=len(js))
+        return t, v
+
+    def get_cache(self, station="portland"):
+        """Return the (shared) hi/lo tide cache for station."""
+        if station not in self.caches:
+            self.caches[station] = TideCache(self, station, debug=self.debug)
+        return self.caches[station]
+
+    def hilo_events(self, begin, end, station="portland"):
+        """Return the hi/lo events between datetimes begin and end as a HILO_DTYPE array."""
+        cache = self.get_cache(station)
+        return cache.events(begin.timestamp(), end.timestamp())
+
+
+class TideCache:
+    """Hi/Lo tide predictions for one station, fetched in bulk and kept on disk.
+
+    NOAA allows up to a year of hilo predictions in one request, so we fetch 'days' ahead
+    at once and only go back to the network when less than 'days - refresh_days' are left,
+    i.e. about once a month. The events are kept sorted by time, so a window lookup is a
+    binary search."""
+
+    def __init__(self, tides, station="portland", days=365, refresh_days=30, debug=0):
+        self.tides = tides
+        self.station = station
+        self.days = days
+        self.refresh_days = refresh_days
+        self.debug = debug
+        self.data = np.zeros(0, dtype=HILO_DTYPE)
+        self.covered = (0, 0)  # UTC seconds range that was requested from NOAA.
+        self.file_name = os.path.join(tides.cache_dir, "tides_{}_hilo.npz".format(station.replace(" ", "_")))
+        self.load()
+
+    def load(self):
+        """Load the cache from disk, if it is there."""
+        try:
+            with np.load(self.file_name) as npz:
+                self.data = npz['data'].astype(HILO_DTYPE)
+                self.covered = tuple(int(x) for x in npz['covered'])
+            if self.debug:
+                print("Loaded {} tide events for {} from {}".format(len(self.data), self.station, self.file_name))
+        except (OSError, KeyError, ValueError) as e:
+            if self.debug:
+                print("No usable tide cache for {}: {}".format(self.station, e))
+
+    def save(self):
+        """Write the cache to disk."""
+        try:
+            os.makedirs(os.path.dirname(self.file_name), exist_ok=True)
+            tmp_name = self.file_name + ".tmp.npz"
+            np.savez(tmp_name, data=self.data, covered=np.array(self.covered, dtype='i8'))
+            os.replace(tmp_name, self.file_name)
+        except OSError as e:
+            print("Could not save the tide cache: ", e)
+
+    @staticmethod
+    def from_json(js):
+        """Convert the NOAA hilo predictions (with GMT times) to a sorted HILO_DTYPE array."""
+        data = np.zeros(len(js), dtype=HILO_DTYPE)
+        for i, tt in enumerate(js):
+            t = datetime.strptime(tt['t'], "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc)
+            data[i] = (int(t.timestamp()), float(tt['v']), tt['type'][:1].encode())
+        data.sort(order='t')
+        return data
+
+    def fetch(self, now=None):
+        """Get 'days' worth of hi/lo predictions from NOAA in one request."""
+        if now is None:
+            now = timesource.utcnow()
+        begin = now - timedelta(days=2)
+        end = now + timedelta(days=self.days)
+        if self.debug:
+            print("Fetching tides for {} from {} to {}".format(self.station, begin, end))
+        data = self.tides.get_hilo(begin.strftime("%Y%m%d %H:%M"), end.strftime("%Y%m%d %H:%M"), self.station)
+        if data is None:
+            return False
+        self.data = data
+        self.covered = (int(begin.timestamp()), int(end.timestamp()))
+        self.save()
+        return True
+
+    def needs_refresh(self, t0, t1):
+        """True if the cache does not cover t0 to t1 with enough margin left."""
+        margin = (self.days - self.refresh_days)*24*3600
+        refresh = len(self.data) == 0 or self.covered[0] > t0 or self.covered[1] < t1 + margin
+        metrics.cache("tides", not refresh)
+        return refresh
+
+    def lookup(self, t0, t1):
+        """Return the cached events with t0 <= t <= t1 (UTC seconds). Never goes to the network."""
+        data = self.data
+        i0 = np.searchsorted(data['t'], t0, side='left')
+        i1 = np.searchsorted(data['t'], t1, side='right')
+        return data[i0:i1]
+
+    def events(self, t0, t1):
+        """Return all events with t0 <= t <= t1 (UTC seconds), fetching from NOAA when needed."""
+        if self.needs_refresh(t0, t1):
+            try:
+                self.fetch()
+            except Exception as e:
+                print("Could not fetch tides for {}: {}".format(self.station, e))
+        return self.lookup(t0, t1)
+
+
+def merge_events(results, stations):
+    """Merge the HILO_DTYPE arrays in the results dict, keyed by station, into one time sorted
+    MERGED_HILO_DTYPE array. The 'station' field is the index of the station in stations."""
+    arrays = []
+    for i, station in enumerate(stations):
+        events = results.get(station)
+        if events is None or len(events) == 0:
+            continue
+        merged = np.zeros(len(events), dtype=MERGED_HILO_DTYPE)
+        for name in HILO_DTYPE.names:
+            merged[name] = events[name]
+        merged['station'] = i
+        arrays.append(merged)
+    if len(arrays) == 0:
+        return np.zeros(0, dtype=MERGED_HILO_DTYPE)
+    merged = np.concatenate(arrays)
+    return merged[np.argsort(merged['t'], kind='stable')]
+
+
+class TideFetcher(QObject):
+    """Get the hi/lo tides for several stations concurrently, off the GUI thread.
+
+    Each station is a separate job on a small thread pool, sharing the Tides session.
+    When a station finishes, station_ready (or station_failed) is emitted for that station
+    alone, so a slow or failing station does not hold up the others."""
+
+    station_ready = Signal(str)
+    station_failed = Signal(str, str)
+
+    def __init__(self, tides, max_workers=4, parent=None):
+        super(TideFetcher, self).__init__(parent)
+        self.tides = tides
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tides")
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.results = {}
+        self.errors = {}
+
+    def request(self, stations, begin, end):
+        """Start getting the events between datetimes begin and end for all stations.
+        Stations that are still being fetched are not requested again."""
+        t0 = begin.timestamp()
+        t1 = end.timestamp()
+        for station in stations:
+            cache = self.tides.get_cache(station)   # Created here, on the GUI thread.
+            with self.lock:
+                if station in self.pending:
+                    continue
+                self.pending.add(station)
+            future = self.executor.submit(self.work, cache, t0, t1)
+            future.add_done_callback(lambda f, st=station: self.done(st, f))
+
+    @staticmethod
+    def work(cache, t0, t1):
+        """Runs on the pool: refresh the cache if needed, and look up the window."""
+        if cache.needs_refresh(t0, t1):
+            cache.fetch()
+        return cache.lookup(t0, t1)
+
+    def done(self, station, future):
+        """Called on the pool thread when a station is done. The signals are queued to the GUI."""
+        with self.lock:
+            self.pending.discard(station)
+        try:
+            self.results[station] = future.result()
+            self.errors.pop(station, None)
+            self.station_ready.emit(station)
+        except Exception as e:
+            self.errors[station] = str(e)
+            self.station_failed.emit(station, str(e))
+
+    def merged(self, stations):
+        """Return the merged, time sorted events for stations that we have results for."""
+        return merge_events(dict(self.results), stations)
+
+    def shutdown(self):
+        """Stop the pool, do not wait for requests in flight."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
 class QHiLoTide(QTextEdit):
-    """Mini label with high and low tides for today from NOAA"""
+    """Mini label with high and low tides for today from NOAA, for one or more stations."""
 
-    def __init__(self, pos, parent=None, debug=0):
+    def __init__(self, pos, parent=None, stations=("portland",), debug=0):
         super(QHiLoTide, self).__init__(parent)
         self.setObjectName("hilo")
         self.debug = debug
         self.setReadOnly(True)
         self.setGeometry(pos[0], pos[1], 220, 60)
         self.setFrameStyle(QFrame.NoFrame)
+        self.stations = list(stations)
+        self.tides = Tides(debug=debug)
+        self.fetcher = TideFetcher(self.tides, parent=self)
+        self.fetcher.station_ready.connect(self.show_events)
+        self.fetcher.station_failed.connect(self.station_failed)
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update)
-        self.timer.start(3*3600*1000)
+        self.timer.start(timesource.interval(3*3600*1000))
         self.update()
 
  #       self.setStyleSheet("QTextEdit#hilo{ font-size: 8pt;}")
 
+    def set_stations(self, stations):
+        """Change the list of stations shown."""
+        self.stations = [st for st in stations if st in self.tides.station_dict]
+        self.update()
+
     @Slot()
     def update(self):
-        """Update the panel"""
-        self.clear()
-        tides = Tides()
-        now = datetime.now()
-        begin = (now+timedelta(days=-0.25)).strftime("%Y%m%d %H:%m")
-        end = (now + timedelta(days=+0.85)).strftime("%Y%m%d %H:%m")
-        try:
-            js = tides.get_json_data(begin, end, "portland", "hilo")
-        except:
-            js = None
+        """Start the update of the panel. The text is filled in as each station comes in."""
+        now = timesource.now().astimezone()
+        self.fetcher.request(self.stations, now + timedelta(days=-0.25), now + timedelta(days=+0.85))
+        self.show_events()
+
+    @Slot(str, str)
+    def station_failed(self, station, error):
+        print("Error getting tides for {}: {}".format(station, error))
+        self.show_events()
+
+    @Slot()
+    def show_events(self, station=None):
+        """Show the events we have so far."""
+        now = timesource.now()
+        t0 = (now + timedelta(days=-0.25)).timestamp()
+        t1 = (now + timedelta(days=+0.85)).timestamp()
+        events = self.fetcher.merged(self.stations)
+        events = events[(events['t'] >= t0) & (events['t'] <= t1)]
+        multi = len(self.stations) > 1
         html_text = ""
         text = ""
-        if js is not None:
+        if len(events) > 0:
             n = 0
-            for tt in js:
-                if tt['type'] == "H":
+            for tt in events:
+                local_time = datetime.fromtimestamp(int(tt['t']))
+                if multi:
+                    name = self.stations[tt['station']]
+                    text += "{} ".format(name)
+                    html_text += "{} ".format(name.title())
+                if tt['type'] == b"H":
                     text += "High: "
                     html_text += '<span style="color:#AA5500">High:</span> '
                 else:
                     text += "Low: "
                     html_text += '<span style="color:#0055AA">Low:</span> '
-                text += "{}  ".format(tt['t'])
-                html_text += "{}&nbsp;&nbsp; ".format(tt['t'].split()[1])
-                if n == 1:
+                text += "{}  ".format(local_time.strftime("%Y-%m-%d %H:%M"))
+                html_text += "{}&nbsp;&nbsp; ".format(local_time.strftime("%H:%M"))
+                if n == 1 or multi:
                     html_text += "<br>\n"
                 n += 1
-        else:
+        elif len(self.fetcher.errors) > 0:
             text = "Error getting data."
             html_text = "Error getting data."
+        else:
+            text = "Getting tides."
+            html_text = "Getting tides."
 
         if self.debug:
             print("Tides: ", now, " ", text)
+        self.clear()
         self.setText(html_text)
 
+class QTideCurve(QWidget):
+    """Small plot of today's tide curve with a marker for the current time.
+
+    The curve only changes once a day, so it is drawn once into a QPixmap. A repaint is then
+    a blit of that pixmap plus the "now" marker."""
+
+    def __init__(self, pos, size=(120, 120), parent=None, station="portland", observed=False, debug=0):
+        super(QTideCurve, self).__init__(parent)
+        self.setObjectName("tidecurve")
+        self.debug = debug
+        self.station = station
+        self.observed = observed  # Also show the water_level observations.
+        self.setGeometry(pos[0], pos[1], size[0], size[1])
+        self.tides = Tides(debug=debug)
+        self.day = None
+        self.day_start = 0
+        self.t = np.zeros(0, dtype='i8')
+        self.v = np.zeros(0, dtype='f4')
+        self.obs_t = np.zeros(0, dtype='i8')
+        self.obs_v = np.zeros(0, dtype='f4')
+        self.v_range = (0., 1.)
+        self.path = None
+        self.obs_path = None
+        self.pixmap = None
+        self.curve_color = QColor(0, 120, 200)
+        self.obs_color = QColor(200, 200, 200, 150)
+        self.now_color = QColor(200, 100, 0)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(timesource.interval(6*60*1000))
+        self.refresh()
+
+    def to_point(self, t, v):
+        """Convert a time (UTC seconds) and height to widget coordinates."""
+        x = (t - self.day_start)/(24*3600.)*self.width()
+        y = self.height() - 4 - (v - self.v_range[0])/(self.v_range[1] - self.v_range[0])*(self.height() - 8)
+        return QPointF(x, y)
+
+    def make_path(self, t, v):
+        """Build a QPainterPath for the series, skipping NaN values."""
+        path = QPainterPath()
+        move = True
+        for tt, vv in zip(t.tolist(), v.tolist()):
+            if vv != vv:   # NaN
+                move = True
+                continue
+            if move:
+                path.moveTo(self.to_point(tt, vv))
+                move = False
+            else:
+                path.lineTo(self.to_point(tt, vv))
+        return path
+
+    def render_pixmap(self):
+        """Draw the cached curve into the pixmap."""
+        self.pixmap = QPixmap(self.size())
+        self.pixmap.fill(Qt.transparent)
+        if self.path is None:
+            return
+        painter = QPainter(self.pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(self.curve_color, 2))
+        painter.drawPath(self.path)
+        painter.end()
+
+    @Slot()
+    def refresh(self):
+        """Get new data when the day changed, otherwise just move the marker."""
+        if aio.loop is not None:
+            if not aio.running("tide_curve"):
+                aio.spawn(self.refresh_async(), "tide_curve")
+            return
+        today = timesource.now().date()
+        if today != self.day:
+            start = datetime(today.year, today.month, today.day).astimezone()
+            try:
+                t, v = self.tides.get_series(start, start + timedelta(days=1), self.station, "predictions")
+            except Exception as e:
+                print("Error getting the tide curve: ", e)
+                t, v = np.zeros(0, dtype='i8'), np.zeros(0, dtype='f4')
+            self.set_day(today, start, t, v)
+
+        if self.observed and self.path is not None:
+            try:
+                now = timesource.now().astimezone()
+                t, v = self.tides.get_series(datetime.fromtimestamp(self.day_start).astimezone(),
+                                             now, self.station, "water_level")
+                self.set_observed(t, v)
+            except Exception as e:
+                print("Error getting the water level: ", e)
+        self.update()
+
+    async def refresh_async(self):
+        """refresh() as a coroutine, for aio.py."""
+        today = timesource.now().date()
+        if today != self.day:
+            start = datetime(today.year, today.month, today.day).astimezone()
+            try:
+                t, v = await self.tides.get_series_async(start, start + timedelta(days=1), self.station, "predictions")
+            except Exception as e:
+                print("Error getting the tide curve: ", e)
+                t, v = np.zeros(0, dtype='i8'), np.zeros(0, dtype='f4')
+            self.set_day(today, start, t, v)
+
+        if self.observed and self.path is not None:
+            try:
+                now = timesource.now().astimezone()
+                t, v = await self.tides.get_series_async(datetime.fromtimestamp(self.day_start).astimezone(),
+                                                         now, self.station, "water_level")
+                self.set_observed(t, v)
+            except Exception as e:
+                print("Error getting the water level: ", e)
+        self.update()
+
+    def set_day(self, today, start, t, v):
+        """Show the predictions t, v of the day today, which starts at datetime start."""
+        self.t, self.v = t, v
+        if len(self.t) > 0:
+            self.day = today
+            self.day_start = start.timestamp()
+            self.v_range = (float(np.nanmin(self.v)) - 0.1, float(np.nanmax(self.v)) + 0.1)
+            self.path = self.make_path(self.t, self.v)
+        else:
+            self.path = None
+        self.render_pixmap()
+        if self.debug:
+            print("Tide curve for {}: {} points".format(today, len(self.t)))
+
+    def set_observed(self, t, v):
+        self.obs_t, self.obs_v = t, v
+        self.obs_path = self.make_path(self.obs_t, self.obs_v)
+
+    def resizeEvent(self, event):
+        if self.path is not None:
+            self.path = self.make_path(self.t, self.v)
+            if self.obs_path is not None:
+                self.obs_path = self.make_path(self.obs_t, self.obs_v)
+        self.render_pixmap()
+
+    @tracing.traced("QTideCurve.paintEvent", "paint")
+    @metrics.timed_paint("tide_curve")
+    def paintEvent(self, event):
+        """Blit the curve and draw the marker for now."""
+        painter = QPainter(self)
+        if self.pixmap is not None:
+            painter.drawPixmap(0, 0, self.pixmap)
+        if self.path is None:
+            return
+        painter.setRenderHint(QPainter.Antialiasing)
+        if self.obs_path is not None:
+            painter.setPen(QPen(self.obs_color, 1))
+            painter.drawPath(self.obs_path)
+        now = timesource.time()
+        v_now = float(np.interp(now, self.t, self.v))
+        point = self.to_point(now, v_now)
+        painter.setPen(QPen(self.now_color, 1))
+        painter.drawLine(QPointF(point.x(), 0), QPointF(point.x(), self.height()))
+        painter.setBrush(self.now_color)
+        painter.drawEllipse(point, 3, 3)
+
+
 if __name__ == '__main__':
     import sys
     import os
@@ -144,6 +611,8 @@ if __name__ == '__main__':
     parser.add_argument("--style", "-s", type=str, help="Use specified style sheet.", default=None)
     parser.add_argument("--frameless", "-fl", action="store_true", help="Make a frameless window.")
     parser.add_argument("--icon", "-i", action="store_true", help="Show the weather icon.")
+    parser.add_argument("--curve", "-c", action="store_true", help="Show the tide curve.")
+    parser.add_argument("--stations", type=str, help="Comma separated list of stations.", default="portland")
 
     args = parser.parse_args(sys.argv[1:])
 
@@ -160,9 +629,13 @@ if __name__ == '__main__':
 
     if args.icon:
         pass
+    elif args.curve:
+        curve = QTideCurve((0, 0), size=(400, 200), observed=True, debug=args.debug)
+        curve.show()
     else:
-        tide = QHiLoTide((0, 0))
-        tide.update()
+        tide = QHiLoTide((0, 0), stations=args.stations.split(","), debug=args.debug)
+        if len(tide.stations) > 1:
+            tide.resize(260, 20*4*len(tide.stations))
         tide.show()
 
     sys.exit(app.exec_())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#
+# The one source of the time for the clock.
+#
+# Everything that shows or depends on the time of day asks this module instead of the system:
+# the digital and analog clock, the moon phase, the tides, the weather update and the charts.
+# Normally it is just the system clock. For testing, simulate() sets a start time and a rate, and
+# the time then runs from the start at rate times real time. The QTimers of the widgets are
+# started with interval(), which divides by the rate, so the periodic updates also come rate
+# times as often. That way benchmarks/soak.py can run the whole app through a month in minutes.
+#
+# The timers cannot fire faster than 1 ms, so at rates above 1000 the once a second tick falls
+# behind the simulated time. The other timers are minutes or hours and keep up.
+#
+import time as _time
+from datetime import datetime, timezone
+
+from qtpy.QtCore import QDateTime, QTime
+
+SIMULATED = False
+rate = 1.
+start_time = 0.     # Simulated time at start_real.
+start_real = 0.     # time.monotonic() when the simulation started.
+
+
+def simulate(start=None, speed=1.):
+    """Run the time from start (a datetime, or UTC seconds, default now) at speed times real time."""
+    global SIMULATED, rate, start_time, start_real
+    if start is None:
+        start = _time.time()
+    elif isinstance(start, datetime):
+        start = start.timestamp()
+    start_time = float(start)
+    start_real = _time.monotonic()
+    rate = float(speed)
+    SIMULATED = True
+
+
+def time():
+    """The current time in UTC seconds, like time.time()."""
+    if not SIMULATED:
+        return _time.time()
+    return start_time + (_time.monotonic() - start_real)*rate
+
+
+def now(tz=None):
+    """The current time as a datetime, like datetime.now(tz)."""
+    if not SIMULATED:
+        return datetime.now(tz)
+    return datetime.fromtimestamp(time(), tz)
+
+
+def utcnow():
+    """The current time as an aware datetime in UTC."""
+    return now(timezone.utc)
+
+
+def qdatetime():
+    """The current local time as a QDateTime, like QDateTime.currentDateTime()."""
+    if not SIMULATED:
+        return QDateTime.currentDateTime()
+    return QDateTime.fromMSecsSinceEpoch(int(time()*1000))
+
+
+def qtime():
+    """The current local time of day as a QTime, like QTime.currentTime()."""
+    if not SIMULATED:
+        return QTime.currentTime()
+    return qdatetime().time()
+
+
+def interval(ms):
+    """The real timer interval in ms for a period of ms simulated time."""
+    if not SIMULATED:
+        return ms
+    return max(int(ms/rate), 1)
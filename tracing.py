@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#
+# Opt-in tracer that writes Chrome trace-event JSON, which can be opened in Perfetto
+# (https://ui.perfetto.dev) or chrome://tracing.
+#
+# Spans are recorded as complete ("X") events in a preallocated ring buffer, so a long run keeps
+# the last RING_SIZE spans and tracing never allocates more memory. Each entry is a tuple of
+# (name, category, start us, duration us, thread id, args). When tracing is not enabled, span()
+# returns a shared do-nothing object and @traced only checks the module flag, so the
+# instrumentation can stay in place.
+#
+# The buffer is written out with flush(), from the _interrupt_handler in qt_clock.py.
+#
+import os
+import json
+import time
+import threading
+from itertools import count
+from functools import wraps
+
+ENABLED = False
+RING_SIZE = 1 << 16
+
+buffer = []
+counter = count()
+thread_names = {}
+file_name = None
+
+
+def enable(output_file, size=RING_SIZE):
+    """Start tracing into a ring buffer of size spans, to be written to output_file."""
+    global ENABLED, buffer, counter, file_name
+    buffer = [None]*size
+    counter = count()
+    file_name = output_file
+    ENABLED = True
+
+
+def now_us():
+    return time.perf_counter_ns()//1000
+
+
+def record(name, category, start, duration, args=None):
+    """Add a span to the ring buffer. Safe to call from any thread."""
+    tid = threading.get_native_id()
+    if tid not in thread_names:
+        thread_names[tid] = threading.current_thread().name
+    buffer[next(counter) % len(buffer)] = (name, category, start, duration, tid, args)
+
+
+class Span:
+    """Context manager that records the time spent in the with block."""
+    __slots__ = ("name", "category", "args", "start")
+
+    def __init__(self, name, category, args=None):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = now_us()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.category, self.start, now_us() - self.start, self.args)
+        return False
+
+
+class NullSpan:
+    """Stand in for Span when tracing is off."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name, category="app", args=None):
+    """with tracing.span("name"): ... records a span when tracing is enabled."""
+    if not ENABLED:
+        return NULL_SPAN
+    return Span(name, category, args)
+
+
+def traced(name, category="app"):
+    """Decorator that records each call of the function as a span."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = now_us()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, category, start, now_us() - start)
+        return wrapper
+    return decorator
+
+
+def events():
+    """The recorded spans, oldest first, as trace events."""
+    n = next(counter)
+    size = len(buffer)
+    buffer[n % size] = None   # The slot of the index just taken.
+    first = max(n - size, 0)
+    pid = os.getpid()
+    out = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+           for tid, name in list(thread_names.items())]
+    for i in range(first, n):
+        entry = buffer[i % size]
+        if entry is None:
+            continue
+        name, category, start, duration, tid, args = entry
+        event = {"name": name, "cat": category, "ph": "X", "ts": start, "dur": duration, "pid": pid, "tid": tid}
+        if args:
+            event["args"] = args
+        out.append(event)
+    return out
+
+
+def flush(output_file=None):
+    """Write the ring buffer to output_file, or the file given to enable()."""
+    output_file = output_file if output_file is not None else file_name
+    if not ENABLED or output_file is None:
+        return
+    with open(output_file, "w") as f:
+        json.dump({"traceEvents": events(), "displayTimeUnit": "ms"}, f)
+    print("Trace written to {}".format(output_file))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+#
+# Trends computed from the observations: the 3 hour barometric tendency, with the WMO
+# "characteristic of pressure tendency" code (WMO table 0200), the rate of change of the
+# temperature and the dew point.
+#
+# The TrendEngine is updated with each new sample. It keeps only the samples in the sliding
+# windows, in deques, plus running sums for the temperature fit, so an update is O(1) and
+# never rescans the history. At startup, seed() replays the stored observations of the last
+# windows, so the trends are there right away.
+#
+# The observations come about once an hour, so the temperature slope is fitted over 3 hours, like
+# the pressure tendency, to have at least 3 samples.
+#
+from collections import deque
+import numpy as np
+
+WMO_TENDENCY = {
+    0: "Increasing, then decreasing",
+    1: "Increasing, then steady",
+    2: "Increasing",
+    3: "Decreasing or steady, then increasing",
+    4: "Steady",
+    5: "Decreasing, then increasing",
+    6: "Decreasing, then steady",
+    7: "Decreasing",
+    8: "Steady or increasing, then decreasing"
+}
+
+
+def dew_point(temp, humidity):
+    """Dew point in C from temperature in C and relative humidity in %, using the Magnus formula.
+    Works on scalars and numpy arrays."""
+    a = 17.625
+    b = 243.04
+    gamma = np.log(np.clip(humidity, 1e-3, 100.)/100.) + a*temp/(b + temp)
+    return b*gamma/(a - gamma)
+
+
+def wmo_tendency(d1, d2, steady=0.1):
+    """WMO code 0-8 for the pressure tendency, from the change in the first (d1) and
+    second (d2) half of the 3 hour window, in mbar."""
+    s1 = 0 if abs(d1) < steady else (1 if d1 > 0 else -1)
+    s2 = 0 if abs(d2) < steady else (1 if d2 > 0 else -1)
+    d = d1 + d2
+    if abs(d) < steady:
+        if s1 > 0 > s2:
+            return 0
+        if s1 < 0 < s2:
+            return 5
+        return 4
+    if d > 0:
+        if s1 > 0 > s2:
+            return 0
+        if s1 > 0 and s2 == 0:
+            return 1
+        if s1 <= 0 < s2:
+            return 3
+        if s1 > 0 and s2 > 0:
+            if d2 > 1.5*d1:
+                return 3
+            if d2 < d1/1.5:
+                return 1
+        return 2
+    else:
+        if s1 < 0 < s2:
+            return 5
+        if s1 < 0 and s2 == 0:
+            return 6
+        if s1 >= 0 > s2:
+            return 8
+        if s1 < 0 and s2 < 0:
+            if d2 < 1.5*d1:
+                return 8
+            if d2 > d1/1.5:
+                return 6
+        return 7
+
+
+def slide(samples, t_start):
+    """Drop the (t, value) samples from the left of the deque, but keep the newest one at or before t_start."""
+    while len(samples) > 1 and samples[1][0] <= t_start:
+        samples.popleft()
+
+
+def interpolate(samples, t):
+    """The value at t, interpolated between the first two (t, value) samples, or the first if t is before it."""
+    t0, v0 = samples[0]
+    if t <= t0 or len(samples) < 2:
+        return v0
+    t1, v1 = samples[1]
+    return v0 + (v1 - v0)*(t - t0)/(t1 - t0)
+
+
+class TrendEngine:
+    """Incremental trends of the observations."""
+
+    def __init__(self, pressure_window=3*3600, temp_window=3*3600, steady=0.1):
+        self.pressure_window = pressure_window
+        self.temp_window = temp_window
+        self.steady = steady      # mbar per half window counted as "steady"
+        self.press = deque()      # (t, p) over the full pressure window.
+        self.press_half = deque()  # (t, p) over the second half of the pressure window.
+        self.temps = deque()      # (t, T) over the temperature window.
+        self.t_ref = None         # Time origin for the temperature sums, to keep precision.
+        self.sums = [0., 0., 0., 0., 0.]  # n, sum x, sum y, sum xx, sum xy
+        self.tendency = None      # Pressure change over the window, mbar.
+        self.tendency_code = None
+        self.temp_rate = None     # C per hour.
+        self.dew_point = None
+
+    def add(self, t, temp=None, pressure=None, humidity=None):
+        """Add a sample at time t (seconds). Pressure in mbar, temperature in C, humidity in %."""
+        if pressure is not None and np.isfinite(pressure):
+            self.add_pressure(t, pressure)
+        if temp is not None and np.isfinite(temp):
+            self.add_temp(t, temp)
+            if humidity is not None and np.isfinite(humidity):
+                self.dew_point = float(dew_point(temp, humidity))
+
+    def add_pressure(self, t, p):
+        """Slide the pressure windows and update the tendency. Each window keeps the newest sample
+        before its start as the anchor, and the pressure at the start is interpolated, so the
+        tendency is over exactly the window even when the samples come at irregular times."""
+        self.press.append((t, p))
+        self.press_half.append((t, p))
+        slide(self.press, t - self.pressure_window)
+        slide(self.press_half, t - self.pressure_window/2)
+        if self.press[0][0] > t - self.pressure_window:
+            self.tendency = None      # Not enough history yet.
+            self.tendency_code = None
+            return
+        p_old = interpolate(self.press, t - self.pressure_window)
+        p_mid = interpolate(self.press_half, t - self.pressure_window/2)
+        self.tendency = p - p_old
+        self.tendency_code = wmo_tendency(p_mid - p_old, p - p_mid, self.steady)
+
+    def add_temp(self, t, temp):
+        """Slide the temperature window and update the least squares slope."""
+        if self.t_ref is None or t - self.t_ref > 10*24*3600:
+            self.rebase(t)
+        self.temps.append((t, temp))
+        self.accumulate(t - self.t_ref, temp, 1)
+        while t - self.temps[0][0] > self.temp_window:
+            t_old, temp_old = self.temps.popleft()
+            self.accumulate(t_old - self.t_ref, temp_old, -1)
+        n, sx, sy, sxx, sxy = self.sums
+        denominator = n*sxx - sx*sx
+        if n < 3 or denominator <= 0:
+            self.temp_rate = None
+        else:
+            self.temp_rate = (n*sxy - sx*sy)/denominator
+
+    def rebase(self, t):
+        """Move the time origin to t and recompute the sums, so they do not lose precision over
+        months of adding and removing. Only happens every 10 days."""
+        self.t_ref = t
+        self.sums = [0., 0., 0., 0., 0.]
+        for t_old, temp_old in self.temps:
+            self.accumulate(t_old - self.t_ref, temp_old, 1)
+
+    def accumulate(self, x, y, sign):
+        """Add (sign=1) or remove (sign=-1) a point from the running sums. x in seconds."""
+        x = x/3600.    # Hours, so the slope comes out in C/h.
+        self.sums[0] += sign
+        self.sums[1] += sign*x
+        self.sums[2] += sign*y
+        self.sums[3] += sign*x*x
+        self.sums[4] += sign*x*y
+
+    def seed(self, history):
+        """Seed the engine from a structured array with 't', 'temp', 'pressure' (Pa) and 'humidity'."""
+        for row in history:
+            self.add(float(row['t']), float(row['temp']), float(row['pressure'])/100., float(row['humidity']))
+
+    def tendency_label(self):
+        """Short text like "rising" for the pressure tendency."""
+        if self.tendency_code is None:
+            return ""
+        if self.tendency_code in (1, 2, 3) or (self.tendency_code == 0 and self.tendency >= self.steady):
+            return "rising"
+        if self.tendency_code in (6, 7, 8) or (self.tendency_code == 5 and self.tendency <= -self.steady):
+            return "falling"
+        return "steady"
+
+    def tendency_arrow(self):
+        """Arrow for the pressure tendency."""
+        return {"rising": "↗", "falling": "↘", "steady": "→"}.get(self.tendency_label(), "")
+
+    def summary(self):
+        """One line of text with all the trends we have."""
+        parts = []
+        if self.tendency is not None:
+            parts.append("Pressure {} {:+.1f} mbar/3h ({})".format(self.tendency_label(), self.tendency,
+                                                                 WMO_TENDENCY[self.tendency_code]))
+        if self.temp_rate is not None:
+            parts.append("Temp {:+.1f} C/h".format(self.temp_rate))
+        if self.dew_point is not None:
+            parts.append("Dew point {:.1f} C".format(self.dew_point))
+        return "   ".join(parts)
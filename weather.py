@@ -2,9 +2,9 @@
 #
 from datetime import datetime
 from dateutil import tz
-import requests
+import io
+import asyncio
 # import zmq
-import re
 import json
 #
 # Weather API: https://api.weather.gov
@@ -25,6 +25,21 @@ except:
 
 import signal
 import qt_clock_rc
+from history import ObservationHistory
+from trends import TrendEngine
+from chart import QHistoryChart
+from griddata import get_grid_data, parse_grid_data
+from hourly import QHourlyStrip
+from models import Forecast, Observation
+import colors
+import fetch
+import metrics
+import tracing
+import timesource
+import fetchproc
+import aio
+import sensors
+import weathericons
 
 class QWeatherInfoIcon(QPushButton):
     """Small helper class for one day weather icon with temperature."""
@@ -60,27 +75,26 @@ class QWeatherInfoIcon(QPushButton):
         self.label.setText(new)
 
     def set_weather_icon(self, url=None):
-        """Get the weather icon raw data from the url"""
+        """Show the local icon for the weather.gov icon url."""
 
+        if url is not None:
+            metrics.cache("icons", url == self.pix_url)
         if url is not None and url != self.pix_url:
-            req = requests.get(url)
-            icon = QPixmap()
-            icon.loadFromData(req.content)
-            self.pix.setPixmap(icon)
+            icon = weathericons.resolve(url)
+            self.pix.setPixmap(weathericons.pixmap(icon.file, self.pix.width()))
+            self.pix.setToolTip(icon.description)
             self.pix_url = url
 
-    def set_temperature(self, temp, unit="C"):
-        """Set the expected temperature."""
-        if unit == "F":
-            temp = (temp - 32) * 5./9.
+    def set_temperature(self, temp):
+        """Set the expected temperature, in C."""
         self.temp.setText(u"{:4.1f} C".format(temp))
         QWeather.set_temp_color(self.temp, temp, False, False)
 
-    def set_weather_from_dict(self, dat):
-        """Set the weather icon from the dat info."""
-        self.set_day_label(dat['name'])
-        self.set_weather_icon(dat['icon'])
-        self.set_temperature(dat['temperature'], unit=dat['temperatureUnit'])
+    def set_weather_from_period(self, period):
+        """Set the weather icon from a models.ForecastPeriod."""
+        self.set_day_label(period.name)
+        self.set_weather_icon(period.icon)
+        self.set_temperature(period.temperature)
 
     @Slot()
     def click(self):
@@ -130,6 +144,10 @@ class QTempMiniPanel:
         self.pressure.setGeometry(QRect(pos[0]+70, pos[1]+60, 261, 31))
         self.pressure.setStyleSheet(u"color: rgba(40,40,40,100)")
         self.pressure.setScaledContents(True)
+        self.trend = QLabel(self.parent)
+        self.trend.setObjectName(u"trend")
+        self.trend.setText(u"")
+        self.trend.setGeometry(QRect(pos[0], pos[1]+91, 331, 16))
 
     @Slot()
     def update(self):
@@ -140,9 +158,9 @@ class QTempMiniPanel:
 
         try:
             if "inside_temp" in self.weather.temp_data and "inside_humidity" in self.weather.temp_data:
-                self.inside_temp.setText(f"{self.weather.temp_data['inside_temp']:5.2f} C  {'inside_humidity':5.1f} %")
-                QWeather.set_temp_color(self.inside_temp, self.weather.temp_data['inside_temp'], True,
-                                    not self.weather.temp_data_valid)
+                self.inside_temp.setText(f"{self.weather.temp_data['inside_temp']:5.2f} C  "
+                                         f"{self.weather.temp_data['inside_humidity']:5.1f} %")
+                QWeather.set_temp_color(self.inside_temp, self.weather.temp_data['inside_temp'], True, False)
             else:
                 QWeather.set_temp_color(self.inside_temp, -999., True, True)
 
@@ -150,10 +168,25 @@ class QTempMiniPanel:
                 self.outside_temp.setText(f"{self.weather.temp_data['outside_temp']:5.2f} C  {self.weather.temp_data['outside_humidity']:5.1f} %")
                 QWeather.set_temp_color(self.outside_temp, self.weather.temp_data['outside_temp'], False,
                                     not self.weather.temp_data_valid)
-                self.pressure.setText(f"{self.weather.temp_data['outside_pressure']/100:7.2f} mbar")
+            else:
+                QWeather.set_temp_color(self.outside_temp, -999., False, True)
+
+            if "outside_pressure" in self.weather.temp_data:
+                self.pressure.setText(f"{self.weather.temp_data['outside_pressure']/100:7.2f} mbar "
+                                      f"{self.weather.trends.tendency_arrow()}")
                 QWeather.set_pressure_color(self.pressure, self.weather.temp_data['outside_pressure']/100, self.weather.temp_data_valid)
             else:
-                QWeather.set_temp_color(self.outside_temp, self.weather.temp_data['outside_temp'], False, True)
+                QWeather.set_pressure_color(self.pressure, -999., False)
+
+            trends = self.weather.trends
+            text = ""
+            if trends.tendency is not None:
+                text += f"{trends.tendency:+.1f} mbar/3h  "
+            if trends.temp_rate is not None:
+                text += f"{trends.temp_rate:+.1f} C/h  "
+            if trends.dew_point is not None:
+                text += f"dew point {trends.dew_point:.1f} C"
+            self.trend.setText(text)
 
         except Exception as e:
             print("Exception while updating minipanel.")
@@ -161,42 +194,12 @@ class QTempMiniPanel:
 class QWeatherIcon(QSvgWidget):
     """A simple icon for indicating the weather."""
 
-    WEATHER_ICONS = {
-        "skc": ("sunny.svg", "Fair/clear"),
-        "few": ("lightcloud.svg", "A few clouds"),
-        "sct": ("lightcloud.svg", "Partly cloudy"),
-        "bkn": ("cloud.svg", "Mostly cloudy"),
-        "ovc": ("cloud.svg", "Overcast"),
-        "wind_skc": ("wind.svg", "Fair/clear and windy"),
-        "wind_few": ("wind.svg", "A few clouds and windy"),
-        "wind_sct": ("windcloud.svg", "Partly cloudy and windy"),
-        "wind_bkn": ("windcloud.svg", "Mostly cloudy and windy"),
-        "wind_ovc": ("windcloud.svg", "Overcast and windy"),
-        "snow": ("snow.svg", "Snow"),
-        "rain_snow": ("snow.svg", "Rain/snow"),
-        "rain_sleet": ("snow.svg", "Rain/sleet"),
-        "snow_sleet": ("rainsnow.svg", "Snow/sleet"),
-        "fzra": ("rainsnow.svg", "Freezing rain"),
-        "rain_fzra": ("rainsnow.svg", "Rain/freezing rain"),
-        "snow_fzra": ("rainsnow.svg", "Freezing rain/snow"),
-        "sleet": ("rainsnow.svg", "Sleet"),
-        "rain": ("rain.svg", "Rain"),
-        "rain_showers": ("rain.svg", "Rain showers (high cloud cover)"),
-        "rain_showers_hi": ("rain.svg", "Rain showers (low cloud cover)"),
-        "tsra": ("thunder.svg", "Thunderstorm (high cloud cover)"),
-        "tsra_sct": ("thunder.svg", "Thunderstorm (medium cloud cover)"),
-        "tsra_hi": ("thunder.svg", "Thunderstorm (low cloud cover)"),
-        "tornado": ("unknown.svg", "Tornado"),
-        "hurricane": ("unknown.svg", "Hurricane conditions"),
-        "tropical_storm": ("unknown.svg", "Tropical storm conditions"),
-        "dust": ("unknown.svg", "Dust"),
-        "smoke": ("unknown.svg", "Smoke"),
-        "haze": ("haze.svg", "Haze"),
-        "hot": ("hot.svg", "Hot"),
-        "cold": ("cold.svg", "Cold"),
-        "blizzard": ("blizzard.svg", "Blizzard"),
-        "fog": ("fog.svg", "Fog/mist")
-    }
+    WEATHER_ICONS = weathericons.WEATHER_ICONS
+
+    @classmethod
+    def icon_file(cls, icon_url):
+        """Return the local icon file for a weather.gov icon_url."""
+        return weathericons.resolve(icon_url).file
 
     def __init__(self, pos, qweather, parent=None):
         super(QWeatherIcon, self).__init__(parent)
@@ -204,30 +207,26 @@ class QWeatherIcon(QSvgWidget):
         self.weather = qweather
         self.setGeometry(pos[0], pos[1], 100, 100)
         self.setStyleSheet("background-color: transparent;")
+        self.icon_file_shown = None
 
     @Slot()
     def update(self):
         """Update the icon to reflect current conditions."""
         if self.weather is not None and self.weather.fc is not None:
-            condition = self.weather.fc['periods'][0]['shortForecast']
-            icon_url = self.weather.fc['periods'][0]['icon']
-            # icon_url is something like:
+            condition = self.weather.fc.periods[0].short_forecast
+            # The icon url is something like:
             # "https://api.weather.gov/icons/land/day/sct?size=medium"
-            match = re.match("https://api\.weather\.gov/icons/(.*)/(.*)/([a-z_]*).*", icon_url)
+            icon = weathericons.resolve(self.weather.fc.periods[0].icon)
             if self.weather.debug > 0:
-                print(f"{datetime.now()} - Update icon for: '{condition}'  url: {icon_url}  match: {match.group(3)}")
-            if not match or not match.group(3) in self.WEATHER_ICONS:
-                print("Icon does not exist for match {} condition: {}".format(match.group(3), condition))
-                icon_file = "icons/unknown.svg"
-            else:
-                # TODO: Refine this for night/day icons.
-                icon_name = self.WEATHER_ICONS[match.group(3)][0]
-                if self.weather.debug > 0:
-                    print(f"Icon name: {icon_name}")
-                    print(f"Icon match {match.group(3)}  = name: {icon_name}")
-                icon_file = "icons/" + icon_name
-            self.load(icon_file)
-            self.resize(100, 100)
+                print(f"{datetime.now()} - Update icon for: '{condition}'  url: {self.weather.fc.periods[0].icon}  "
+                      f"icon: {icon.file} ({icon.description})")
+            if icon.condition not in self.WEATHER_ICONS:
+                print("Icon does not exist for {} condition: {}".format(icon.condition, condition))
+            metrics.cache("icons", icon.file == self.icon_file_shown)
+            if icon.file != self.icon_file_shown:
+                self.load(icon.file)
+                self.resize(100, 100)
+                self.icon_file_shown = icon.file
         else:
             print("ERROR - QWeatherIcon - weather not initialized.")
 
@@ -246,6 +245,7 @@ class QWeather(QWidget, QObject):
 
     # Signals we emit.
     temp_updated = Signal()
+    sensors_updated = Signal()    # New inside or closet readings, see sensors.py.
     weather_updated = Signal()
 
     def __init__(self, parent=None, debug=0):
@@ -263,6 +263,12 @@ class QWeather(QWidget, QObject):
         self.n_updates = 1
         self.temp_data = {}
         self.temp_data_valid = False
+        self.history = ObservationHistory(debug=debug)
+        if QCoreApplication.instance() is not None:
+            QCoreApplication.instance().aboutToQuit.connect(self.history.close)
+        self.trends = TrendEngine()
+        now = timesource.time()
+        self.trends.seed(self.history.range(now - max(self.trends.pressure_window, self.trends.temp_window), now))
 
         self.w_update_interval = 60*60  # Once per hour.
         self.w_update = 3
@@ -277,9 +283,15 @@ class QWeather(QWidget, QObject):
             "Pragma": "no-cache"
         }
 
+        self.Weather_gov_url = fetch.upstream_url(QWeather.Weather_gov_url)
+        self.points_cache = {}   # url -> (time, json) of the points and the observation stations lookups.
+        self.points_max_age = 24*60*60
+
         self.time_zone = tz.gettz('America/New_York')
-        self.fc = None   # Stores the dict of the weather forecast.
+        self.fc = None   # Stores the weather forecast as a models.Forecast
         self.fc_time = None  # Stores the forecast time
+        self.grid = None     # Stores the hourly arrays of the forecastGridData, for the hourly strip.
+        self.fc_hourly = None  # Stores the hourly forecast as a models.Forecast
 
         # self.zmq_context = zmq.Context()
         # self.zmq_socket = self.zmq_context.socket(zmq.REQ)
@@ -290,7 +302,7 @@ class QWeather(QWidget, QObject):
 
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update)
-        self.timer.start(1000)
+        self.timer.start(timesource.interval(1000))
 
         # Setup the UI
 
@@ -340,6 +352,11 @@ class QWeather(QWidget, QObject):
         self.closet_temp.setStyleSheet(u"color: rgba(40,40,40,100)")
         self.closet_temp.setScaledContents(True)
 
+        self.trend_text = QLabel(self.parent)
+        self.trend_text.setObjectName(u"trend")
+        self.trend_text.setGeometry(QRect(10, 95, 780, 18))
+        self.trend_text.setText(u"")
+
         self.weather_forecast_time = QLabel(self.parent)
         self.weather_forecast_time.setObjectName(u"forecast_time")
         self.weather_forecast_time.setText(u"Forecast: never")
@@ -360,17 +377,32 @@ class QWeather(QWidget, QObject):
         self.prev_button.setGeometry(QRect(2-5, 150, 10, 120))
         self.prev_button.clicked.connect(self.shift_weather_icons_left)
 
+        self.hourly_strip = QHourlyStrip((16, 150), (768, 120), parent=self.parent, debug=self.debug)
+        self.hourly_strip.hide()
+
+        self.hourly_button = QPushButton(self.parent)
+        self.hourly_button.setObjectName("chartbutton")
+        self.hourly_button.setText("Hourly")
+        self.hourly_button.setCheckable(True)
+        self.hourly_button.setGeometry(QRect(800-10-70, 118, 70, 22))
+        self.hourly_button.toggled.connect(self.show_hourly)
+
         self.weather_text = QTextEdit(self.parent)
         self.weather_text.setObjectName("weather_text")
-        self.weather_text.setGeometry(QRect(5, 300, 800-10, 480-20-300))
+        self.weather_text.setGeometry(QRect(5, 300, 800-10-325, 480-20-300))
         self.weather_text.setReadOnly(True)
         self.weather_text.insertPlainText("This is a description of the weather for the day that"
                                           "was chosen by clicking on the icon above.")
 
-        self.observation_json = None
+        self.history_chart = QHistoryChart(self.history, (800-5-315, 300), (315, 480-20-300), parent=self.parent,
+                                           debug=self.debug)
+
+        self.observation = None   # The latest models.Observation
 
         # Signal Slot connections.
         self.temp_updated.connect(self.update_temperature_display)
+        self.sensors_updated.connect(self.update_temperature_display)
+        self.temp_updated.connect(self.history_chart.new_samples)
         self.weather_updated.connect(self.update_weather_info)
 
         if self.debug:
@@ -381,16 +413,47 @@ class QWeather(QWidget, QObject):
         url = self.Weather_gov_url + f"{point[0]:.4f},{point[1]:.4f}"
         if self.debug > 2:
             print(f"Top level url: {url}")
-        js = requests.get(url, headers=self.request_headers).json()
+        js = self.get_cached_json(url, "points")
         if js is None or 'properties' not in js:
             print("Did not get top level weather request.")
             return None
 
         return js
 
+    def get_cached_json(self, url, name):
+        """Get the json from url, or from the points_cache if it is younger than points_max_age.
+        This is for the lookups that (almost) never change, name is the cache name for the metrics."""
+        js = self.cached_json(url, name)
+        if js is None:
+            js = fetch.get(url, headers=self.request_headers).json()
+            self.cache_json(url, js)
+        return js
+
+    async def get_cached_json_async(self, url, name):
+        """get_cached_json() as a coroutine, for aio.py."""
+        js = self.cached_json(url, name)
+        if js is None:
+            js = await aio.client.get_json(url, headers=self.request_headers)
+            self.cache_json(url, js)
+        return js
+
+    def cached_json(self, url, name):
+        """The json of url from the points_cache, or None when it is not there or too old."""
+        cached = self.points_cache.get(url)
+        if cached is not None and timesource.time() - cached[0] < self.points_max_age:
+            metrics.cache(name, True)
+            return cached[1]
+        metrics.cache(name, False)
+        return None
+
+    def cache_json(self, url, js):
+        if isinstance(js, dict) and ('properties' in js or 'features' in js):
+            self.points_cache[url] = (timesource.time(), js)
+
     def get_weather_forecast(self, point=None, top_level_json=None, kind=None):
         """Get the forecast information from weather.gov as a json. No parsing.
-        The kind of forecasts are: kind = {"forecast", "hourly", "detailed_temps"} """
+        The kind of forecasts are: kind = {"forecast", "hourly", "detailed_temps", "current"}
+        kind = "grid" returns the forecastGridData parsed into a griddata.GridData object."""
         if top_level_json is None:
             if point is not None:
                 top_level_json = self.get_weather_json(point)
@@ -420,7 +483,7 @@ class QWeather(QWidget, QObject):
                 print(f"headers: {self.request_headers}")
 
             try:
-                js = requests.get(url, params=payload, headers=self.request_headers).json()
+                js = fetch.get(url, params=payload, headers=self.request_headers).json()
             except Exception as e:
                 print("Could not get the weather json:", datetime.now())
                 print(e)
@@ -433,24 +496,87 @@ class QWeather(QWidget, QObject):
             else:
                 return js
 
+        elif kind == "grid":
+            # Streamed and parsed straight into hourly arrays, see griddata.py
+            try:
+                return get_grid_data(top_level_json['properties']['forecastGridData'], headers=self.request_headers,
+                                     measure=self.debug > 1, debug=self.debug)
+            except Exception as e:
+                print("Could not get the grid data:", datetime.now())
+                print(e)
+                return None
+
         elif kind == "current" or kind == "ObservationData":
             if self.debug > 2:
                 print("Getting the current weather")
             station_url = top_level_json['properties']['observationStations']
-            station_data = requests.get(station_url).json()
+            station_data = self.get_cached_json(station_url, "stations")
             observation_station_url = station_data['features'][0]['id'] + '/observations/latest'
-            latest_observation = requests.get(observation_station_url).json()
+            latest_observation = fetch.get(observation_station_url).json()
 
             return latest_observation
 
         else:
             print("I do not know about the kind of forecast kind=", kind)
 
+    def get_parsed(self, kind):
+        """The forecast (kind "forecast" or "hourly") as a models.Forecast, or the latest observation
+        (kind "current") as a models.Observation. None when it could not be had. With the fetch
+        process of fetchproc.py, it is fetched and parsed there, only the small lookups are done here."""
+        if fetchproc.worker is None:
+            js = self.get_weather_forecast(self.geo_point, kind=kind)
+            if js is None:
+                return None
+            return Observation(js['properties']) if kind == "current" else Forecast(js['properties'])
+
+        top_level_json = self.get_weather_json(self.geo_point)
+        if top_level_json is None:
+            return None
+        if kind == "current":
+            station_data = self.get_cached_json(top_level_json['properties']['observationStations'], "stations")
+            return fetchproc.worker.call("observation", station_data['features'][0]['id'] + '/observations/latest',
+                                         self.request_headers)
+        url = top_level_json['properties']['forecastHourly' if kind == "hourly" else 'forecast']
+        return fetchproc.worker.call("forecast", url, {"units": "si"}, self.request_headers)
+
+    async def get_parsed_async(self, kind):
+        """get_parsed() as a coroutine, for aio.py. Also kind "grid" for the griddata.GridData.
+        With the fetch process, the coroutine waits for the worker instead of parsing here."""
+        url = self.Weather_gov_url + f"{self.geo_point[0]:.4f},{self.geo_point[1]:.4f}"
+        top_level_json = await self.get_cached_json_async(url, "points")
+        if 'properties' not in top_level_json:
+            print("Did not get top level weather request.")
+            return None
+        props = top_level_json['properties']
+        if kind == "current":
+            station_data = await self.get_cached_json_async(props['observationStations'], "stations")
+            url = station_data['features'][0]['id'] + '/observations/latest'
+            if fetchproc.worker is not None:
+                return await asyncio.wrap_future(fetchproc.worker.submit("observation", url, self.request_headers))
+            js = await aio.client.get_json(url, headers=self.request_headers)
+            return Observation(js['properties'])
+        if kind == "grid" and fetchproc.worker is not None:
+            return await asyncio.wrap_future(fetchproc.worker.submit("grid", props['forecastGridData'],
+                                                                     self.request_headers, 8*24))
+        if kind == "grid":
+            status, body = await aio.client.get(props['forecastGridData'], {"units": "si"}, self.request_headers)
+            if status >= 400:
+                raise IOError("HTTP {} for the grid data".format(status))
+            return await asyncio.to_thread(parse_grid_data, io.BytesIO(body))
+        url = props['forecastHourly' if kind == "hourly" else 'forecast']
+        if fetchproc.worker is not None:
+            return await asyncio.wrap_future(fetchproc.worker.submit("forecast", url, {"units": "si"},
+                                                                     self.request_headers))
+        js = await aio.client.get_json(url, {"units": "si"}, self.request_headers)
+        if 'properties' not in js:
+            print("Error getting weather information:", datetime.now())
+            return None
+        return Forecast(js['properties'])
+
     def update_weather_text(self):
         """Update the weather text area."""
-        text = self.fc['periods'][self.w_text_index]['name'] + ": <b>" + \
-               self.fc['periods'][self.w_text_index]['shortForecast']+"</b><br/>\n" + \
-               self.fc['periods'][self.w_text_index]['detailedForecast']
+        period = self.fc.periods[self.w_text_index]
+        text = period.name + ": <b>" + period.short_forecast + "</b><br/>\n" + period.detailed_forecast
         self.weather_text.clear()
 #        self.weather_text.insertPlainText(text)
         self.weather_text.insertHtml(text)
@@ -458,64 +584,126 @@ class QWeather(QWidget, QObject):
                                            self.geo_points_name[self.geo_point_i])
 
 
+    @tracing.traced("QWeather.update_weather")
     def update_weather(self):
         """Update the weather forecast from weather.gov """
         self.w_update -= 1
 
-        old_fc = self.fc
         if self.w_update <= 0:
             self.w_update = self.w_update_interval
-            new_fc = self.get_weather_forecast(self.geo_point, kind="forecast")
-            if new_fc is None:
-                if self.debug:
-                    print("Failed to get weather update.")
-                self.w_update = 360
+            if aio.loop is not None:
+                if not aio.running("forecast"):
+                    aio.spawn(self.update_weather_async(), "forecast")
                 return
-            else:
-                new_fc_time = datetime.fromisoformat(new_fc['properties']['updateTime']).astimezone(self.time_zone)
-                now = datetime.now().astimezone(self.time_zone)
-                new_fc_age = (now-new_fc_time).total_seconds()
-                if new_fc_age > 8*60*60:  # Stale forecast if older than 8 hours.
-                    # Do not change the text and do not emit an "updated"
-                    self.w_update = 36 # 0    # Try again in 3 minutes.
-                    self.geo_point_i += 1  # Get from another point nearby.
-                    if self.geo_point_i >= len(self.geo_points):
-                        self.geo_point_i = 0
-                    self.geo_point = self.geo_points[self.geo_point_i]
-                    if self.debug:
-                        print(f"Update failed. Trying next point nr {self.geo_point_i}")
-                    return
-
             try:
+                new_fc = self.get_parsed("forecast")
+            except Exception as e:
+                print("Could not parse the forecast.", e)
+                new_fc = None
+            if not self.forecast_usable(new_fc):
+                return
 
-                self.fc = new_fc['properties']
-                self.fc_time = datetime.fromisoformat(new_fc['properties']['updateTime']).astimezone(self.time_zone)
-                if self.debug > 1:
-                    print("Emit: weather_updated")
-                self.weather_updated.emit()
+            try:
+                new_hourly = self.get_parsed("hourly")
+                if new_hourly is not None:
+                    self.fc_hourly = new_hourly
             except Exception as e:
-                print("Did not get the proper weather.", e)
-                self.fc = old_fc
-                self.fc['periods'][0]['name'] += "NOT UPDATED"
+                print("Could not parse the hourly forecast.", e)
 
+            new_grid = self.get_weather_forecast(self.geo_point, kind="grid")
+            if new_grid is not None:
+                self.grid = new_grid
+
+            self.set_forecast(new_fc)
+
+    async def update_weather_async(self):
+        """The forecast part of update_weather() as a coroutine, for aio.py. The hourly forecast and
+        the grid data are fetched concurrently."""
+        try:
+            new_fc = await self.get_parsed_async("forecast")
+        except Exception as e:
+            print("Could not parse the forecast.", e)
+            new_fc = None
+        if not self.forecast_usable(new_fc):
+            return
+        new_hourly, new_grid = await asyncio.gather(self.get_parsed_async("hourly"), self.get_parsed_async("grid"),
+                                                    return_exceptions=True)
+        if isinstance(new_hourly, Exception):
+            print("Could not parse the hourly forecast.", new_hourly)
+        elif new_hourly is not None:
+            self.fc_hourly = new_hourly
+        if isinstance(new_grid, Exception):
+            print("Could not get the grid data:", new_grid)
+        elif new_grid is not None:
+            self.grid = new_grid
+        self.set_forecast(new_fc)
+
+    def forecast_usable(self, new_fc):
+        """Check a new forecast. If there is none, or it is stale, set when to try again and return False."""
+        if new_fc is None:
+            if self.debug:
+                print("Failed to get weather update.")
+            self.w_update = 360
+            return False
+        new_fc_time = new_fc.update_time.astimezone(self.time_zone)
+        now = timesource.now().astimezone(self.time_zone)
+        new_fc_age = (now-new_fc_time).total_seconds()
+        if new_fc_age > 8*60*60:  # Stale forecast if older than 8 hours.
+            # Do not change the text and do not emit an "updated"
+            self.w_update = 36 # 0    # Try again in 3 minutes.
+            self.geo_point_i += 1  # Get from another point nearby.
+            if self.geo_point_i >= len(self.geo_points):
+                self.geo_point_i = 0
+            self.geo_point = self.geo_points[self.geo_point_i]
+            if self.debug:
+                print(f"Update failed. Trying next point nr {self.geo_point_i}")
+            return False
+        return True
+
+    def set_forecast(self, new_fc):
+        """Show the new forecast."""
+        old_fc = self.fc
+        try:
+
+            self.fc = new_fc
+            self.fc_time = new_fc.update_time.astimezone(self.time_zone)
+            if self.debug > 1:
+                print("Emit: weather_updated")
+            self.weather_updated.emit()
+        except Exception as e:
+            print("Did not get the proper weather.", e)
+            self.fc = old_fc
+            self.fc.periods[0].name += "NOT UPDATED"
+
+    @tracing.traced("QWeather.update_weather_icons")
     def update_weather_icons(self):
         """Update the weather icon contents. (slow!)"""
         for i in range(len(self.weather_icons)):
             try:
-                self.weather_icons[i].set_weather_from_dict(self.fc['periods'][i + self.w_period_offset])
+                self.weather_icons[i].set_weather_from_period(self.fc.periods[i + self.w_period_offset])
             except Exception as e:
                 print("===== ERROR =====")
                 print("Updating weather icons, i=", i, " w_period_offset = ", self.w_period_offset)
-                print("len(self.fc[periods])=", len(self.fc['periods']))
+                print("len(self.fc.periods)=", len(self.fc.periods))
                 print(e)
 
 
 
+    def update_hourly_strip(self):
+        """Update the hourly strip from the hourly forecast."""
+        if self.fc_hourly is None:
+            return
+        periods = self.fc_hourly.periods
+        self.hourly_strip.set_periods(periods, [QWeatherIcon.icon_file(p.icon) for p in periods], self.grid)
+
     def draw_weather_icons(self):
         """Draw the weather icons that should be visible in the correct location. """
         for i in range(len(self.weather_icons)):
             self.weather_icons[i].hide()
 
+        if self.hourly_button.isChecked():
+            return
+
         for i in range(8):
             self.weather_icons[i+self.w_period_offset].setGeometry(16+i*96, 150, 96, 120)
             self.weather_icons[i+self.w_period_offset].show()
@@ -526,15 +714,26 @@ class QWeather(QWidget, QObject):
         if self.debug > 1:
             print(" -- update_weather_info() ")
         self.update_weather_icons()
+        self.update_hourly_strip()
         self.draw_weather_icons()
         self.update_weather_text()
 
+    @Slot(bool)
+    def show_hourly(self, hourly):
+        """Switch between the day/night icons and the hourly strip."""
+        self.hourly_strip.setVisible(hourly)
+        if self.fc is not None:
+            self.draw_weather_icons()
+
 
     @Slot()
     def shift_weather_icons_right(self):
         """Called for shifting the days of the icons right."""
-        # print("Shift: {} < {}".format(self.w_period_offset, len(self.fc['periods'])-8))
-        if self.w_period_offset < len(self.fc['periods'])-8:
+        if self.hourly_button.isChecked():
+            self.hourly_strip.scroll_page(1)
+            return
+        # print("Shift: {} < {}".format(self.w_period_offset, len(self.fc.periods)-8))
+        if self.w_period_offset < len(self.fc.periods)-8:
             self.w_period_offset += 1
             self.draw_weather_icons()
             if self.w_text_index < self.w_period_offset:
@@ -544,7 +743,10 @@ class QWeather(QWidget, QObject):
     @Slot()
     def shift_weather_icons_left(self):
         """Called for shifting the days of the icons left."""
-        #  print("Shift: {} < {}".format(self.w_period_offset, len(self.fc['periods'])-8))
+        if self.hourly_button.isChecked():
+            self.hourly_strip.scroll_page(-1)
+            return
+        #  print("Shift: {} < {}".format(self.w_period_offset, len(self.fc.periods)-8))
         if self.w_period_offset > 0:
             self.w_period_offset -= 1
             self.draw_weather_icons()
@@ -564,8 +766,10 @@ class QWeather(QWidget, QObject):
         """Update all the weather info, if on the correct tick."""
         self.update_weather()
         self.update_temperatures()
+        self.update_sensors()
 
     @Slot()
+    @tracing.traced("QWeather.update_temperatures")
     def update_temperatures(self):
         """Get a new set of temperatures from bbb1 using zmq."""
         if self.debug > 1:
@@ -573,26 +777,17 @@ class QWeather(QWidget, QObject):
 
         self.n_updates = self.n_updates - 1
 
-        def smart_float(d):
-            try:
-                r = float(d)
-            except:
-                r = d.replace('"', '')
-            return r
-
         if self.n_updates <= 0:
-            try:
-                self.observation_json = self.get_weather_forecast(point=self.geo_point, kind="current")
-                self.temp_data['outside_temp'] = smart_float(self.observation_json['properties']['temperature']['value'])
-                self.temp_data['outside_pressure'] = smart_float(self.observation_json['properties']['seaLevelPressure']['value'])
-                self.temp_data['outside_humidity'] = smart_float(self.observation_json['properties']['relativeHumidity']['value'])
-                self.temp_data_valid = True
-                self.n_updates = self.temp_update_interval
-                self.temp_updated.emit()
-            except:
-                if self.debug > 1:
-                    print("Failed to get weather forecast.")
-                self.temp_data_valid = False
+            if aio.loop is not None:
+                if not aio.running("observation"):
+                    aio.spawn(self.update_observation_async(), "observation")
+            else:
+                try:
+                    self.set_observation(self.get_parsed("current"))
+                except:
+                    if self.debug > 1:
+                        print("Failed to get weather forecast.")
+                    self.temp_data_valid = False
 
         # if self.n_updates <= 1:  # We take two updates to complete this, so start at 1
         #
@@ -626,19 +821,65 @@ class QWeather(QWidget, QObject):
 
 
 
-    @Slot()
+    def update_sensors(self):
+        """Take the mean of the new readings of the local sensors, and show them if they changed."""
+        if sensors.listener is None:
+            return
+        new, stale = sensors.listener.take()
+        changed = False
+        for key, value in new.items():
+            name = sensors.TEMP_DATA_KEYS.get(key)
+            if name is not None and self.temp_data.get(name) != value:
+                self.temp_data[name] = value
+                changed = True
+        for key in stale:
+            name = sensors.TEMP_DATA_KEYS.get(key)
+            if name in self.temp_data:
+                del self.temp_data[name]
+                changed = True
+        if changed:
+            self.sensors_updated.emit()
+
+    async def update_observation_async(self):
+        """The observation part of update_temperatures() as a coroutine, for aio.py."""
+        try:
+            self.set_observation(await self.get_parsed_async("current"))
+        except Exception:
+            if self.debug > 1:
+                print("Failed to get weather forecast.")
+            self.temp_data_valid = False
+
+    def set_observation(self, obs):
+        """Show the new observation, and add it to the history. weather.gov often sends a null for
+        a quantity; then the previous value is kept, and shown as not valid."""
+        self.observation = obs
+        values = {'outside_temp': obs.temperature, 'outside_pressure': obs.pressure, 'outside_humidity': obs.humidity}
+        self.temp_data.update((key, value) for key, value in values.items() if value is not None)
+        self.temp_data_valid = None not in values.values()
+        obs_time = obs.timestamp.timestamp()
+        if self.history.append(obs_time, temp=obs.temperature, pressure=obs.pressure, humidity=obs.humidity):
+            self.trends.add(obs_time, obs.temperature, obs.pressure/100 if obs.pressure is not None else None,
+                            obs.humidity)
+        self.n_updates = self.temp_update_interval
+        self.temp_updated.emit()
+
     def update_temperature_display(self):
         """Update the temperature display."""
         if self.debug > 1:
             print("update_temperature_display(). Data is valid = ", self.temp_data_valid)
 
-        this_data_valid = self.temp_data_valid
+        # The inside and closet readings are removed from temp_data when they go stale, see sensors.py.
         if "inside_temp" in self.temp_data and "inside_humidity" in self.temp_data:
             self.inside_temp_2.setText(f"{self.temp_data['inside_temp']:5.2f} C  {self.temp_data['inside_humidity']:5.1f} %")
-            self.set_temp_color(self.inside_temp_2, self.temp_data['inside_temp'], True, not this_data_valid)
+            self.set_temp_color(self.inside_temp_2, self.temp_data['inside_temp'], True, False)
         else:
-            this_data_valid = False
-            self.set_temp_color(self.inside_temp_2, -999., True, not this_data_valid)
+            self.set_temp_color(self.inside_temp_2, -999., True, True)
+
+        if "closet_temp" in self.temp_data and "closet_humidity" in self.temp_data:
+            self.closet_temp.setText(f"{self.temp_data['closet_temp']:5.2f} C  {self.temp_data['closet_humidity']:5.1f} %")
+            self.set_temp_color(self.closet_temp, self.temp_data['closet_temp'], True, False)
+        else:
+            self.set_temp_color(self.closet_temp, -999., True, True)
 
         this_data_valid = self.temp_data_valid
         if "outside_temp" in self.temp_data and "outside_humidity" in self.temp_data:
@@ -648,8 +889,6 @@ class QWeather(QWidget, QObject):
             this_data_valid = False
             self.set_temp_color(self.outside_temp_2, -999., False, not this_data_valid)
 
-        #self.closet_temp.setText("{:5.2f} C  {:5.1f} %".format(self.temp_data[10], self.temp_data[9]))
-        #self.set_temp_color(self.closet_temp, self.temp_data[10], True, not self.temp_data_valid)
 
         this_data_valid = self.temp_data_valid
         if "outside_pressure" in self.temp_data:
@@ -659,54 +898,20 @@ class QWeather(QWidget, QObject):
             this_data_valid = False
             self.set_pressure_color(self.pressure_3, -999., this_data_valid)
 
+        self.trend_text.setText(self.trends.summary())
+
         # self.pressure_3.setText("{:7.2f} mbar".format(self.temp_data[6]))
         # self.set_pressure_color(self.pressure_3, self.temp_data[6], self.temp_data_valid)
 
     @staticmethod
     def set_pressure_color(obj, press, valid = True):
         """Set the color of obj according to the pressure. """
-        pressures = (900., 950., 1000., 1020., 1040.)
-        colors = (0, 60, 120, 240, 300)
-        if valid:
-            if press < pressures[0]:
-                press = pressures[0] + 0.0001
-            if press > pressures[-1]:
-                press = pressures[-1] - 0.0001
-
-            i=0
-            while press > pressures[i]:
-                i += 1
-            hue = int(((press - pressures[i-1])/(pressures[i] - pressures[i-1]))*(colors[i]-colors[i-1]) +
-                      colors[i-1])
-            color = QColor.fromHsv(hue, 255, 120, 255)
-            obj.setStyleSheet("color: rgba({},{},{},255)".format(color.red(), color.green(), color.blue()))
-        else:
-            obj.setStyleSheet("color: rgba({},{},{},255)".format(100, 100, 100))
+        colors.set_pressure_color(obj, press, valid)
 
     @staticmethod
     def set_temp_color(obj, temp, inside=True, invalid=False):
         """Set the color of obj depending on the temperature displayed by obj."""
-        temps = (-15., 16., 28., 40.)
-        colors = (270, 145, 60, 0)
-
-        if inside:
-            temps = (12., 20., 25., 32.)
-
-        if invalid:
-            obj.setStyleSheet("color: rgba(100,100,100,100)")
-        else:
-            if temp < temps[0]:
-                temp = temps[0] + 0.0001
-            if temp > temps[-1]:
-                temp = temps[-1] - 0.0001
-
-            i = 0
-            while temp > temps[i]:
-                i += 1
-            hue = int(((temp - temps[i-1])/(temps[i] - temps[i-1]))*(colors[i] - colors[i-1]) + colors[i-1])
-            color = QColor.fromHsv(hue, 255, 150, 255)
-
-            obj.setStyleSheet("color: rgba({},{},{},255)".format(color.red(), color.green(), color.blue()))
+        colors.set_temp_color(obj, temp, inside, invalid)
 
 if __name__ == '__main__':
     import sys
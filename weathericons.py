@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+#
+# The local weather icons for the weather.gov icon URLs.
+#
+# A weather.gov icon URL looks like
+#
+#     https://api.weather.gov/icons/land/night/rain_showers,40/tsra,60?size=medium
+#
+# with the day or night, and one or two conditions, each with an optional intensity (the chance of
+# precipitation in %). resolve() maps the first condition, the day or night and the intensity to
+# one of the SVG files in icons/, with one precompiled regular expression, and memoizes the result
+# per URL, so the forecasts that come in every hour with the same URLs cost a dictionary lookup.
+# The clear and partly cloudy icons have a night version.
+#
+# pixmap() renders an icon file at a size once, and keeps it, so the forecast buttons show the
+# local icons instead of downloading the images of weather.gov.
+#
+import time
+from functools import lru_cache
+from collections import namedtuple
+import re
+
+from qtpy.QtGui import QPixmap, QPainter
+from qtpy.QtCore import Qt
+try:
+    from qtpy.QtSvg import QSvgRenderer
+except ImportError:
+    from qtpy.QtSvgWidgets import QSvgRenderer
+
+import metrics
+
+ICON_DIR = "icons/"
+UNKNOWN = "unknown.svg"
+
+# The path of an icon URL, also when it comes through fetch.BASE_URL or a fetcherd.py daemon.
+ICON_URL = re.compile(r"/icons/[^/]+/(day|night)/([a-z_]+)(?:,(\d+))?")
+
+WEATHER_ICONS = {
+    "skc": ("sunny.svg", "Fair/clear"),
+    "few": ("lightcloud.svg", "A few clouds"),
+    "sct": ("lightcloud.svg", "Partly cloudy"),
+    "bkn": ("cloud.svg", "Mostly cloudy"),
+    "ovc": ("cloud.svg", "Overcast"),
+    "wind_skc": ("wind.svg", "Fair/clear and windy"),
+    "wind_few": ("wind.svg", "A few clouds and windy"),
+    "wind_sct": ("windcloud.svg", "Partly cloudy and windy"),
+    "wind_bkn": ("windcloud.svg", "Mostly cloudy and windy"),
+    "wind_ovc": ("windcloud.svg", "Overcast and windy"),
+    "snow": ("snow.svg", "Snow"),
+    "rain_snow": ("snow.svg", "Rain/snow"),
+    "rain_sleet": ("snow.svg", "Rain/sleet"),
+    "snow_sleet": ("rainsnow.svg", "Snow/sleet"),
+    "fzra": ("rainsnow.svg", "Freezing rain"),
+    "rain_fzra": ("rainsnow.svg", "Rain/freezing rain"),
+    "snow_fzra": ("rainsnow.svg", "Freezing rain/snow"),
+    "sleet": ("rainsnow.svg", "Sleet"),
+    "rain": ("rain.svg", "Rain"),
+    "rain_showers": ("rain.svg", "Rain showers (high cloud cover)"),
+    "rain_showers_hi": ("rain.svg", "Rain showers (low cloud cover)"),
+    "tsra": ("thunder.svg", "Thunderstorm (high cloud cover)"),
+    "tsra_sct": ("thunder.svg", "Thunderstorm (medium cloud cover)"),
+    "tsra_hi": ("thunder.svg", "Thunderstorm (low cloud cover)"),
+    "tornado": ("unknown.svg", "Tornado"),
+    "hurricane": ("unknown.svg", "Hurricane conditions"),
+    "tropical_storm": ("unknown.svg", "Tropical storm conditions"),
+    "dust": ("unknown.svg", "Dust"),
+    "smoke": ("unknown.svg", "Smoke"),
+    "haze": ("haze.svg", "Haze"),
+    "hot": ("hot.svg", "Hot"),
+    "cold": ("cold.svg", "Cold"),
+    "blizzard": ("blizzard.svg", "Blizzard"),
+    "fog": ("fog.svg", "Fog/mist")
+}
+
+# The day icons that have a night version.
+NIGHT_ICONS = {
+    "sunny.svg": "clear_night.svg",
+    "lightcloud.svg": "cloud_night.svg",
+}
+
+Icon = namedtuple("Icon", ("file", "description", "condition", "night", "intensity"))
+
+
+def icon_for(condition, night=False, intensity=None):
+    """The Icon for a weather.gov condition code, at night or not, with the intensity in % or None."""
+    name, description = WEATHER_ICONS.get(condition, (UNKNOWN, "Unknown ({})".format(condition)))
+    if night:
+        name = NIGHT_ICONS.get(name, name)
+    if intensity is not None:
+        description += " {}%".format(intensity)
+    return Icon(ICON_DIR + name, description, condition, night, intensity)
+
+
+@lru_cache(maxsize=512)
+def resolve(url):
+    """The Icon for a weather.gov icon url. An url that is not understood gives the unknown icon."""
+    match = ICON_URL.search(url or "")
+    if match is None:
+        return Icon(ICON_DIR + UNKNOWN, "Unknown", None, False, None)
+    night, condition, intensity = match.groups()
+    return icon_for(condition, night == "night", int(intensity) if intensity is not None else None)
+
+
+@lru_cache(maxsize=64)
+def pixmap(file, size):
+    """The icon file rendered at size x size, made once."""
+    start = time.perf_counter()
+    pix = QPixmap(size, size)
+    pix.fill(Qt.transparent)
+    painter = QPainter(pix)
+    QSvgRenderer(file).render(painter)
+    painter.end()
+    metrics.observe(metrics.renders, "icon", time.perf_counter() - start)
+    return pix